@@ -0,0 +1,71 @@
+"""-----------------------------------------------------------------------------
+# Name:        import_time
+# Purpose:     Benchmarks the cost of importing flask_fedora_commons in a fresh
+#              interpreter so that startup regressions are caught.
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     MIT
+#----------------------------------------------------------------------------"""
+__author__ = "Jeremy Nelson"
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_time(module='flask_fedora_commons'):
+    """Function imports module in a fresh interpreter with -X importtime and
+    returns the cumulative microseconds for the module and for the heavy
+    modules it pulled in.
+
+    Args:
+        module(str): Module name, defaults to flask_fedora_commons
+
+    Returns:
+        dict: Cumulative import time in microseconds keyed by module name
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        cwd=PROJECT_ROOT,
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True)
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        if name in (module, 'rdflib', 'flask'):
+            timings[name] = int(cumulative)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmarks flask_fedora_commons import time')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='Exit non-zero if the median exceeds this')
+    args = parser.parse_args()
+    runs = [import_time() for _ in range(args.runs)]
+    median_ms = statistics.median(
+        run['flask_fedora_commons'] for run in runs) / 1000.0
+    print("flask_fedora_commons import: {:.1f} ms median of {} runs".format(
+        median_ms,
+        args.runs))
+    if any('rdflib' in run for run in runs):
+        print("REGRESSION: rdflib imported at module import time")
+        sys.exit(1)
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print("REGRESSION: import exceeds {} ms".format(args.max_ms))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""-----------------------------------------------------------------------------
+# Name:        sparql_builder
+# Purpose:     Micro-benchmarks the compiled SPARQL statement builder against
+#              the string.Template and build_prefixes path it replaced, for
+#              single statements and for batches.
+#
+# Author:      Jeremy Nelson
+#
+# Licence:     MIT
+#----------------------------------------------------------------------------"""
+__author__ = "Jeremy Nelson"
+
+import argparse
+import os
+import sys
+import timeit
+
+from string import Template
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from flask_fedora_commons import DEFAULT_NAMESPACES
+from flask_fedora_commons.sparql import insert_data
+
+SUBJECT = "http://localhost:8080/rest/works/{}"
+
+
+def legacy_prefixes(namespaces):
+    """Function rebuilds the PREFIX prologue by concatenation, as
+    build_prefixes did on every statement
+
+    Args:
+        namespaces(list): List of prefix, namespace uri tuples
+
+    Returns:
+        str
+    """
+    output = "PREFIX {}: <{}>\n".format(namespaces[0][0], namespaces[0][1])
+    for namespace in namespaces[1:]:
+        output += "PREFIX  {}: <{}>\n".format(namespace[0], namespace[1])
+    return output
+
+
+def legacy_insert(namespaces, subject, property_uri, value):
+    """Function renders one INSERT DATA update the way Repository.insert
+    did before the statement builder
+
+    Returns:
+        str
+    """
+    sparql_template = Template("""$prefix
+        INSERT DATA {
+             <$entity> $prop_uri $value_str ;
+        }""")
+    if value.startswith("http"):
+        value_str = "<{}>".format(value)
+    else:
+        value_str = '"{}"'.format(value)
+    return sparql_template.substitute(
+        prefix=legacy_prefixes(namespaces),
+        entity=subject,
+        prop_uri=property_uri,
+        value_str=value_str)
+
+
+def statements(count):
+    """Function returns count subject, property name, value tuples mixing
+    plain literals, literals needing escapes and URIs
+
+    Args:
+        count(int): Number of statements
+
+    Returns:
+        list
+    """
+    values = ['A most excellent work',
+              'The "Complete" Works\nSecond line',
+              'http://schema.org/Book']
+    return [(SUBJECT.format(number),
+             'schema:name',
+             values[number % len(values)])
+            for number in range(count)]
+
+
+def measure(function, repeat):
+    """Function returns the best of repeat timings of function in seconds
+
+    Args:
+        function(callable): Function to time
+        repeat(int): Number of timings
+
+    Returns:
+        float
+    """
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmarks SPARQL statement building')
+    parser.add_argument('--statements', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    rows = statements(args.statements)
+    namespaces = DEFAULT_NAMESPACES
+    results = [
+        ('legacy Template, one update per statement',
+         lambda: [legacy_insert(namespaces, *row) for row in rows]),
+        ('builder, one update per statement',
+         lambda: [insert_data(namespaces, [row]) for row in rows]),
+        ('builder, one batched update',
+         lambda: insert_data(namespaces, rows))]
+    baseline = None
+    for label, function in results:
+        seconds = measure(function, args.repeat)
+        if baseline is None:
+            baseline = seconds
+        print("{:<45} {:8.2f} us/statement {:6.1f}x".format(
+            label,
+            seconds * 1e6 / len(rows),
+            baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
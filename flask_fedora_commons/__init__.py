@@ -11,46 +11,80 @@ __author__ = "Jeremy Nelson"
 __license__ = 'MIT License'
 __copyright__ = '(c) 2013, 2014 by Jeremy Nelson'
 
+import functools
+import hashlib
 import json
-import rdflib
-import urllib
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
 
+from collections import OrderedDict
 from flask import current_app, render_template
-from string import Template
+
+from .cache import ExistenceCache, IdentifierIndex, normalize_statement
+from .cache import QueryCache, SingleFlight
+from .cache import statement_predicates
+from .compression import ACCEPT_ENCODING, compress_request, decode_response
+from .sparql import delete_insert, delete_where, insert_data, iri, prologue
+from .sparql import select_subjects, term
 
 try:
     from flask import _app_ctx_stack as stack
 except ImportError:
     from flask import _request_ctx_stack as stack
 
-BIBFRAME = rdflib.Namespace("http://bibframe.org/vocab/")
 FEDORA_BASE_URL = "http://localhost:8080"
-FEDORA_NS = rdflib.Namespace('http://fedora.info/definitions/v4/rest-api#')
-FEDORA_RELS_EXT = rdflib.Namespace(
-    'http://fedora.info/definitions/v4/rels-ext#')
-FCREPO = rdflib.Namespace("http://fedora.info/definitions/v4/repository#")
-IDLOC_RT = rdflib.Namespace("http://id.loc.gov/vocabulary/relators/")
-MADS = rdflib.Namespace("http://www.loc.gov/standards/mads/")
-MADS_RDF = rdflib.Namespace("http://www.loc.gov/mads/rdf/v1#")
-SCHEMA_ORG = rdflib.Namespace("http://schema.org/")
-SKOS = rdflib.Namespace('http://www.w3.org/2004/02/skos/core#')
+# Links a Fedora search response to each of its hits
+SEARCH_RESULT = "http://sindice.com/vocab/search#result"
+
+# rdflib and its plugin machinery are expensive to import, so the namespace
+# constants below are built from these URIs on first access by the module
+# __getattr__ (PEP 562), which is why Python 3.7 is the minimum version
+NAMESPACE_URIS = {
+    'BIBFRAME': "http://bibframe.org/vocab/",
+    'FEDORA_NS': 'http://fedora.info/definitions/v4/rest-api#',
+    'FEDORA_RELS_EXT': 'http://fedora.info/definitions/v4/rels-ext#',
+    'FCREPO': "http://fedora.info/definitions/v4/repository#",
+    'IDLOC_RT': "http://id.loc.gov/vocabulary/relators/",
+    'MADS': "http://www.loc.gov/standards/mads/",
+    'MADS_RDF': "http://www.loc.gov/mads/rdf/v1#",
+    'SCHEMA_ORG': "http://schema.org/",
+    'SKOS': 'http://www.w3.org/2004/02/skos/core#'}
 
 DEFAULT_NAMESPACES = [
-    ('bf', str(BIBFRAME)),
-    ('fedora', str(FEDORA_NS)),
-    ('fedorarelsext', str(FEDORA_RELS_EXT)),
-    ('fcrepo', str(FCREPO)),
-    ('idloc_rt', str(IDLOC_RT)),
-    ('mads', str(MADS)),
-    ('madsrdf', str(MADS_RDF)),
-    ('owl', str(rdflib.OWL)),
-    ('rdf', str(rdflib.RDF)),
-    ('rdfs', str(rdflib.RDFS)),
-    ('schema', str(SCHEMA_ORG))]
-
-CONTEXT = {}
-for row in DEFAULT_NAMESPACES:
-    CONTEXT[row[0]] = row[1]
+    ('bf', NAMESPACE_URIS['BIBFRAME']),
+    ('fedora', NAMESPACE_URIS['FEDORA_NS']),
+    ('fedorarelsext', NAMESPACE_URIS['FEDORA_RELS_EXT']),
+    ('fcrepo', NAMESPACE_URIS['FCREPO']),
+    ('idloc_rt', NAMESPACE_URIS['IDLOC_RT']),
+    ('mads', NAMESPACE_URIS['MADS']),
+    ('madsrdf', NAMESPACE_URIS['MADS_RDF']),
+    ('owl', 'http://www.w3.org/2002/07/owl#'),
+    ('rdf', 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'),
+    ('rdfs', 'http://www.w3.org/2000/01/rdf-schema#'),
+    ('schema', NAMESPACE_URIS['SCHEMA_ORG'])]
+
+def __getattr__(name):
+    """Module function lazily builds the rdflib.Namespace constants and the
+    JSON-LD CONTEXT the first time they are accessed.
+
+    Args:
+        name(str): Module attribute name
+
+    Returns:
+        rdflib.Namespace or dict
+    """
+    if name in NAMESPACE_URIS:
+        import rdflib
+        value = rdflib.Namespace(NAMESPACE_URIS[name])
+    elif name == 'CONTEXT':
+        value = dict(DEFAULT_NAMESPACES)
+    else:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name))
+    globals()[name] = value
+    return value
 
 def build_prefixes(namespaces=None):
     """Internal function takes a list of prefix, namespace uri tuples and
@@ -65,18 +99,27 @@ def build_prefixes(namespaces=None):
     """
     if namespaces is None:
         namespaces = [
-            ('bf', str(BIBFRAME)),
-            ('schema', str(SCHEMA_ORG))
+            ('bf', NAMESPACE_URIS['BIBFRAME']),
+            ('schema', NAMESPACE_URIS['SCHEMA_ORG'])
         ]
-    output = "PREFIX {}: <{}>\n".format(
-        namespaces[0][0],
-        namespaces[0][1])
-    if len(namespaces) == 1:
-        return output
-    else:
-        for namespace in namespaces[1:]:
-            output += "PREFIX  {}: <{}>\n".format(namespace[0], namespace[1])
-    return output
+    return prologue(namespaces)
+
+class PreconditionFailed(Exception):
+    """Exception raised when Fedora rejects a conditional write because the
+    resource changed since the ETag the caller sent"""
+
+    def __init__(self, uri, etag):
+        self.uri = uri
+        self.etag = etag
+        super(PreconditionFailed, self).__init__(
+            "{} no longer matches ETag {}".format(uri, etag))
+
+def __text__(serialized):
+    """Internal function returns rdflib serializer output as a string, older
+    rdflib versions return bytes and newer ones return str"""
+    if isinstance(serialized, bytes):
+        return serialized.decode()
+    return serialized
 
 def copy_graph(subject, existing_graph):
     """Function takes a subject and an existing graph, returns a new graph with
@@ -90,45 +133,189 @@ def copy_graph(subject, existing_graph):
     Returns:
         rdflib.Graph
     """
+    import rdflib
     new_graph = rdflib.Graph()
     for predicate, object_ in existing_graph.predicate_objects():
         new_graph.add((subject, predicate, object_))
     return new_graph
 
+def __clone__(graph):
+    """Internal function returns an independent copy of a rdflib.Graph for
+    callers sharing one coalesced read"""
+    import rdflib
+    clone = rdflib.Graph()
+    for prefix, uri in graph.namespaces():
+        clone.bind(prefix, uri, override=True)
+    for triple in graph:
+        clone.add(triple)
+    return clone
+
 class Repository(object):
     """Class provides an interface to a Fedora Commons digital
-     repository.
+     repository. A single instance can be shared by threads, per-request
+     state such as the transaction lives in a thread-local session and the
+     shared caches, queues and worker pool are thread-safe.
      """
+    # Statuses Fedora answers a SPARQL update PATCH on a binary with
+    BINARY_PATCH_CODES = (400, 405, 415)
+    # Predicates whose values identify an entity when deduplicating
+    DEFAULT_ID_URIS = [
+        'http://www.w3.org/2000/01/rdf-schema#label',
+        'http://bibframe.org/vocab/authorizedAccessPoint']
 
     def __init__(
         self,
         app=None,
         base_url='http://localhost:8080',
-        namespaces=DEFAULT_NAMESPACES):
+        namespaces=DEFAULT_NAMESPACES,
+        query_cache_ttl=0,
+        query_cache_size=1024,
+        write_behind_workers=0,
+        shard=False,
+        read_your_writes=5):
         """
         Initializes a Repository object
 
         Args:
             app(Flask): Flask app, default is None
             base_url(str): Base url for Fedora Commons, defaults to
-                           localhost:8080.
+                           localhost:8080. A list of base urls routes reads
+                           across healthy nodes and writes to the first.
             namespaces(list): List of namespace tuples of prefix, uri for
                               each namespace in Fedora
+            query_cache_ttl(int): Seconds to cache sparql and search results,
+                                  defaults to 0 which disables the cache
+            query_cache_size(int): Maximum number of cached query results
+            write_behind_workers(int): Number of background workers applying
+                                       queued insert, remove and replace
+                                       calls, defaults to 0 which writes
+                                       synchronously
+            shard(bool): Partition resource paths across a list of base urls
+                         by consistent hashing, default is False. A container
+                         only lists the children stored on its own node, so
+                         flush, warm and export only see that node's part
+            read_your_writes(float): Seconds reads of a resource written by
+                                     this process go to the primary instead
+                                     of a replica, defaults to 5
         """
         self.app = app
         self.namespaces = namespaces
         self.base_url = None
+        self.template_helpers = None
         if app is not None:
             self.init_app(app)
             if 'FEDORA_BASE_URL' in app.config:
                 self.base_url = app.config.get('FEDORA_BASE_URL')
+            query_cache_ttl = app.config.get(
+                'FEDORA_QUERY_CACHE_TTL',
+                query_cache_ttl)
+            query_cache_size = app.config.get(
+                'FEDORA_QUERY_CACHE_SIZE',
+                query_cache_size)
+            write_behind_workers = app.config.get(
+                'FEDORA_WRITE_BEHIND_WORKERS',
+                write_behind_workers)
+            shard = app.config.get('FEDORA_SHARDING', shard)
+            read_your_writes = app.config.get(
+                'FEDORA_READ_YOUR_WRITES',
+                read_your_writes)
         if self.base_url is None:
             self.base_url = base_url
+        self.router = None
+        if isinstance(self.base_url, (list, tuple)):
+            from .routing import Router
+            self.router = Router(
+                self.base_url,
+                shard=shard,
+                read_your_writes=read_your_writes)
+            self.base_url = self.router.primary
         # Removes trailing forward-slash
         if self.base_url.endswith("/"):
             self.base_url = self.base_url[:-1]
-        self.transaction = []
-
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._executor = None
+        self.pool_workers = 8
+        if app is not None:
+            self.pool_workers = app.config.get('FEDORA_POOL_WORKERS')
+        # Compressed transfer, configured by the FEDORA_ACCEPT_ENCODING,
+        # FEDORA_COMPRESS_REQUESTS and FEDORA_COMPRESS_THRESHOLD settings
+        self.accept_encoding = True
+        self.compress_requests = False
+        self.compress_threshold = 65536
+        if app is not None:
+            self.accept_encoding = app.config.get('FEDORA_ACCEPT_ENCODING')
+            self.compress_requests = app.config.get(
+                'FEDORA_COMPRESS_REQUESTS')
+            self.compress_threshold = app.config.get(
+                'FEDORA_COMPRESS_THRESHOLD')
+        self.existence_cache = None
+        if app is not None and app.config.get('FEDORA_EXISTS_CACHE_TTL'):
+            self.existence_cache = ExistenceCache(
+                positive_ttl=app.config.get('FEDORA_EXISTS_CACHE_TTL'),
+                negative_ttl=app.config.get('FEDORA_EXISTS_NEGATIVE_TTL'))
+        self.read_cache = None
+        if app is not None and app.config.get('FEDORA_READ_CACHE_TTL'):
+            self.read_cache = QueryCache(
+                ttl=app.config.get('FEDORA_READ_CACHE_TTL'),
+                max_entries=app.config.get('FEDORA_READ_CACHE_SIZE'))
+        self.disk_cache = None
+        if app is not None and app.config.get('FEDORA_DISK_CACHE_PATH'):
+            self.enable_disk_cache(
+                app.config.get('FEDORA_DISK_CACHE_PATH'),
+                max_bytes=app.config.get('FEDORA_DISK_CACHE_SIZE'))
+        # Coalesces concurrent identical reads into one request and parse
+        self._flight = SingleFlight()
+        # Identifying values of known resources, checked by __dedup__
+        self.id_index = IdentifierIndex()
+        self.query_cache = None
+        if query_cache_ttl:
+            self.query_cache = QueryCache(
+                ttl=query_cache_ttl,
+                max_entries=query_cache_size)
+        self.outbox = None
+        if app is not None and app.config.get('FEDORA_OUTBOX_FILE'):
+            from .outbox import FileSink
+            self.enable_outbox(
+                [FileSink(app.config.get('FEDORA_OUTBOX_FILE'))])
+        self.limiter = None
+        if app is not None and app.config.get('FEDORA_ADAPTIVE_CONCURRENCY'):
+            self.enable_adaptive_concurrency(
+                initial=app.config.get('FEDORA_CONCURRENCY_INITIAL'),
+                maximum=app.config.get('FEDORA_CONCURRENCY_MAX'))
+        self.write_behind = None
+        if write_behind_workers:
+            self.enable_write_behind(write_behind_workers)
+
+
+    @property
+    def session(self):
+        """Thread-local session holding the calling thread's transaction,
+        created on first access in each thread"""
+        session = self._local
+        if not hasattr(session, 'transaction'):
+            session.transaction = []
+        return session
+
+    @property
+    def transaction(self):
+        """Calling thread's transaction"""
+        return self.session.transaction
+
+    @transaction.setter
+    def transaction(self, value):
+        self.session.transaction = value
+
+    @property
+    def executor(self):
+        """Shared concurrent.futures.ThreadPoolExecutor for the repository's
+        parallel operations, created on first use"""
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.pool_workers)
+            return self._executor
 
     def __build_url__(self, url):
         """Internal method takes a URL or URL fragment and builds a Fedora
@@ -160,17 +347,24 @@ class Repository(object):
         """
         if graph is None:
             return
+        import rdflib
         for uri in Repository.DEFAULT_ID_URIS:
             # Checks for duplicates
-            for obj_uri in graph.objects(subject=subject, predicate=uri):
+            for obj_uri in graph.objects(subject=subject,
+                                         predicate=rdflib.URIRef(uri)):
+                # The index is a hint, only trusted while the indexed
+                # resource still holds the value
+                indexed = self.id_index.get(uri, obj_uri)
+                if indexed is not None and self.exists(indexed):
+                    existing = self.read(indexed)
+                    if (rdflib.URIRef(indexed),
+                            rdflib.URIRef(uri),
+                            obj_uri) in existing:
+                        return existing
                 sparql_url = urllib.parse.urljoin(
                     self.base_url,
                     "rest/fcr:sparql")
-                sparql_template = Template("""SELECT ?x
-                    WHERE { ?x <$uri> "$obj_uri" }""")
-                sparql_query = sparql_template.substitute(
-                    uri=uri,
-                    obj_uri=obj_uri)
+                sparql_query = select_subjects(uri, obj_uri)
                 search_request = urllib.request.Request(
                     sparql_url,
                     data=sparql_query.encode())
@@ -181,23 +375,206 @@ class Repository(object):
                     "Content-Type",
                     "application/sparql-query")
                 try:
-                    search_response = urllib.request.urlopen(search_request)
+                    search_response = self.__urlopen__(search_request)
                     if search_response.code < 400:
-                        return rdflib.Graph().parse(
+                        existing = rdflib.Graph().parse(
                             data=search_response.read(),
                             format='turtle')
+                        if len(existing) > 0:
+                            return existing
                 except urllib.error.HTTPError:
                     print("Error with sparql query:\n{}".format(sparql_query))
 
+    def __expand__(self, property_name):
+        """Internal method expands a prefixed property name like schema:name
+        into a full URI using the repository's namespaces.
+
+        Args:
+            property_name(str): Prefixed name or URI
+
+        Returns:
+            str: Full URI, or property_name if the prefix is unknown
+        """
+        property_name = str(property_name)
+        if property_name.startswith("<") and property_name.endswith(">"):
+            return property_name[1:-1]
+        prefix, _, local_name = property_name.partition(":")
+        for row in self.namespaces:
+            if row[0] == prefix:
+                return "{}{}".format(row[1], local_name)
+        return property_name
+
+    def __entity_key__(self, entity_id):
+        """Internal method returns the absolute resource URI that keys an
+        entity's write-behind queue, so IDs, URIs and fcr:metadata paths of
+        one resource are ordered together
+
+        Args:
+            entity_id(str): Fedora object ID or URI
+
+        Returns:
+            str
+        """
+        entity_id = str(entity_id)
+        if not entity_id.startswith("http"):
+            entity_id = urllib.parse.urljoin(self.base_url, entity_id)
+        return entity_id.split("/fcr:")[0].rstrip("/")
+
+    def __wait_for_queue__(self, uri, tree=False):
+        """Internal method blocks until the write-behind mutations queued for
+        uri have been applied, so a synchronous write cannot overtake them
+
+        Args:
+            uri(str): Fedora object ID or URI
+            tree(bool): Also wait for resources below uri, default is False
+        """
+        if self.write_behind is not None and \
+           not self.write_behind.in_worker():
+            self.write_behind.wait(self.__entity_key__(uri), tree)
+
+    def __existence__(self, uri, exists):
+        """Internal method records the outcome of this client's own create,
+        delete, copy or move in the existence cache.
+
+        Args:
+            uri(str): Resource URI
+            exists(bool): True after a create, False after a delete
+        """
+        if uri is None:
+            return
+        self.__forget__(uri, tree=not exists)
+        if self.existence_cache is None:
+            return
+        if exists:
+            self.existence_cache.set(str(uri), True)
+        else:
+            self.existence_cache.remove_tree(str(uri))
+
+    def __forget__(self, uri, tree=False):
+        """Internal method drops cached reads and indexed identifiers of a
+        resource and its fcr:metadata after a write, with tree also
+        everything below it.
+
+        Args:
+            uri(str): Resource URI
+            tree(bool): The resource was deleted or moved, default is False
+        """
+        uri = str(uri)
+        if self.read_cache is not None:
+            self.read_cache.discard(uri, tree)
+            self.read_cache.discard("/".join([uri, "fcr:metadata"]))
+        if self.disk_cache is not None:
+            self.disk_cache.discard(uri, tree)
+            self.disk_cache.discard("/".join([uri, "fcr:metadata"]))
+        # Any write may change an identifying value, the next create or
+        # warm re-indexes the resource
+        self.id_index.discard(uri, tree)
+
+    def __invalidate__(self, property_name=None, uri=None):
+        """Internal method invalidates cached query results after a write,
+        either every result or only those depending on property_name, and
+        the cached read of uri when given.
+
+        Args:
+            property_name(str): Prefixed name or URI, default is None
+            uri(str): URI of the changed resource, default is None
+        """
+        if uri is not None:
+            self.__forget__(uri)
+        if self.query_cache is None:
+            return
+        if property_name is None:
+            self.query_cache.invalidate()
+        else:
+            self.query_cache.invalidate(self.__expand__(property_name))
+
+    def __emit__(self,
+                 event_type,
+                 uri,
+                 added=None,
+                 removed=None,
+                 etag=None,
+                 destination=None):
+        """Internal method emits a change event to the outbox when one is
+        enabled, see flask_fedora_commons.outbox.change_event
+
+        Args:
+            event_type(str): Kind of write
+            uri(str): URI of the changed resource
+            added(list): Added triples in N3, default is None
+            removed(list): Removed triples in N3, default is None
+            etag(str): ETag after the write, default is None
+            destination(str): New URI for copy and move, default is None
+        """
+        if self.outbox is None:
+            return
+        from .outbox import change_event
+        self.outbox.emit(change_event(event_type,
+                                      uri,
+                                      added=added,
+                                      removed=removed,
+                                      etag=etag,
+                                      destination=destination))
+
+    def __triple__(self, subject, property_name, value):
+        """Internal method returns the N3 terms of a triple written by
+        insert, remove or replace"""
+        return (iri(subject),
+                iri(self.__expand__(property_name)),
+                self.__value_format__(value))
+
+    def __triples__(self, graph):
+        """Internal method returns a graph's triples as N3 terms"""
+        if graph is None:
+            return []
+        return [(subject.n3(), predicate.n3(), object_.n3())
+                for subject, predicate, object_ in graph]
+
+    def __urlopen__(self, request):
+        """Internal method opens a urllib request or URL, sending it through
+        the router when the repository has several Fedora nodes. Responses
+        are negotiated with Accept-Encoding and decoded while streaming, and
+        large PUT, PATCH and POST bodies are gzipped when compress_requests
+        is enabled. With adaptive concurrency every request waits for a slot
+        from the shared limiter, held until the response headers arrive.
+
+        Args:
+            request(urllib.request.Request or str): Request or URL
+
+        Returns:
+            http.client.HTTPResponse, decompressed when the server sent a
+            gzip or deflate Content-Encoding
+        """
+        if not isinstance(request, urllib.request.Request):
+            request = urllib.request.Request(str(request))
+        if self.accept_encoding and not request.has_header('Accept-encoding'):
+            request.add_header('Accept-Encoding', ACCEPT_ENCODING)
+        original_body = None
+        if self.compress_requests:
+            original_body = compress_request(request, self.compress_threshold)
+        opener = urllib.request.urlopen
+        if self.router is not None:
+            opener = self.router.open
+        if self.limiter is not None:
+            opener = functools.partial(self.limiter.call, opener)
+        try:
+            response = opener(request)
+        except urllib.error.HTTPError as error:
+            if original_body is None or error.code != 415:
+                raise
+            # Server rejected the gzip body, stop compressing and resend
+            self.compress_requests = False
+            request.data = original_body
+            request.remove_header('Content-encoding')
+            response = opener(request)
+        return decode_response(response)
+
     def __value_format__(self, value):
         """Internal Method takes a value and constructs either an URI or
-        literal string in constructing an SPAQRL query.
+        an escaped literal string in constructing an SPAQRL query.
 
         """
-        if value.startswith("http"):
-            return "<{}>".format(value)
-        else:
-            return '"{}"'.format(value)
+        return term(value)
 
     def init_app(self, app):
         """
@@ -207,6 +584,45 @@ class Repository(object):
             app(Flask): Flask app
         """
         app.config.setdefault('FEDORA_BASE_URL', 'http://localhost:8080')
+        app.config.setdefault('FEDORA_QUERY_CACHE_TTL', 0)
+        app.config.setdefault('FEDORA_QUERY_CACHE_SIZE', 1024)
+        app.config.setdefault('FEDORA_WRITE_BEHIND_WORKERS', 0)
+        app.config.setdefault('FEDORA_SHARDING', False)
+        app.config.setdefault('FEDORA_READ_YOUR_WRITES', 5)
+        # Caps the shared executor's parallel requests below any adaptive
+        # FEDORA_CONCURRENCY_MAX, see enable_adaptive_concurrency
+        app.config.setdefault('FEDORA_POOL_WORKERS', 8)
+        app.config.setdefault('FEDORA_ADAPTIVE_CONCURRENCY', False)
+        app.config.setdefault('FEDORA_CONCURRENCY_INITIAL', 8)
+        app.config.setdefault('FEDORA_CONCURRENCY_MAX', 64)
+        app.config.setdefault('FEDORA_EXISTS_CACHE_TTL', 0)
+        app.config.setdefault('FEDORA_EXISTS_NEGATIVE_TTL', 5)
+        app.config.setdefault('FEDORA_READ_CACHE_TTL', 0)
+        app.config.setdefault('FEDORA_READ_CACHE_SIZE', 1024)
+        app.config.setdefault('FEDORA_DISK_CACHE_PATH', None)
+        app.config.setdefault('FEDORA_DISK_CACHE_SIZE', 268435456)
+        app.config.setdefault('FEDORA_OUTBOX_FILE', None)
+        app.config.setdefault('FEDORA_TEMPLATE_HELPERS', False)
+        app.config.setdefault('FEDORA_FRAGMENT_TTL', 0)
+        app.config.setdefault('FEDORA_ACCEPT_ENCODING', True)
+        app.config.setdefault('FEDORA_COMPRESS_REQUESTS', False)
+        app.config.setdefault('FEDORA_COMPRESS_THRESHOLD', 65536)
+        app.config.setdefault('FEDORA_BLUEPRINT_URL_PREFIX', None)
+        app.config.setdefault('FEDORA_CACHE_CONTROL', 'public, max-age=60')
+        if app.config['FEDORA_BLUEPRINT_URL_PREFIX'] is not None:
+            from .blueprint import create_blueprint
+            app.register_blueprint(create_blueprint(
+                self,
+                url_prefix=app.config['FEDORA_BLUEPRINT_URL_PREFIX']))
+        if app.config['FEDORA_TEMPLATE_HELPERS']:
+            from .templating import TemplateHelpers
+            self.template_helpers = TemplateHelpers(
+                self,
+                fragment_ttl=app.config['FEDORA_FRAGMENT_TTL'])
+            self.template_helpers.init_app(app)
+        if hasattr(app, 'cli'):
+            from .cli import create_cli
+            app.cli.add_command(create_cli(self))
         if hasattr(app, 'teardown_appcontext'):
             app.teardown_appcontext(self.teardown)
         else:
@@ -215,7 +631,7 @@ class Repository(object):
     def create_transaction(self):
         """Method creates a new transaction resource and sets instance's
         transaction."""
-        request = urlllib.request.urlopen(
+        request = self.__urlopen__(
             urllib.parse.urljoin(self.base_url, 'fcr:tx'))
         self.transaction = request.read()
 
@@ -223,7 +639,8 @@ class Repository(object):
     def connect(self,
                 fedora_url,
                 data=None,
-                method='Get'):
+                method='GET',
+                headers=None):
         """Method attempts to connect to REST servers of the Fedora
         Commons repository using optional data parameter.
 
@@ -231,6 +648,7 @@ class Repository(object):
             fedora_url(string): Fedora URL
             data(dict): Data to through to REST endpoint
             method(str): REST Method, defaults to GET
+            headers(dict): Additional request headers, default is None
 
         Returns:
             result(string): Response string from Fedora
@@ -244,11 +662,16 @@ class Repository(object):
                                          method=method)
         request.add_header('Accept', 'text/turtle')
         request.add_header('Content-Type', 'text/turtle')
+        for name, value in (headers or {}).items():
+            request.add_header(name, value)
         if len(data) > 0:
             request.data = data
         try:
-            response = urllib.request.urlopen(request)
+            response = self.__urlopen__(request)
         except urllib.error.URLError as err:
+            if getattr(err, 'code', None) in (304, 412):
+                # Answers to conditional requests, not errors
+                raise err
             if hasattr(err, 'reason'):
                 print("failed to reach server at {} with {} method".format(
                     fedora_url,
@@ -273,68 +696,478 @@ class Repository(object):
         Returns:
             str: JSON-LD of Fedora Object
         """
-        try:
-            urllib.request.urlopen(entity_url)
-        except urllib.error.HTTPError:
+        return self._flight.do(
+            ('json', str(entity_url), json.dumps(context, sort_keys=True)),
+            self.__as_json__,
+            entity_url,
+            context)
+
+    def __as_json__(self, entity_url, context=None):
+        """Internal method reads and serializes an entity as JSON-LD, shared
+        by concurrent as_json calls for the same entity and context
+
+        Args:
+            entity_url(str): Fedora Commons URL of Entity
+            context(None): Returns JSON-LD with Context, default is None
+
+        Returns:
+            str: JSON-LD of Fedora Object
+        """
+        if not self.exists(entity_url):
             raise ValueError("Cannot open {}".format(entity_url))
         entity_graph = self.read(entity_url)
         entity_json = json.loads(
-            entity_graph.serialize(
+            __text__(entity_graph.serialize(
                 format='json-ld',
-                context=context).decode())
+                context=context)))
         return json.dumps(entity_json)
 
+    def copy(self, source, destination):
+        """Method copies a resource and everything it contains, binaries
+        included, to destination with a server-side COPY so no content
+        passes through this client.
+
+        Args:
+            source(str): URI of the resource to copy
+            destination(str): URI of the new resource
+
+        Returns:
+            boolean: True if Fedora made the copy, False otherwise
+        """
+        return self.__relocate__('COPY', source, destination)
+
+    def move(self, source, destination):
+        """Method moves a resource and everything it contains to
+        destination with a server-side MOVE.
+
+        Args:
+            source(str): URI of the resource to move
+            destination(str): New URI for the resource
+
+        Returns:
+            boolean: True if Fedora moved the resource, False otherwise
+        """
+        return self.__relocate__('MOVE', source, destination)
+
+    def copy_many(self, pairs):
+        """Method runs server-side copies of many resources concurrently on
+        the repository's shared executor.
+
+        Args:
+            pairs(list): List of source, destination URI tuples
+
+        Returns:
+            list: Boolean result for each pair in order
+        """
+        return list(self.executor.map(lambda pair: self.copy(*pair), pairs))
+
+    def move_many(self, pairs):
+        """Method runs server-side moves of many resources concurrently on
+        the repository's shared executor.
+
+        Args:
+            pairs(list): List of source, destination URI tuples
+
+        Returns:
+            list: Boolean result for each pair in order
+        """
+        return list(self.executor.map(lambda pair: self.move(*pair), pairs))
+
+    def __relocate__(self, method, source, destination):
+        """Internal method sends a WebDAV style COPY or MOVE request
+
+        Args:
+            method(str): COPY or MOVE
+            source(str): Source URI or path
+            destination(str): Destination URI or path
+
+        Returns:
+            boolean
+        """
+        source, destination = str(source), str(destination)
+        if not source.startswith("http"):
+            source = urllib.parse.urljoin(self.base_url, source)
+        if not destination.startswith("http"):
+            destination = urllib.parse.urljoin(self.base_url, destination)
+        self.__wait_for_queue__(source, True)
+        self.__wait_for_queue__(destination, True)
+        relocate_request = urllib.request.Request(
+            source,
+            method=method,
+            headers={'Destination': destination})
+        try:
+            self.__urlopen__(relocate_request)
+        except urllib.error.HTTPError as error:
+            print("Error trying {} {} to {}, code {}".format(
+                method,
+                source,
+                destination,
+                error.code))
+            return False
+        except ValueError as error:
+            print("Error trying {} {} to {}, {}".format(
+                method,
+                source,
+                destination,
+                error))
+            return False
+        if method == 'MOVE':
+            self.__existence__(source, False)
+        self.__existence__(destination, True)
+        self.__invalidate__()
+        self.__emit__(method.lower(), source, destination=destination)
+        return True
+
         # Provides standard CRUD operations on a Fedora Object
-    def create(self, uri=None, graph=None, data=None):
+    def create(self, uri=None, graph=None, data=None, if_absent=False):
         """Method takes an optional URI and graph, first checking if the URL is already
         present in Fedora, if not, creates a Fedora Object with the graph as
         properties. If URI is None, uses Fedora 4 default PID minter to create
-        the object's URI.
+        the object's URI, or with sharding mints a UUID below rest so the
+        object is created on the node that owns its path.
 
         Args:
             uri(string): String of URI, default is None
             graph(rdflib.Graph): RDF Graph of subject, default is None
-            data(object): Binary datastream that will be saved as fcr:content
+            data(object): Binary datastream that will be saved as fcr:content,
+                          bytes or a file-like object streamed with fixity
+                          verification, see upload
+            if_absent(bool): Skip the deduplication queries and create uri
+                             with a single conditional PUT using
+                             If-None-Match: *, for binaries too, default is
+                             False
 
         Returns:
             URI(string): New Fedora URI or None if uri already exists
         """
+        import rdflib
+        if uri is None and self.router is not None and self.router.shard:
+            # A POST to rest lands on the node owning rest, while reads of
+            # the minted path hash to the node owning that path
+            import uuid
+            uri = "/".join([self.base_url, "rest", str(uuid.uuid4())])
+            if data is None:
+                return self.__create_if_absent__(uri, graph)
         if uri is not None:
+            self.__wait_for_queue__(uri)
+        if if_absent and uri is not None and data is None:
+            return self.__create_if_absent__(uri, graph)
+        if uri is not None and not if_absent:
             existing_entity = self.__dedup__(rdflib.URIRef(uri), graph)
             if existing_entity is not None:
                 return # Returns nothing
-        else:
+        if data is not None:
+            uploaded = self.upload(uri, data, if_absent=if_absent)
+            if uploaded is None:
+                return None
+            uri = uploaded['uri']
+            new_graph = None
+            if graph is not None:
+                new_graph = copy_graph(rdflib.URIRef(uri), graph)
+                self.__patch_metadata__(uri, new_graph)
+            self.__existence__(uri, True)
+            self.__invalidate__()
+            self.__emit__('create', uri, added=self.__triples__(new_graph))
+            return uri
+        etag, new_graph = None, None
+        if uri is None:
             default_request = urllib.request.Request(
                 "/".join([self.base_url, "rest"]),
                 method='POST')
-            uri = urllib.request.urlopen(default_request).read().decode()
+            default_response = self.__urlopen__(default_request)
+            etag = default_response.headers.get('ETag')
+            uri = default_response.read().decode()
+            self.__existence__(uri, True)
         if graph is not None:
             new_graph = copy_graph(rdflib.URIRef(uri), graph)
             create_response = self.connect(
                 uri,
-                data=new_graph.serialize(format='turtle'),
+                data=__text__(new_graph.serialize(format='turtle')).encode(),
                 method='PUT')
             raw_response = create_response.read()
+            etag = create_response.headers.get('ETag')
+            self.__existence__(uri, True)
+            self.id_index.add_graph(rdflib.URIRef(uri),
+                                    new_graph,
+                                    Repository.DEFAULT_ID_URIS)
+        self.__invalidate__()
+        self.__emit__('create',
+                      uri,
+                      added=self.__triples__(new_graph),
+                      etag=etag)
         return uri
 
 
+    def __create_if_absent__(self, uri, graph=None):
+        """Internal method creates a resource with one PUT that Fedora only
+        applies when nothing exists at uri.
+
+        Args:
+            uri(str): URI of the new resource
+            graph(rdflib.Graph): RDF Graph of subject, default is None
+
+        Returns:
+            URI(string): uri or None if it already exists
+        """
+        import rdflib
+        body = None
+        if graph is not None:
+            graph = copy_graph(rdflib.URIRef(uri), graph)
+            body = __text__(graph.serialize(format='turtle')).encode()
+        try:
+            create_response = self.connect(str(uri),
+                                           data=body,
+                                           method='PUT',
+                                           headers={'If-None-Match': '*'})
+        except urllib.error.HTTPError as error:
+            if error.code == 412:
+                self.__existence__(uri, True)
+                return None
+            raise
+        self.__existence__(uri, True)
+        if graph is not None:
+            self.id_index.add_graph(rdflib.URIRef(uri),
+                                    graph,
+                                    Repository.DEFAULT_ID_URIS)
+        self.__invalidate__()
+        self.__emit__('create',
+                      uri,
+                      added=self.__triples__(graph),
+                      etag=create_response.headers.get('ETag'))
+        return uri
+
+    def etag(self, uri):
+        """Method returns a resource's current ETag with a HEAD request, for
+        use with the etag argument of insert, remove and replace.
+
+        Args:
+            uri(str): URI of the resource
+
+        Returns:
+            str: ETag or None if Fedora did not send one
+        """
+        response = self.__urlopen__(
+            urllib.request.Request(str(uri), method='HEAD'))
+        return response.headers.get('ETag')
+
+    def __patch_metadata__(self, uri, graph):
+        """Internal method adds a graph's triples to a binary's fcr:metadata
+        with a SPARQL INSERT DATA update.
+
+        Args:
+            uri(str): URI of the binary
+            graph(rdflib.Graph): Triples about the binary
+        """
+        triples = __text__(graph.serialize(format='nt'))
+        update_request = urllib.request.Request(
+            "/".join([str(uri), "fcr:metadata"]),
+            data="INSERT DATA {{\n{}}}".format(triples).encode(),
+            method='PATCH',
+            headers={'Content-Type': 'application/sparql-update'})
+        self.__urlopen__(update_request)
+
+    def upload(self,
+               uri,
+               data,
+               mimetype='application/octet-stream',
+               digests=None,
+               verify=True,
+               recompute=False,
+               if_absent=False):
+        """Method streams binary content to Fedora, computing SHA-1, SHA-256
+        and MD5 digests as urllib reads the body. Known digests are sent in
+        a Digest header so Fedora verifies them on ingest, and afterwards the
+        computed digests are checked against the digests Fedora recorded.
+
+        Args:
+            uri(str): URI of the binary, None to let Fedora mint one
+            data(bytes or file): Binary content
+            mimetype(str): Content type, defaults to application/octet-stream
+            digests(dict): Known hex digests keyed by algorithm, for example
+                           from a transfer manifest, default is None
+            verify(bool): Compare with Fedora's digests, default is True
+            recompute(bool): Verify with fcr:fixity, which has Fedora re-hash
+                             the stored binary, instead of the digests in
+                             fcr:metadata, default is False
+            if_absent(bool): Only create uri if nothing exists there, using
+                             If-None-Match: *, default is False
+
+        Returns:
+            dict: Hex digests keyed by algorithm with the binary's uri and
+                  whether it was verified, or None if if_absent is set and
+                  uri already exists
+        """
+        from .fixity import compare_digests, digest_header, DigestingReader
+        reader = DigestingReader(data)
+        expected = dict(digests or {})
+        if not expected and isinstance(data, (bytes, bytearray)):
+            # Already in memory, so hashing it up front costs no extra I/O
+            expected['sha1'] = hashlib.sha1(data).hexdigest()
+        headers = {'Content-Type': mimetype}
+        if expected:
+            headers['Digest'] = digest_header(expected)
+        if reader.length is not None:
+            headers['Content-Length'] = str(reader.length)
+        if if_absent and uri is not None:
+            headers['If-None-Match'] = '*'
+        if uri is None:
+            upload_request = urllib.request.Request(
+                "/".join([self.base_url, "rest"]),
+                data=reader,
+                method='POST',
+                headers=headers)
+        else:
+            self.__wait_for_queue__(uri)
+            upload_request = urllib.request.Request(
+                str(uri),
+                data=reader,
+                method='PUT',
+                headers=headers)
+        try:
+            response = self.__urlopen__(upload_request)
+        except urllib.error.HTTPError as error:
+            if if_absent and error.code == 412:
+                self.__existence__(uri, True)
+                return None
+            raise
+        if uri is None:
+            uri = response.read().decode()
+        self.__forget__(uri)
+        result = reader.hexdigests()
+        compare_digests(uri, result, expected)
+        result['verified'] = False
+        if verify:
+            result['verified'] = self.verify_fixity(uri, result, recompute)
+        result['uri'] = str(uri)
+        return result
+
+    def verify_fixity(self, uri, digests, recompute=False):
+        """Method compares digests with the premis:hasMessageDigest values
+        Fedora holds for a binary, raising FixityError on a mismatch.
+
+        Args:
+            uri(str): URI of the binary
+            digests(dict): Hex digests keyed by algorithm
+            recompute(bool): Use fcr:fixity, which re-hashes the stored
+                             binary on the server, instead of fcr:metadata,
+                             default is False
+
+        Returns:
+            bool: True if at least one algorithm was compared
+        """
+        from .fixity import compare_digests, recorded_digests
+        endpoint = "fcr:fixity" if recompute else "fcr:metadata"
+        graph = self.read("/".join([str(uri), endpoint]))
+        return len(compare_digests(uri,
+                                   digests,
+                                   recorded_digests(graph))) > 0
+
     def delete(self, uri):
         """Method deletes a Fedora Object in the repository
 
         Args:
             uri(str): URI of Fedora Object
         """
+        self.__wait_for_queue__(uri, True)
         try:
             self.connect(uri, method='DELETE')
-            return True
         except urllib.error.HTTPError:
             return False
+        self.__existence__(uri, False)
+        self.__invalidate__()
+        self.__emit__('delete', uri)
+        return True
 
 
 
+    def drain(self):
+        """Method blocks until every queued write-behind mutation has been
+        applied to Fedora and every change event delivered to the outbox's
+        sinks, use at shutdown and in tests."""
+        if self.write_behind is not None:
+            self.write_behind.drain()
+        if self.outbox is not None:
+            self.outbox.flush()
+
+    def enable_write_behind(self, workers=2, maxsize=1000):
+        """Method switches insert, remove and replace to write-behind mode,
+        where each call is queued and returns a concurrent.futures.Future
+        resolving to the call's usual boolean result. Queues are keyed on
+        the absolute resource URI, and synchronous writes such as create,
+        delete, copy and move first wait for the resource's queued calls.
+
+        Args:
+            workers(int): Number of background worker threads, defaults to 2
+            maxsize(int): Maximum queued mutations per worker, defaults to
+                          1000
+        """
+        from .writebehind import WriteBehindQueue
+        if self.write_behind is not None:
+            self.write_behind.shutdown()
+        self.write_behind = WriteBehindQueue(workers=workers, maxsize=maxsize)
+
+    def enable_disk_cache(self, path, max_bytes=268435456):
+        """Method adds a persistent SQLite cache of read() results below the
+        in-memory caches, shared by every process using path and kept
+        across restarts. Cached graphs are revalidated against Fedora with
+        a conditional GET, so an unchanged resource costs a 304 and no body.
+
+        Args:
+            path(str): SQLite database file
+            max_bytes(int): Maximum compressed bytes stored, least recently
+                            used graphs are evicted, defaults to 256 MiB
+        """
+        from .diskcache import DiskGraphCache
+        self.disk_cache = DiskGraphCache(path, max_bytes=max_bytes)
+
+    def enable_adaptive_concurrency(self, initial=8, minimum=1, maximum=64):
+        """Method limits the requests in flight to Fedora from every thread
+        and worker pool sharing this repository with an AdaptiveLimiter,
+        which grows the limit while Fedora responds quickly and halves it on
+        timeouts, overload statuses or latency spikes. Parallel operations
+        on the shared executor, such as exists_many, warm and copy_many,
+        never run more than FEDORA_POOL_WORKERS requests at once whatever
+        the limit, so raise the pool size with maximum for the limiter to
+        govern them.
+
+        Args:
+            initial(int): Starting limit, defaults to 8
+            minimum(int): Lowest limit, defaults to 1
+            maximum(int): Highest limit, defaults to 64
+        """
+        from .concurrency import AdaptiveLimiter
+        self.limiter = AdaptiveLimiter(initial=initial,
+                                       minimum=minimum,
+                                       maximum=maximum)
+
+    def enable_outbox(self, sinks=(), batch_size=100, flush_interval=1.0):
+        """Method starts emitting a change event for every successful create,
+        insert, remove, replace, delete, copy and move, carrying the URI,
+        the triples added and removed and the new ETag, so indexers can
+        apply changes without reading the resource back from Fedora.
+
+        Args:
+            sinks(iterable): CallbackSink, FileSink, QueueSink or any object
+                             with a deliver(events) method
+            batch_size(int): Maximum events per delivery, defaults to 100
+            flush_interval(float): Maximum seconds an event waits for its
+                                   batch to fill, defaults to 1.0
+
+        Returns:
+            Outbox: The outbox, use add_sink to attach more sinks
+        """
+        from .outbox import Outbox
+        if self.outbox is not None:
+            self.outbox.close()
+        self.outbox = Outbox(sinks,
+                             batch_size=batch_size,
+                             flush_interval=flush_interval)
+        return self.outbox
+
     def exists(self, uri):
         """Method returns true is the entity exists in the Repository,
-        false, otherwise
+        false, otherwise. Uses a HEAD request so no body is transferred, and
+        the existence cache when it is enabled.
 
         Args:
             uri(str): Entity URI
@@ -342,121 +1175,365 @@ class Repository(object):
         Returns:
             bool
         """
-        ##entity_uri = "/".join([self.base_url, entity_id])
+        uri = str(uri)
+        if self.existence_cache is not None:
+            cached = self.existence_cache.get(uri)
+            if cached is not None:
+                return cached
         try:
-            urllib.request.urlopen(uri)
-            return True
-        except urllib.error.HTTPError:
-            return False
+            self.__urlopen__(urllib.request.Request(uri, method='HEAD'))
+            found = True
+        except urllib.error.HTTPError as error:
+            if error.code not in (404, 410):
+                return False
+            found = False
+        if self.existence_cache is not None:
+            self.existence_cache.set(uri, found)
+        return found
+
+    def exists_many(self, uris):
+        """Method checks many entities concurrently on the repository's
+        shared executor.
+
+        Args:
+            uris(list): Entity URIs
+
+        Returns:
+            dict: Boolean existence keyed by URI
+        """
+        uris = [str(uri) for uri in uris]
+        return dict(zip(uris, self.executor.map(self.exists, uris)))
+
+    def export(self,
+               root_uri,
+               path,
+               workers=4,
+               processes=None,
+               shard_size=500,
+               progress=None):
+        """Method exports a resource and everything it contains to sharded
+        gzip N-Quads files in path, each resource as a named graph. An
+        interrupted export resumes from the checkpoint left in path; remove
+        path to export the same root again from scratch. With sharding only
+        children stored on the same node as their container are exported.
+
+        Args:
+            root_uri(str): URI of the root resource
+            path(str): Output directory
+            workers(int): Number of concurrent fetches, defaults to 4
+            processes(int): Number of serializer processes, defaults to the
+                            number of CPUs
+            shard_size(int): Maximum resources per shard, defaults to 500
+            progress(callable): Called with the crawl state after each
+                                shard, default is None
+
+        Returns:
+            dict: Export statistics
+        """
+        from .export import Exporter
+        exporter = Exporter(self,
+                            path,
+                            workers=workers,
+                            processes=processes,
+                            shard_size=shard_size,
+                            progress=progress)
+        return exporter.run(str(root_uri))
 
     def flush(self):
-        """Method flushes repository, deleting all objects"""
-        base_graph = rdflib.Graph().parse('{}/rest'.format(self.base_url))
+        """Method flushes repository, deleting all objects concurrently on
+        the shared executor. With sharding only the children listed by the
+        node owning rest are deleted."""
+        import rdflib
+        base_graph = self.read('{}/rest'.format(self.base_url))
         has_child = rdflib.URIRef(
             'http://fedora.info/definitions/v4/repository#hasChild')
-        for obj in base_graph.objects(predicate=has_child):
-            self.delete(str(obj))\
+        children = [str(obj) for obj in base_graph.objects(
+            predicate=has_child)]
+        list(self.executor.map(self.delete, children))
+
+    def import_dump(self,
+                    path,
+                    group_by='subject',
+                    workers=4,
+                    window=None,
+                    progress=None,
+                    skolem=None):
+        """Method streams a N-Triples or N-Quads dump and creates a Fedora
+        object for each run of statements sharing a subject, or a graph
+        name when group_by is graph, without parsing the whole file. Later
+        runs for the same key are merged into its object and blank nodes
+        are skolemized into objects below skolem.
+
+        Args:
+            path(str): Path to the dump file
+            group_by(str): subject or graph, defaults to subject
+            workers(int): Number of concurrent creates, defaults to 4
+            window(int): Maximum creates in flight, defaults to twice workers
+            progress(callable): Called with the statistics as creates
+                                finish, default is None
+            skolem(str): IRI prefix for blank nodes, defaults to a new
+                         container below rest/genid
+
+        Returns:
+            dict: Import statistics
+        """
+        from .importer import import_dump
+        return import_dump(self,
+                           path,
+                           group_by=group_by,
+                           workers=workers,
+                           window=window,
+                           progress=progress,
+                           skolem=skolem)
+
+    def merge(self, uri, graph, etag=None):
+        """Method adds every triple of graph to an existing RDF resource with
+        one INSERT DATA PATCH.
+
+        Args:
+            uri(str): URI of the Fedora resource
+            graph(rdflib.Graph): Triples to add
+            etag(str): Only apply if the resource still has this ETag,
+                       raising PreconditionFailed otherwise, default is None
+
+        Returns:
+            boolean: True if the triples were added
+        """
+        uri = str(uri)
+        self.__wait_for_queue__(uri)
+        sparql = insert_data(self.namespaces, graph)
+        try:
+            response = self.__patch__(uri, sparql, etag)
+        except urllib.error.HTTPError:
+            print("Error trying patch {}, sparql=\n{}".format(uri, sparql))
+            return False
+        if response.code < 400:
+            self.__invalidate__(None, uri)
+            self.__emit__('insert',
+                          uri,
+                          added=self.__triples__(graph),
+                          etag=response.headers.get('ETag'))
+            return True
+        return False
 
     def insert(self,
                entity_id,
                property_uri,
-               value):
-        """Method inserts a new entity's property in Fedora4 Repository
+               value,
+               etag=None):
+        """Method inserts a new entity's property in Fedora4 Repository. The
+        PATCH is sent straight away to the entity and the entity is only
+        created if Fedora answers 404, so an existing entity costs one
+        request. Binaries, which reject SPARQL updates, are patched through
+        their fcr:metadata, or directly when entity_id ends with it.
 
         Args:
             entity_id(string): Unique ID of Fedora object
             property_uri(string): URI of property
             value: Value of the property, can be literal or URI reference
+            etag(str): Only apply if the entity still has this ETag, raising
+                       PreconditionFailed otherwise, default is None
 
         Returns:
-            boolean: True if successful changed in Fedora, False otherwise
+            boolean: True if successful changed in Fedora, False otherwise,
+                     or a Future of the boolean in write-behind mode
         """
+        if self.write_behind is not None and \
+           not self.write_behind.in_worker():
+            return self.write_behind.submit(self.__entity_key__(entity_id),
+                                            self.insert,
+                                            entity_id,
+                                            property_uri,
+                                            value,
+                                            etag)
         if not entity_id.startswith("http"):
             entity_uri = urllib.parse.urljoin(self.base_url, entity_id)
         else:
             entity_uri = entity_id
         if entity_uri.endswith("/"):
             entity_uri = entity_uri[:-1]
-        if not entity_id.endswith("fcr:metadata"):
-            entity_uri = "/".join([entity_uri, "fcr:metadata"])
-        if not self.exists(entity_id):
-            self.create(entity_id)
-        sparql_template = Template("""$prefix
-        INSERT DATA {
-             <$entity> $prop_uri $value_str ;
-        }""")
-        sparql = sparql_template.substitute(
-            prefix=build_prefixes(self.namespaces),
-            entity=entity_uri,
-            prop_uri=property_uri,
-            value_str=self.__value_format__(value))
-        update_request = urllib.request.Request(
-            entity_uri,
-            data=sparql.encode(),
-            method='PATCH',
-            headers={'Content-Type': 'application/sparql-update'})
+        subject_uri = entity_uri
+        if subject_uri.endswith("/fcr:metadata"):
+            subject_uri = subject_uri[:-len("/fcr:metadata")]
+        sparql = insert_data(self.namespaces,
+                             [(subject_uri, property_uri, value)])
         try:
-            response = urllib.request.urlopen(update_request)
+            try:
+                response = self.__patch__(entity_uri, sparql, etag)
+            except urllib.error.HTTPError as error:
+                if error.code in Repository.BINARY_PATCH_CODES and \
+                   entity_uri == subject_uri:
+                    entity_uri = "/".join([subject_uri, "fcr:metadata"])
+                    response = self.__patch__(entity_uri, sparql, etag)
+                elif error.code == 404 and etag is None:
+                    self.create(subject_uri, if_absent=True)
+                    response = self.__patch__(entity_uri, sparql)
+                else:
+                    raise
         except urllib.error.HTTPError:
             print("Error trying patch {}, sparql=\n{}".format(entity_uri,
                 sparql))
             return False
         if response.code < 400:
+            self.__invalidate__(property_uri, subject_uri)
+            self.__emit__('insert',
+                          subject_uri,
+                          added=[self.__triple__(subject_uri,
+                                                 property_uri,
+                                                 value)],
+                          etag=response.headers.get('ETag'))
             return True
         return False
 
+    def __patch__(self, uri, sparql, etag=None):
+        """Internal method sends a SPARQL update PATCH, conditional on etag
+        when one is given.
+
+        Args:
+            uri(str): URI to PATCH
+            sparql(str): SPARQL update
+            etag(str): ETag for an If-Match header, default is None
 
-    def read(self, uri):
+        Returns:
+            http.client.HTTPResponse
+        """
+        headers = {'Content-Type': 'application/sparql-update'}
+        if etag is not None:
+            headers['If-Match'] = etag
+        update_request = urllib.request.Request(
+            uri,
+            data=sparql.encode(),
+            method='PATCH',
+            headers=headers)
+        try:
+            return self.__urlopen__(update_request)
+        except urllib.error.HTTPError as error:
+            if error.code == 412:
+                raise PreconditionFailed(uri, etag)
+            raise
+
+    def read(self, uri, compact=False):
         """Method takes uri and creates a RDF graph from Fedora Repository
 
         Args:
             uri(str): URI of Fedora URI
+            compact(bool): Return a read-only CompactGraph that uses a
+                           fraction of the memory, default is False
 
         Returns:
-            rdflib.Graph
+            rdflib.Graph or CompactGraph
         """
-        read_response = self.connect(uri)
-        fedora_graph = rdflib.Graph().parse(
-            data=read_response.read(),
-            format='turtle')
+        if self.read_cache is not None:
+            # Cached as read-only CompactGraphs, callers wanting a mutable
+            # graph get their own copy
+            uri = str(uri)
+            cached = self.read_cache.get_or_load(
+                uri,
+                lambda: self.__read__(uri, compact=True))
+            if compact:
+                return cached
+            return cached.to_graph()
+        # Concurrent reads of the same uri and format share one request and
+        # parse, each waiter gets its own copy of a mutable graph
+        uri = str(uri)
+        if compact:
+            return self._flight.do(('read', uri, True),
+                                   self.__read__,
+                                   uri,
+                                   True)
+        return self._flight.do(('read', uri, False),
+                               self.__read__,
+                               uri,
+                               False,
+                               copy=__clone__)
+
+    def __read__(self, uri, compact=False):
+        """Internal method fetches and parses uri from Fedora. With the disk
+        cache a cached graph is revalidated with If-None-Match and only
+        fetched again when Fedora's ETag has changed. A CompactGraph is
+        parsed directly, without an intermediate rdflib.Graph, and keeps
+        the response's ETag.
+
+        Args:
+            uri(str): URI of Fedora URI
+            compact(bool): Return a CompactGraph, default is False
+
+        Returns:
+            rdflib.Graph or CompactGraph
+        """
+        import rdflib
+        from .graph import CompactGraph
+
+        def parse(data, format):
+            if compact:
+                return CompactGraph.parse(data, format)
+            return rdflib.Graph().parse(data=data, format=format)
+
+        cached, headers = None, None
+        if self.disk_cache is not None:
+            cached = self.disk_cache.get(uri)
+            if cached is not None:
+                headers = {'If-None-Match': cached[0]}
+        try:
+            read_response = self.connect(uri, headers=headers)
+        except urllib.error.HTTPError as error:
+            if error.code != 304 or cached is None:
+                raise
+            etag = cached[0]
+            fedora_graph = parse(cached[1], 'nt')
+        else:
+            etag = read_response.headers.get('ETag')
+            fedora_graph = parse(read_response.read(), 'turtle')
+            if self.disk_cache is not None and etag:
+                self.disk_cache.set(
+                    uri,
+                    etag,
+                    __text__(fedora_graph.serialize(format='nt')).encode())
+        if compact:
+            fedora_graph.etag = etag
         return fedora_graph
 
     def remove(self,
                entity_id,
                property_uri,
-               value):
+               value,
+               etag=None):
         """Method removes a triple for the given/subject.
 
         Args:
             entity_id(string): Fedora Object ID, ideally URI of the subject
             property_uri(string):
             value(string):
+            etag(str): Only apply if the entity still has this ETag, raising
+                       PreconditionFailed otherwise, default is None
 
         Return:
-            boolean: True if triple was removed from the object
+            boolean: True if triple was removed from the object, or a Future
+                     of the boolean in write-behind mode
         """
+        if self.write_behind is not None and \
+           not self.write_behind.in_worker():
+            return self.write_behind.submit(self.__entity_key__(entity_id),
+                                            self.remove,
+                                            entity_id,
+                                            property_uri,
+                                            value,
+                                            etag)
         if not entity_id.startswith("http"):
             entity_uri = urllib.parse.urljoin(self.base_url, entity_id)
         else:
             entity_uri = entity_id
-        sparql_template = Template("""$prefix
-        DELETE {
-            <$entity> $prop_name $value_str
-        } WHERE {
-            <$entity> $prop_name $value_str
-        }""")
-        sparql = sparql_template.substitute(
-            prefix=build_prefixes(self.namespaces),
-            entity=entity_uri,
-            prop_name=property_uri,
-            value_str=self.__value_format__(value))
-        delete_property_request = urllib.request.Request(
-            entity_uri,
-            data=sparql.encode(),
-            method='PATCH',
-            headers={'Content-Type': 'application/sparql-update'})
-        response = urllib.request.urlopen(delete_property_request)
+        sparql = delete_where(self.namespaces,
+                              [(entity_uri, property_uri, value)])
+        response = self.__patch__(entity_uri, sparql, etag)
         if response.code < 400:
+            self.__invalidate__(property_uri, entity_uri)
+            self.__emit__('remove',
+                          entity_uri,
+                          removed=[self.__triple__(entity_uri,
+                                                   property_uri,
+                                                   value)],
+                          etag=response.headers.get('ETag'))
             return True
         return False
 
@@ -465,7 +1542,8 @@ class Repository(object):
                 entity_id,
                 property_name,
                 old_value,
-                value):
+                value,
+                etag=None):
         """Method replaces a triple for the given entity/subject. Property
         name is from the schema.org vocabulary.
 
@@ -474,34 +1552,70 @@ class Repository(object):
             property_name(string): Prefix and property name i.e. schema:name
             old_value(string): Literal or URI of old value
             value(string): Literal or new value
+            etag(str): Only apply if the entity still has this ETag, raising
+                       PreconditionFailed otherwise, default is None
+
+        Returns:
+            boolean: True if the triple was replaced, or a Future of the
+                     boolean in write-behind mode
         """
+        if self.write_behind is not None and \
+           not self.write_behind.in_worker():
+            return self.write_behind.submit(self.__entity_key__(entity_id),
+                                            self.replace,
+                                            entity_id,
+                                            property_name,
+                                            old_value,
+                                            value,
+                                            etag)
         if not entity_id.startswith("http"):
             entity_uri = '/'.join([self.base_url, self.transaction, entity_id])
         else:
             entity_uri = entity_id
-        sparql_template = Template("""$prefix
-            DELETE {
-             <$entity> $prop_name $old_value
-            } INSERT {
-             <$entity> $prop_name $new_value
-            } WHERE {
-            }""")
-        sparql = sparql_template.substitute(
-            prefix=build_prefixes(self.namespaces),
-            entity=entity_uri,
-            prop_name=property_name,
-            old_value=self.__value_format__(old_value),
-            new_value=self.__value_format__(value))
-        update_request = urllib.request.Request(
-            entity_uri,
-            data=sparql.encode(),
-            method='PATCH',
-            headers={'Content-Type': 'application/sparql-update'})
-        response = urllib.request.urlopen(update_request)
+        sparql = delete_insert(self.namespaces,
+                               [(entity_uri, property_name, old_value)],
+                               [(entity_uri, property_name, value)])
+        response = self.__patch__(entity_uri, sparql, etag)
         if response.code < 400:
+            self.__invalidate__(property_name, entity_uri)
+            self.__emit__('replace',
+                          entity_uri,
+                          added=[self.__triple__(entity_uri,
+                                                 property_name,
+                                                 value)],
+                          removed=[self.__triple__(entity_uri,
+                                                   property_name,
+                                                   old_value)],
+                          etag=response.headers.get('ETag'))
             return True
         return False
 
+    def resource(self, uri):
+        """Method returns a lazily loaded FedoraResource for uri, nothing is
+        fetched until one of its properties is read.
+
+        Args:
+            uri(str): URI of the Fedora resource
+
+        Returns:
+            FedoraResource
+        """
+        from .resource import FedoraResource
+        return FedoraResource(self, uri)
+
+    def resources(self, uris):
+        """Method returns FedoraResources for uris, loading all of them
+        concurrently on the shared executor.
+
+        Args:
+            uris(iterable): URIs of Fedora resources
+
+        Returns:
+            list of FedoraResource
+        """
+        from .resource import FedoraResource
+        return FedoraResource.prefetch(self.resource(uri) for uri in uris)
+
     def search(self, query_term):
         """DEPRECIATED
         Method takes a query term and searches Fedora Repository using SPARQL
@@ -513,16 +1627,148 @@ class Repository(object):
         Returns:
             rdflib.Graph()
         """
+        if self.query_cache is not None:
+            key = ('search',
+                   normalize_statement(query_term),
+                   'fcr:search',
+                   'text/turtle')
+            # The cached graph is shared, each caller gets its own copy
+            return __clone__(self.query_cache.get_or_load(
+                key,
+                lambda: self.__search__(query_term)))
+        return self.__search__(query_term)
+
+    def search_page(self, query_term, offset=0, limit=20):
+        """Method returns one page of search results using the offset and
+        limit parameters of the Fedora search endpoint.
+
+        Args:
+            query_term(str): String to search repository
+            offset(int): Number of results to skip, defaults to 0
+            limit(int): Maximum results in the page, defaults to 20
+
+        Returns:
+            rdflib.Graph()
+        """
+        if self.query_cache is not None:
+            key = ('search',
+                   normalize_statement(query_term),
+                   'fcr:search',
+                   'text/turtle',
+                   offset,
+                   limit)
+            return __clone__(self.query_cache.get_or_load(
+                key,
+                lambda: self.__search__(query_term, offset, limit)))
+        return self.__search__(query_term, offset, limit)
+
+    def search_pages(self, query_term, page_size=20, offset=0):
+        """Method lazily yields search results a page at a time. While a
+        full page is being consumed the next one is fetched in the
+        background on the shared executor, and closing the generator early,
+        for example with itertools.islice, stops any further requests.
+
+        Args:
+            query_term(str): String to search repository
+            page_size(int): Results per request, defaults to 20
+            offset(int): Number of results to skip, defaults to 0
+
+        Yields:
+            tuple: List of hit URIs in the page and the page's rdflib.Graph
+        """
+        page = self.executor.submit(self.search_page,
+                                    query_term,
+                                    offset,
+                                    page_size)
+        try:
+            while page is not None:
+                graph = page.result()
+                hits = self.__search_hits__(graph)
+                page = None
+                if len(hits) >= page_size:
+                    offset += page_size
+                    page = self.executor.submit(self.search_page,
+                                                query_term,
+                                                offset,
+                                                page_size)
+                if hits:
+                    yield hits, graph
+        finally:
+            if page is not None:
+                page.cancel()
+
+    def iter_search(self, query_term, page_size=20, offset=0):
+        """Method lazily yields the URI of each search hit across pages, see
+        search_pages.
+
+        Args:
+            query_term(str): String to search repository
+            page_size(int): Results per request, defaults to 20
+            offset(int): Number of results to skip, defaults to 0
+
+        Yields:
+            rdflib.URIRef
+        """
+        pages = self.search_pages(query_term, page_size, offset)
+        try:
+            for hits, graph in pages:
+                for hit in hits:
+                    yield hit
+        finally:
+            pages.close()
+
+    def __search_hits__(self, graph):
+        """Internal method returns the hits in a page of search results, the
+        search:result objects when Fedora lists them, otherwise every
+        resource the page describes other than the search request itself.
+        Hits keep the order Fedora returned them in, which rdflib's memory
+        store preserves as the order the triples were parsed.
+
+        Args:
+            graph(rdflib.Graph): Page of search results
+
+        Returns:
+            list of rdflib.URIRef
+        """
+        import rdflib
+        hits = graph.objects(predicate=rdflib.URIRef(SEARCH_RESULT))
+        hits = list(OrderedDict.fromkeys(hits))
+        if not hits:
+            search_url = "/".join([self.base_url, 'rest', 'fcr:search'])
+            hits = list(OrderedDict.fromkeys(
+                subject for subject in graph.subjects()
+                if isinstance(subject, rdflib.URIRef) and
+                not str(subject).startswith(search_url)))
+        return hits
+
+    def __search__(self, query_term, offset=None, limit=None):
+        """Internal method executes a search against the Fedora Repository
+        SPARQL search endpoint, bypassing the query cache.
+
+        Args:
+            query_term(str): String to search repository
+            offset(int): Number of results to skip, default is None
+            limit(int): Maximum results, default is None
+
+        Returns:
+            rdflib.Graph()
+        """
+        import rdflib
         fedora_search_url = "/".join([self.base_url, 'rest', 'fcr:search'])
+        parameters = [("q", query_term)]
+        if offset is not None:
+            parameters.append(("offset", offset))
+        if limit is not None:
+            parameters.append(("limit", limit))
         fedora_search_url = "{}?{}".format(
             fedora_search_url,
-            urllib.parse.urlencode({"q": query_term}))
+            urllib.parse.urlencode(parameters))
         search_request = urllib.request.Request(
             fedora_search_url,
             method='GET')
         search_request.add_header('Accept', 'text/turtle')
         try:
-            search_response = urllib.request.urlopen(search_request)
+            search_response = self.__urlopen__(search_request)
         except urllib.error.URLError as error:
             raise error
         fedora_results = rdflib.Graph().parse(
@@ -547,15 +1793,59 @@ class Repository(object):
             result(string): Raw decoded string of the result from executing the
             SPARQL statement
         """
+        if self.query_cache is not None:
+            key = ('sparql',
+                   normalize_statement(statement),
+                   end_point,
+                   accept_format)
+            return self.query_cache.get_or_load(
+                key,
+                lambda: self.__sparql__(statement, end_point, accept_format),
+                statement_predicates(statement, self.namespaces))
+        return self.__sparql__(statement, end_point, accept_format)
+
+    def __sparql__(self, statement, end_point, accept_format):
+        """Internal method executes a SPARQL statement against Fedora,
+        bypassing the query cache.
+
+        Args:
+            statement(string): SPARQL statement
+            end_point(string): SPARQL URI end-point
+            accept_format(string): Format for output
+
+        Returns:
+            result(string): Raw decoded string of the result
+        """
         request = urllib.request.Request(
             '/'.join([self.base_url, 'rest', end_point]),
             data=statement.encode(),
             method='POST',
             headers={"Context-Type": "application/sparql-query",
                      "Accept": accept_format})
-        result = urllib.request.urlopen(request)
+        result = self.__urlopen__(request)
         return result.read().decode()
 
+    def query_cache_stats(self):
+        """Method returns hit and miss statistics for the sparql and search
+        result cache.
+
+        Returns:
+            dict: Statistics or None if the query cache is disabled
+        """
+        if self.query_cache is None:
+            return None
+        return self.query_cache.stats()
+
+    def concurrency_stats(self):
+        """Method returns the adaptive limiter's current limit, queue depth
+        and counters.
+
+        Returns:
+            dict: Statistics or None if adaptive concurrency is disabled
+        """
+        if self.limiter is None:
+            return None
+        return self.limiter.stats()
 
 
 
@@ -565,8 +1855,69 @@ class Repository(object):
         Args:
             exception: Exception
         """
+        # Clears the calling thread's session so it does not leak into the
+        # next request or app context handled by this thread
+        vars(self._local).clear()
         if self.app is not None:
             ctx = stack.top
 
 
 
+
+    def warm(self, root_uri, limit=None, progress=None):
+        """Method crawls containment from root_uri on the shared executor,
+        filling the read cache when it is enabled, the existence cache and
+        the identifier index used for deduplication, so a fresh process
+        does not start cold. With sharding the crawl only follows children
+        stored on the same node as their container.
+
+        Args:
+            root_uri(str): URI of the container to start from
+            limit(int): Maximum resources to visit, default is None
+            progress(callable): Called with the statistics after each level
+                                of the crawl, default is None
+
+        Returns:
+            dict: Count of warmed resources and identifiers with errors
+        """
+        import rdflib
+        from .export import CONTAINMENT_PREDICATES
+        stats = {'warmed': 0, 'identifiers': 0, 'errors': []}
+        seen, pending = set([str(root_uri)]), [str(root_uri)]
+
+        def __warm__(uri):
+            graph = self.read(uri, compact=True)
+            if self.existence_cache is not None:
+                self.existence_cache.set(uri, True)
+            subject = rdflib.URIRef(uri)
+            identifiers = self.id_index.add_graph(subject,
+                                                  graph,
+                                                  Repository.DEFAULT_ID_URIS)
+            children = []
+            for predicate in CONTAINMENT_PREDICATES:
+                children.extend(str(child) for child in graph.objects(
+                    subject,
+                    rdflib.URIRef(predicate)))
+            return identifiers, children
+
+        while pending:
+            if limit is not None:
+                pending = pending[:limit - stats['warmed']]
+            level, pending = pending, []
+            futures = [(uri, self.executor.submit(__warm__, uri))
+                       for uri in level]
+            for uri, future in futures:
+                try:
+                    identifiers, children = future.result()
+                except (urllib.error.URLError, ValueError) as error:
+                    stats['errors'].append([uri, str(error)])
+                    continue
+                stats['warmed'] += 1
+                stats['identifiers'] += identifiers
+                for child in children:
+                    if child not in seen:
+                        seen.add(child)
+                        pending.append(child)
+            if progress is not None:
+                progress(stats)
+        return stats
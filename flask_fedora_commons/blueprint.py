@@ -0,0 +1,93 @@
+"""
+ Flask blueprint serving Fedora Commons resources as Turtle, JSON-LD or HTML.
+ Fedora's ETag and Last-Modified headers are passed through and conditional
+ requests are forwarded to Fedora, so a 304 is answered without fetching or
+ parsing the resource's body.
+"""
+__author__ = "Jeremy Nelson"
+
+import urllib.error
+
+from flask import abort, Blueprint, current_app, make_response
+from flask import render_template, request
+
+# Response mimetypes in order of preference with their rdflib formats
+FORMATS = [('text/html', None),
+           ('text/turtle', 'turtle'),
+           ('application/ld+json', 'json-ld')]
+CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+VALIDATOR_HEADERS = ('ETag', 'Last-Modified')
+
+
+def __cache_headers__(response, fedora_headers):
+    """Internal function copies Fedora's validators onto response and sets
+    the Cache-Control and Vary headers"""
+    for name in VALIDATOR_HEADERS:
+        if fedora_headers.get(name):
+            response.headers[name] = fedora_headers.get(name)
+    response.headers['Cache-Control'] = current_app.config.get(
+        'FEDORA_CACHE_CONTROL',
+        'public, max-age=60')
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+def create_blueprint(repository, name='fedora', url_prefix='/fedora'):
+    """Function creates a blueprint serving resources stored under the
+    repository's rest endpoint.
+
+    Args:
+        repository(Repository): Repository to serve resources from
+        name(str): Blueprint name, defaults to fedora
+        url_prefix(str): URL prefix, defaults to /fedora
+
+    Returns:
+        flask.Blueprint
+    """
+    blueprint = Blueprint(name,
+                          __name__,
+                          template_folder='templates',
+                          url_prefix=url_prefix)
+
+    @blueprint.route('/<path:resource_path>')
+    def resource(resource_path):
+        "View returns a Fedora resource in the best accepted format"
+        mimetype = request.accept_mimetypes.best_match(
+            [row[0] for row in FORMATS],
+            default='text/turtle')
+        fedora_uri = "/".join([repository.base_url, 'rest', resource_path])
+        headers = {}
+        for header in CONDITIONAL_HEADERS:
+            if header in request.headers:
+                headers[header] = request.headers[header]
+        try:
+            fedora_response = repository.connect(fedora_uri,
+                                                 method='GET',
+                                                 headers=headers)
+        except urllib.error.HTTPError as error:
+            if error.code == 304:
+                return __cache_headers__(make_response('', 304),
+                                         error.headers)
+            abort(error.code)
+        import rdflib
+        graph = rdflib.Graph().parse(data=fedora_response.read(),
+                                     format='turtle')
+        if mimetype == 'text/html':
+            subject = rdflib.URIRef(fedora_uri)
+            body = render_template('fedora/resource.html',
+                                   graph=graph,
+                                   label=graph.value(subject=subject,
+                                                     predicate=rdflib.RDFS.label),
+                                   uri=subject)
+        elif mimetype == 'application/ld+json':
+            body = graph.serialize(format='json-ld',
+                                   context=dict(repository.namespaces))
+        else:
+            body = graph.serialize(format='turtle')
+        if isinstance(body, bytes):
+            body = body.decode()
+        response = make_response(body)
+        response.mimetype = mimetype
+        return __cache_headers__(response, fedora_response.headers)
+
+    return blueprint
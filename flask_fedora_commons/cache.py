@@ -0,0 +1,445 @@
+"""
+ Caching helpers for the Flask-FedoraCommons Repository, provides a thread
+ safe TTL and LRU cache for SPARQL and search results along with
+ single-flight coalescing of concurrent identical requests.
+"""
+__author__ = "Jeremy Nelson"
+
+import re
+import threading
+import time
+
+from collections import OrderedDict
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_IRI_RE = re.compile(r"<([^<>\s]+)>")
+_PREFIXED_RE = re.compile(r"(?<![\w<?$])([A-Za-z][\w-]*):([A-Za-z_][\w-]*)")
+_PREFIX_DECL_RE = re.compile(r"PREFIX\s+([\w-]*):\s*<([^<>\s]*)>", re.I)
+_VARIABLE_PREDICATE_RE = re.compile(
+    r"(?:[?$]\w+|<[^<>\s]*>|[\w-]*:[\w-]+|;)\s+[?$]\w+\s+[^\s.;}]")
+_RDF_TYPE_RE = re.compile(r"\sa\s")
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+
+
+def normalize_statement(statement):
+    """Function collapses runs of whitespace in a SPARQL statement or search
+    term so that trivially different statements share a cache entry.
+
+    Args:
+        statement(str): SPARQL statement or query term
+
+    Returns:
+        str
+    """
+    return _WHITESPACE_RE.sub(" ", statement).strip()
+
+
+def statement_predicates(statement, namespaces=None):
+    """Function returns the set of IRIs a SPARQL statement mentions, with
+    prefixed names expanded, so cached results can be invalidated by
+    predicate. Returns None when a triple pattern has a variable predicate
+    and the result could depend on any predicate.
+
+    Args:
+        statement(str): SPARQL statement
+        namespaces(list): List of prefix, namespace uri tuples
+
+    Returns:
+        set or None
+    """
+    if _VARIABLE_PREDICATE_RE.search(statement[statement.find("{") + 1:]):
+        return None
+    prefixes = dict(namespaces or [])
+    prefixes.update(_PREFIX_DECL_RE.findall(statement))
+    statement = _PREFIX_DECL_RE.sub("", statement)
+    predicates = set(_IRI_RE.findall(statement))
+    if _RDF_TYPE_RE.search(statement):
+        predicates.add(RDF_TYPE)
+    for prefix, local_name in _PREFIXED_RE.findall(statement):
+        if prefix in prefixes:
+            predicates.add("{}{}".format(prefixes[prefix], local_name))
+        else:
+            predicates.add("{}:{}".format(prefix, local_name))
+    return predicates
+
+
+class SingleFlight(object):
+    """Class coalesces concurrent calls for the same key so that only one
+    caller does the work and every waiter receives its result or exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function, *args, copy=None, **kwargs):
+        """Method calls function once per key for all concurrent callers
+
+        Args:
+            key: Hashable key identifying the call
+            function(callable): Function to call
+            copy(callable): Applied to the result for each waiter so that
+                            mutable results are not shared, default is None
+
+        Returns:
+            Result of function
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'event': threading.Event(),
+                        'result': None,
+                        'error': None}
+                self._calls[key] = call
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            if copy is not None:
+                return copy(call['result'])
+            return call['result']
+        try:
+            call['result'] = function(*args, **kwargs)
+        except BaseException as error:
+            call['error'] = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+        return call['result']
+
+
+class QueryCache(object):
+    """Class provides a thread-safe result cache with TTL expiry and LRU
+    eviction for the Repository's sparql and search methods.
+    """
+
+    def __init__(self, ttl=60, max_entries=1024):
+        """
+        Initializes a QueryCache object
+
+        Args:
+            ttl(int): Seconds before an entry expires, defaults to 60
+            max_entries(int): Maximum number of entries before least
+                              recently used are evicted, defaults to 1024
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # Bumped by every invalidation, so results loaded across one are
+        # not stored
+        self._generation = 0
+        self._lock = threading.RLock()
+        self._flight = SingleFlight()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        """Method returns a cached value or None, counting the hit or miss
+
+        Args:
+            key(tuple): Cache key
+
+        Returns:
+            Cached value or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['expires'] < time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry['value']
+
+    def set(self, key, value, predicates=None):
+        """Method stores a value, evicting least recently used entries
+
+        Args:
+            key(tuple): Cache key
+            value: Value to cache
+            predicates(set): Predicates the value depends on, None means the
+                             entry is invalidated by any write
+        """
+        with self._lock:
+            self._entries[key] = {
+                'expires': time.time() + self.ttl,
+                'predicates': predicates,
+                'value': value}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader, predicates=None):
+        """Method returns the cached value for key or calls loader, with
+        concurrent misses for the same key sharing a single loader call. A
+        value whose load overlapped an invalidation is returned but not
+        cached, and callers arriving after the invalidation start a new
+        load instead of sharing the one in flight.
+
+        Args:
+            key(tuple): Cache key
+            loader(callable): Function returning the value on a miss
+            predicates(set): Predicates the value depends on
+
+        Returns:
+            Cached or freshly loaded value
+        """
+        with self._lock:
+            value = self.get(key)
+            generation = self._generation
+        if value is not None:
+            return value
+
+        def __load__():
+            value = loader()
+            with self._lock:
+                if self._generation == generation:
+                    self.set(key, value, predicates)
+            return value
+        return self._flight.do((generation, key), __load__)
+
+    def invalidate(self, predicate=None):
+        """Method invalidates cached entries, all of them when predicate is
+        None, otherwise only entries that may depend on the predicate.
+
+        Args:
+            predicate(str): Predicate URI or prefixed name, default is None
+        """
+        with self._lock:
+            self._generation += 1
+            if predicate is None:
+                self._entries.clear()
+                return
+            predicate = str(predicate)
+            for key in list(self._entries.keys()):
+                depends_on = self._entries[key]['predicates']
+                if depends_on is None or predicate in depends_on:
+                    del self._entries[key]
+
+    def discard(self, key, tree=False):
+        """Method removes a single entry, or with tree every entry whose
+        string key is key or starts with key followed by a slash
+
+        Args:
+            key: Cache key
+            tree(bool): Also remove entries below key, default is False
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+            if tree:
+                prefix = str(key).rstrip("/") + "/"
+                for cached in [cached for cached in self._entries
+                               if str(cached).startswith(prefix)]:
+                    del self._entries[cached]
+
+    def stats(self):
+        """Method returns hit and miss statistics for the cache
+
+        Returns:
+            dict
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'evictions': self.evictions,
+                'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+                'hits': self.hits,
+                'misses': self.misses}
+
+
+class ExistenceCache(object):
+    """Class remembers recent positive and negative existence checks, each
+    with its own TTL, and is kept current by the Repository's own creates
+    and deletes.
+    """
+
+    def __init__(self, positive_ttl=30, negative_ttl=5, max_entries=100000):
+        """
+        Initializes an ExistenceCache object
+
+        Args:
+            positive_ttl(int): Seconds a resource is remembered as existing
+            negative_ttl(int): Seconds a resource is remembered as missing
+            max_entries(int): Maximum remembered resources
+        """
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, uri):
+        """Method returns True or False for a remembered resource, None when
+        it is unknown or expired
+
+        Args:
+            uri(str): Resource URI
+
+        Returns:
+            bool or None
+        """
+        with self._lock:
+            entry = self._entries.get(uri)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._entries[uri]
+                return None
+            return entry[0]
+
+    def set(self, uri, exists):
+        """Method remembers whether uri exists
+
+        Args:
+            uri(str): Resource URI
+            exists(bool): Result of the existence check
+        """
+        ttl = self.positive_ttl if exists else self.negative_ttl
+        with self._lock:
+            self._entries[uri] = (exists, time.time() + ttl)
+            self._entries.move_to_end(uri)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def remove_tree(self, uri):
+        """Method remembers uri as missing and forgets everything below it,
+        as deleting or moving a resource also removes its children
+
+        Args:
+            uri(str): Resource URI
+        """
+        prefix = uri.rstrip("/") + "/"
+        with self._lock:
+            for key in [key for key in self._entries
+                        if key.startswith(prefix)]:
+                del self._entries[key]
+        self.set(uri, False)
+
+
+class IdentifierIndex(object):
+    """Class maps identifying values, such as rdfs:label literals, to the
+    URI of the resource holding them so deduplication can skip the SPARQL
+    endpoint for resources this client already knows about.
+    """
+
+    def __init__(self, max_entries=1000000):
+        """
+        Initializes an IdentifierIndex object
+
+        Args:
+            max_entries(int): Maximum indexed values
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Resource URI to the keys indexed under it, so a write to one
+        # resource drops its entries without scanning the index
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __unlink__(self, key, uri):
+        """Internal method drops key from uri's keys, lock must be held"""
+        keys = self._keys.get(uri)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[uri]
+
+    def add(self, predicate, value, uri):
+        """Method indexes uri under a predicate and value
+
+        Args:
+            predicate(str): Identifying predicate URI
+            value(str): Identifying value
+            uri(str): Resource URI
+        """
+        key, uri = (str(predicate), str(value)), str(uri)
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self.__unlink__(key, previous)
+            self._entries[key] = uri
+            self._entries.move_to_end(key)
+            self._keys.setdefault(uri, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest, indexed = self._entries.popitem(last=False)
+                self.__unlink__(oldest, indexed)
+
+    def add_graph(self, subject, graph, predicates):
+        """Method indexes every value subject has for predicates
+
+        Args:
+            subject(rdflib.URIRef): Resource URI
+            graph(rdflib.Graph or CompactGraph): Resource graph
+            predicates(list): Identifying predicate URIs
+
+        Returns:
+            int: Number of values indexed
+        """
+        import rdflib
+        added = 0
+        for predicate in predicates:
+            for value in graph.objects(subject, rdflib.URIRef(predicate)):
+                self.add(predicate, value, subject)
+                added += 1
+        return added
+
+    def get(self, predicate, value):
+        """Method returns the URI indexed under predicate and value, a hint
+        to confirm against the resource since other clients may have
+        changed it
+
+        Args:
+            predicate(str): Identifying predicate URI
+            value(str): Identifying value
+
+        Returns:
+            str or None
+        """
+        with self._lock:
+            return self._entries.get((str(predicate), str(value)))
+
+    def discard(self, uri, tree=False):
+        """Method forgets the values indexed for uri, with tree also those of
+        every resource below it
+
+        Args:
+            uri(str): Resource URI
+            tree(bool): Also forget resources below uri, default is False
+        """
+        uri = str(uri)
+        prefix = uri.rstrip("/") + "/"
+        with self._lock:
+            if tree:
+                uris = [indexed for indexed in self._keys
+                        if indexed == uri or indexed.startswith(prefix)]
+            else:
+                uris = [uri] if uri in self._keys else []
+            for indexed in uris:
+                for key in self._keys.pop(indexed):
+                    del self._entries[key]
+
+    def remove_tree(self, uri):
+        """Method forgets uri and every resource below it
+
+        Args:
+            uri(str): Resource URI
+        """
+        self.discard(uri, tree=True)
@@ -0,0 +1,184 @@
+"""
+ Flask command line interface for operating a Fedora Commons Repository,
+ registered by Repository.init_app as the flask fedora command group.
+
+>> flask fedora warm http://localhost:8080/rest/works
+>> flask fedora load works.nt --workers 8
+>> flask fedora export http://localhost:8080/rest/works export/
+>> flask fedora probe --count 50
+"""
+__author__ = "Jeremy Nelson"
+
+import time
+import urllib.error
+import urllib.request
+
+import click
+
+from flask.cli import AppGroup
+
+
+class Progress(object):
+    """Class reports a running count and its throughput to stderr, at most
+    once per interval seconds.
+    """
+
+    def __init__(self, label, count, interval=1.0):
+        """
+        Initializes a Progress object
+
+        Args:
+            label(str): Name of the counted items
+            count(callable): Function returning the count from statistics
+            interval(float): Minimum seconds between reports
+        """
+        self.label = label
+        self.count = count
+        self.interval = interval
+        self.started = time.time()
+        self.reported = 0
+
+    def __call__(self, stats):
+        now = time.time()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            click.echo(self.line(stats), err=True)
+
+    def line(self, stats):
+        """Method formats the count and throughput so far
+
+        Args:
+            stats(dict): Statistics from the running operation
+
+        Returns:
+            str
+        """
+        count = self.count(stats)
+        elapsed = max(time.time() - self.started, 1e-6)
+        return "{} {} in {:.1f}s ({:.1f}/s)".format(count,
+                                                   self.label,
+                                                   elapsed,
+                                                   count / elapsed)
+
+
+def create_cli(repository, name='fedora'):
+    """Function creates the command group for a repository
+
+    Args:
+        repository(Repository): Repository the commands operate on
+        name(str): Name of the command group, defaults to fedora
+
+    Returns:
+        flask.cli.AppGroup
+    """
+    group = AppGroup(name, help="Fedora Commons repository commands.")
+
+    def __errors__(stats):
+        for uri, error in stats['errors'][:10]:
+            click.echo("  {}: {}".format(uri, error), err=True)
+        if len(stats['errors']) > 10:
+            click.echo("  ... {} more errors".format(
+                len(stats['errors']) - 10), err=True)
+
+    @group.command('warm')
+    @click.argument('root', required=False)
+    @click.option('--limit', type=int, default=None,
+                  help="Maximum resources to visit.")
+    def warm(root, limit):
+        """Crawls ROOT, default the rest endpoint, warming the caches."""
+        root = root or "/".join([repository.base_url, "rest"])
+        progress = Progress("resources warmed", lambda row: row['warmed'])
+        stats = repository.warm(root, limit=limit, progress=progress)
+        click.echo("{}, {} identifiers indexed, {} errors".format(
+            progress.line(stats),
+            stats['identifiers'],
+            len(stats['errors'])))
+        __errors__(stats)
+
+    @group.command('load')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--group-by', type=click.Choice(['subject', 'graph']),
+                  default='subject', help="How statements form objects.")
+    @click.option('--workers', type=int, default=4,
+                  help="Concurrent creates.")
+    @click.option('--window', type=int, default=None,
+                  help="Maximum creates in flight.")
+    def load(path, group_by, workers, window):
+        """Bulk loads a N-Triples or N-Quads dump at PATH."""
+        progress = Progress(
+            "objects",
+            lambda row: row['created'] + row['merged'] + row['skipped'] +
+            row['failed'])
+        stats = repository.import_dump(path,
+                                       group_by=group_by,
+                                       workers=workers,
+                                       window=window,
+                                       progress=progress)
+        click.echo("{}, {} created, {} merged, {} skipped, {} failed".format(
+            progress.line(stats),
+            stats['created'],
+            stats['merged'],
+            stats['skipped'],
+            stats['failed']))
+        __errors__(stats)
+
+    @group.command('export')
+    @click.argument('root')
+    @click.argument('path', type=click.Path(file_okay=False))
+    @click.option('--workers', type=int, default=4,
+                  help="Concurrent fetches.")
+    @click.option('--processes', type=int, default=None,
+                  help="Serializer processes, defaults to the CPU count.")
+    @click.option('--shard-size', type=int, default=500,
+                  help="Maximum resources per shard.")
+    def export(root, path, workers, processes, shard_size):
+        """Exports ROOT and everything it contains to N-Quads in PATH."""
+        progress = Progress("resources exported",
+                            lambda row: row['exported'])
+        stats = repository.export(root,
+                                  path,
+                                  workers=workers,
+                                  processes=processes,
+                                  shard_size=shard_size,
+                                  progress=progress)
+        click.echo("{}, {} shards, {} errors".format(
+            progress.line(stats),
+            stats['shards'],
+            len(stats['errors'])))
+        __errors__(stats)
+
+    @group.command('probe')
+    @click.option('--count', type=int, default=20,
+                  help="Number of requests.")
+    @click.option('--path', default='rest',
+                  help="Path below FEDORA_BASE_URL to request.")
+    def probe(count, path):
+        """Measures request latency against FEDORA_BASE_URL."""
+        url = "/".join([repository.base_url, path.lstrip("/")])
+        timings, errors = [], 0
+        for _ in range(count):
+            started = time.time()
+            try:
+                repository.__urlopen__(
+                    urllib.request.Request(url, method='HEAD'))
+            except (urllib.error.URLError, OSError):
+                errors += 1
+                continue
+            timings.append((time.time() - started) * 1000)
+        if not timings:
+            raise click.ClickException(
+                "{} failed {} of {} requests".format(url, errors, count))
+        timings.sort()
+        click.echo(
+            "{} {} requests, min {:.1f}ms, median {:.1f}ms, "
+            "p95 {:.1f}ms, max {:.1f}ms, {} errors".format(
+                url,
+                len(timings),
+                timings[0],
+                timings[len(timings) // 2],
+                timings[min(len(timings) - 1,
+                            int(len(timings) * 0.95))],
+                timings[-1],
+                errors))
+
+    return group
@@ -0,0 +1,218 @@
+"""
+ Compressed transfer support for Repository requests, gzip compression of
+ large request bodies and streaming gzip or deflate decoding of responses.
+"""
+__author__ = "Jeremy Nelson"
+
+import copy
+import gzip
+import io
+import zlib
+
+ACCEPT_ENCODING = "gzip, deflate"
+COMPRESSIBLE_METHODS = ('PATCH', 'POST', 'PUT')
+
+
+def compress_request(request, threshold):
+    """Function gzip compresses a urllib request's body in place when it is
+    larger than threshold bytes.
+
+    Args:
+        request(urllib.request.Request): Request to compress
+        threshold(int): Minimum body size in bytes to compress
+
+    Returns:
+        bytes: The original body if it was compressed, otherwise None
+    """
+    body = request.data
+    if not isinstance(body, bytes) or len(body) < threshold:
+        return None
+    if request.get_method().upper() not in COMPRESSIBLE_METHODS or \
+       request.has_header('Content-encoding'):
+        return None
+    request.data = gzip.compress(body)
+    request.add_header('Content-Encoding', 'gzip')
+    return body
+
+
+def decode_response(response):
+    """Function wraps a response with a gzip or deflate Content-Encoding in a
+    DecodedResponse, other responses are returned unchanged.
+
+    Args:
+        response(http.client.HTTPResponse): Response from urlopen
+
+    Returns:
+        http.client.HTTPResponse or DecodedResponse
+    """
+    encoding = (response.headers.get('Content-Encoding') or '').lower()
+    if encoding in ('gzip', 'x-gzip', 'deflate'):
+        return DecodedResponse(response, encoding)
+    return response
+
+
+class DecodedResponse(io.BufferedIOBase):
+    """Class decompresses a response body incrementally as it is read, with
+    the full binary file read interface, and otherwise behaves like the
+    wrapped response. Its headers describe the decoded body, without the
+    Content-Encoding and Content-Length of the compressed one.
+    """
+
+    def __init__(self, response, encoding):
+        """
+        Initializes a DecodedResponse object
+
+        Args:
+            response(http.client.HTTPResponse): Compressed response
+            encoding(str): gzip, x-gzip or deflate
+        """
+        super(DecodedResponse, self).__init__()
+        self._response = response
+        self._encoding = encoding
+        self._buffer = b''
+        self._eof = False
+        if encoding == 'deflate':
+            self._decoder = zlib.decompressobj()
+        else:
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._started = False
+        self.headers = copy.deepcopy(response.headers)
+        del self.headers['Content-Encoding']
+        del self.headers['Content-Length']
+        self.msg = self.headers
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __decode__(self, chunk):
+        """Internal method decompresses a chunk, falling back to raw deflate
+        for servers that omit the zlib header"""
+        if not self._started and self._encoding == 'deflate':
+            self._started = True
+            try:
+                return self._decoder.decompress(chunk)
+            except zlib.error:
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        self._started = True
+        return self._decoder.decompress(chunk)
+
+    def __fill__(self, size):
+        """Internal method decodes until the buffer holds size bytes or the
+        body is exhausted"""
+        while not self._eof and (size is None or len(self._buffer) < size):
+            chunk = self._response.read(None if size is None else
+                                        max(size, 16384))
+            if not chunk:
+                self._buffer += self._decoder.flush()
+                self._eof = True
+            else:
+                self._buffer += self.__decode__(chunk)
+
+    def close(self):
+        """Method closes the wrapped response"""
+        self._response.close()
+        super(DecodedResponse, self).close()
+
+    def getheader(self, name, default=None):
+        """Method returns a decoded response header, joining repeated values
+
+        Args:
+            name(str): Header name
+            default: Returned when the header is missing, default is None
+
+        Returns:
+            str
+        """
+        values = self.headers.get_all(name)
+        if values is None:
+            return default
+        return ', '.join(values)
+
+    def getheaders(self):
+        """Method returns the decoded response's header name, value tuples
+
+        Returns:
+            list
+        """
+        return list(self.headers.items())
+
+    def info(self):
+        """Method returns the decoded response's headers
+
+        Returns:
+            http.client.HTTPMessage
+        """
+        return self.headers
+
+    def peek(self, size=0):
+        """Method returns decompressed bytes without consuming them, at
+        least one byte unless the body is exhausted
+
+        Args:
+            size(int): Ignored, as for io.BufferedReader.peek
+
+        Returns:
+            bytes
+        """
+        self.__fill__(1)
+        return self._buffer
+
+    def readable(self):
+        return True
+
+    def read(self, amt=None):
+        """Method returns up to amt decompressed bytes, or the rest of the
+        body when amt is None
+
+        Args:
+            amt(int): Maximum bytes to return, default is None
+
+        Returns:
+            bytes
+        """
+        if amt is not None and amt < 0:
+            amt = None
+        self.__fill__(amt)
+        if amt is None:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def read1(self, size=-1):
+        """Method returns up to size decompressed bytes, reading at most
+        once from the wrapped response
+
+        Args:
+            size(int): Maximum bytes to return, default is -1 for as many
+                       as are available
+
+        Returns:
+            bytes
+        """
+        if not self._buffer:
+            self.__fill__(1)
+        if size is None or size < 0:
+            size = len(self._buffer)
+        return self.read(min(size, len(self._buffer)))
+
+    def readline(self, size=-1):
+        """Method returns the next decompressed line
+
+        Args:
+            size(int): Maximum bytes to return, default is -1 for no limit
+
+        Returns:
+            bytes
+        """
+        if size is None or size < 0:
+            size = None
+        while b'\n' not in self._buffer and not self._eof and \
+              (size is None or len(self._buffer) < size):
+            self.__fill__(len(self._buffer) + 16384)
+        position = self._buffer.find(b'\n')
+        if position < 0:
+            return self.read(size)
+        if size is not None:
+            return self.read(min(position + 1, size))
+        return self.read(position + 1)
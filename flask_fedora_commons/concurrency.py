@@ -0,0 +1,157 @@
+"""
+ Adaptive concurrency control for Repository requests. An AdaptiveLimiter
+ bounds the requests in flight to Fedora Commons, raising the bound
+ additively while responses are healthy and at least half the limit is in
+ use, and cutting it multiplicatively on overload errors or latency spikes
+ (AIMD).
+"""
+__author__ = "Jeremy Nelson"
+
+import threading
+import time
+
+# HTTP status codes signalling an overloaded server rather than a bad request
+OVERLOAD_CODES = (429, 502, 503, 504)
+
+
+class AdaptiveLimiter(object):
+    """Class provides a thread-safe AIMD limit on concurrent requests shared
+    by every thread and worker pool using a Repository.
+    """
+
+    def __init__(self,
+                 initial=8,
+                 minimum=1,
+                 maximum=64,
+                 backoff=0.5,
+                 latency_tolerance=2.0,
+                 latency_floor=0.05,
+                 smoothing=0.1):
+        """
+        Initializes an AdaptiveLimiter object
+
+        Args:
+            initial(int): Starting limit, defaults to 8
+            minimum(int): Lowest limit, defaults to 1
+            maximum(int): Highest limit, defaults to 64
+            backoff(float): Factor the limit is multiplied by on overload,
+                            defaults to 0.5
+            latency_tolerance(float): A response slower than this multiple
+                                      of the baseline latency counts as a
+                                      spike, defaults to 2.0
+            latency_floor(float): Seconds below which a response is never
+                                  a spike, defaults to 0.05
+            smoothing(float): Weight of each response in the moving
+                              baseline latency, defaults to 0.1
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.latency_floor = latency_floor
+        self.smoothing = smoothing
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self.queued = 0
+        self.baseline = None
+        self.successes = 0
+        self.failures = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Method blocks until a request may start
+
+        Returns:
+            float: Start time to pass to release
+        """
+        with self._condition:
+            self.queued += 1
+            try:
+                while self.in_flight >= int(self.limit):
+                    self._condition.wait()
+            finally:
+                self.queued -= 1
+            self.in_flight += 1
+        return time.time()
+
+    def release(self, started, overloaded=False):
+        """Method ends a request, adjusting the limit from its outcome
+
+        Args:
+            started(float): Start time returned by acquire
+            overloaded(bool): The request failed with a timeout, connection
+                              error or overload status, default is False
+        """
+        latency = time.time() - started
+        with self._condition:
+            # Requests in flight alongside this one, including it
+            busy = self.in_flight
+            self.in_flight -= 1
+            spike = self.baseline is not None and \
+                latency > self.latency_floor and \
+                latency > self.baseline * self.latency_tolerance
+            if overloaded or spike:
+                self.failures += 1
+                # Requests started before the last cut reflect the old
+                # limit, so a burst of them only cuts once
+                if started > self._last_decrease:
+                    self.limit = max(float(self.minimum),
+                                     self.limit * self.backoff)
+                    self._last_decrease = time.time()
+                    self.decreases += 1
+            else:
+                self.successes += 1
+                # About one more slot per limit's worth of successes, only
+                # while at least half the limit is in use, so a quiet
+                # period does not raise it to let a full burst through
+                if busy * 2 >= int(self.limit):
+                    self.limit = min(float(self.maximum),
+                                     self.limit + 1.0 / self.limit)
+            if not overloaded:
+                if self.baseline is None:
+                    self.baseline = latency
+                else:
+                    self.baseline += self.smoothing * (latency - self.baseline)
+            self._condition.notify_all()
+
+    def call(self, function, *args, **kwargs):
+        """Method runs function within the limit, treating timeouts,
+        connection errors and overload statuses as overload
+
+        Args:
+            function(callable): Function making one request
+
+        Returns:
+            Result of function
+        """
+        started = self.acquire()
+        overloaded = False
+        try:
+            return function(*args, **kwargs)
+        except OSError as error:
+            # urllib's HTTPError, URLError and socket timeouts are OSErrors
+            code = getattr(error, 'code', None)
+            overloaded = code is None or code in OVERLOAD_CODES
+            raise
+        finally:
+            self.release(started, overloaded)
+
+    def stats(self):
+        """Method returns the limiter's current limit, queue depth and
+        counters
+
+        Returns:
+            dict
+        """
+        with self._condition:
+            return {
+                'baseline_ms': None if self.baseline is None else
+                               self.baseline * 1000,
+                'decreases': self.decreases,
+                'failures': self.failures,
+                'in_flight': self.in_flight,
+                'limit': int(self.limit),
+                'queued': self.queued,
+                'successes': self.successes}
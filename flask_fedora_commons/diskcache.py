@@ -0,0 +1,198 @@
+"""
+ Persistent on-disk tier for Repository.read() results. Graphs are kept as
+ zlib compressed N-Triples in a SQLite database in WAL mode, keyed by URI
+ with the ETag Fedora sent, so several processes can share the cache and a
+ cached graph is revalidated with a conditional GET instead of refetched.
+"""
+__author__ = "Jeremy Nelson"
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS graphs (
+        uri TEXT PRIMARY KEY,
+        etag TEXT NOT NULL,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        accessed REAL NOT NULL)""",
+    "CREATE INDEX IF NOT EXISTS graphs_accessed ON graphs (accessed)",
+    """CREATE TABLE IF NOT EXISTS totals (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL)""",
+    "INSERT OR IGNORE INTO totals (name, value) VALUES ('bytes', 0)")
+
+
+class DiskGraphCache(object):
+    """Class stores serialized graphs with their ETags in a SQLite file
+    shared by every thread and process pointing at the same path, evicting
+    least recently used graphs above a size cap.
+    """
+
+    def __init__(self, path, max_bytes=268435456, touch_interval=60):
+        """
+        Initializes a DiskGraphCache object
+
+        Args:
+            path(str): SQLite database file, created if missing
+            max_bytes(int): Maximum compressed bytes stored, defaults to
+                            256 MiB
+            touch_interval(int): Seconds between recording accesses of the
+                                 same graph, which limits writes on reads,
+                                 defaults to 60
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with self.__connection__() as connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+    def __connection__(self):
+        """Internal method returns the calling thread's connection, opening
+        a new one in threads and forked processes without one"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path,
+                                         timeout=30,
+                                         isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, uri):
+        """Method returns the cached ETag and N-Triples for uri
+
+        Args:
+            uri(str): Resource URI
+
+        Returns:
+            tuple: ETag and N-Triples bytes, or None when not cached
+        """
+        connection = self.__connection__()
+        row = connection.execute(
+            "SELECT etag, data, accessed FROM graphs WHERE uri = ?",
+            (uri,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        now = time.time()
+        if now - row[2] > self.touch_interval:
+            connection.execute(
+                "UPDATE graphs SET accessed = ? WHERE uri = ?",
+                (now, uri))
+        return row[0], zlib.decompress(row[1])
+
+    def set(self, uri, etag, ntriples):
+        """Method stores a graph's N-Triples under uri and etag, then evicts
+        least recently used graphs while the cache is over max_bytes
+
+        Args:
+            uri(str): Resource URI
+            etag(str): ETag Fedora sent with the graph
+            ntriples(bytes): N-Triples serialization
+        """
+        data = zlib.compress(ntriples)
+        if len(data) > self.max_bytes:
+            return
+        connection = self.__connection__()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            previous = connection.execute(
+                "SELECT size FROM graphs WHERE uri = ?",
+                (uri,)).fetchone()
+            connection.execute(
+                """INSERT OR REPLACE INTO graphs
+                   (uri, etag, data, size, accessed)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (uri, etag, data, len(data), time.time()))
+            total = self.__adjust__(
+                connection,
+                len(data) - (previous[0] if previous else 0))
+            while total > self.max_bytes:
+                oldest = connection.execute(
+                    """SELECT uri, size FROM graphs
+                       ORDER BY accessed LIMIT 64""").fetchall()
+                if not oldest:
+                    break
+                for oldest_uri, size in oldest:
+                    if total <= self.max_bytes:
+                        break
+                    connection.execute("DELETE FROM graphs WHERE uri = ?",
+                                       (oldest_uri,))
+                    total = self.__adjust__(connection, -size)
+                    self.evictions += 1
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def __adjust__(self, connection, delta):
+        """Internal method adjusts and returns the stored byte total inside
+        the caller's transaction"""
+        connection.execute(
+            "UPDATE totals SET value = value + ? WHERE name = 'bytes'",
+            (delta,))
+        return connection.execute(
+            "SELECT value FROM totals WHERE name = 'bytes'").fetchone()[0]
+
+    def discard(self, uri, tree=False):
+        """Method removes the graph for uri, with tree also every graph below
+        uri
+
+        Args:
+            uri(str): Resource URI
+            tree(bool): Also remove graphs below uri, default is False
+        """
+        prefix = uri.rstrip("/") + "/"
+        connection = self.__connection__()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if tree:
+                where, args = ("uri = ? OR substr(uri, 1, ?) = ?",
+                               (uri, len(prefix), prefix))
+            else:
+                where, args = "uri = ?", (uri,)
+            removed = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM graphs WHERE " + where,
+                args).fetchone()[0]
+            if removed:
+                connection.execute("DELETE FROM graphs WHERE " + where, args)
+                self.__adjust__(connection, -removed)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def stats(self):
+        """Method returns the cache's size and this process's hit counts
+
+        Returns:
+            dict
+        """
+        connection = self.__connection__()
+        entries = connection.execute(
+            "SELECT COUNT(*) FROM graphs").fetchone()[0]
+        stored = connection.execute(
+            "SELECT value FROM totals WHERE name = 'bytes'").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'bytes': stored,
+            'entries': entries,
+            'evictions': self.evictions,
+            'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+            'hits': self.hits,
+            'misses': self.misses}
@@ -0,0 +1,212 @@
+"""
+ Parallel export of a Fedora Commons containment tree to sharded, gzip
+ compressed N-Quads files, one named graph per resource. Resources are
+ fetched with a thread pool and parsed and serialized in a process pool.
+ The checkpoint holds only the pending frontier and counters, the URIs
+ already discovered are appended to a log so each shard costs I/O in
+ proportion to its own resources.
+"""
+__author__ = "Jeremy Nelson"
+
+import gzip
+import json
+import os
+import urllib.error
+
+from concurrent.futures import as_completed, ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
+CHECKPOINT_NAME = "checkpoint.json"
+SEEN_NAME = "seen.txt"
+CONTAINMENT_PREDICATES = (
+    'http://fedora.info/definitions/v4/repository#hasChild',
+    'http://www.w3.org/ns/ldp#contains')
+
+
+def resource_to_nquads(uri, data):
+    """Function parses a resource's Turtle and serializes it as N-Quads in a
+    named graph for the resource, run in a worker process.
+
+    Args:
+        uri(str): Resource URI, used as the graph name
+        data(bytes): Turtle representation of the resource
+
+    Returns:
+        tuple: N-Quads bytes and list of contained child URIs
+    """
+    import rdflib
+    dataset = rdflib.Dataset()
+    graph = dataset.graph(rdflib.URIRef(uri))
+    graph.parse(data=data, format='turtle', publicID=uri)
+    children = []
+    for predicate in CONTAINMENT_PREDICATES:
+        children.extend(
+            str(child) for child in graph.objects(
+                subject=rdflib.URIRef(uri),
+                predicate=rdflib.URIRef(predicate)))
+    nquads = dataset.serialize(format='nquads')
+    if isinstance(nquads, str):
+        nquads = nquads.encode()
+    return nquads, children
+
+
+class Exporter(object):
+    """Class crawls containment from a root resource and writes every
+    resource to numbered export-NNNNN.nq.gz shards, checkpointing after each
+    shard so an interrupted export can resume. Discovered URIs are appended
+    to seen.txt and the checkpoint records the log's length, so a log
+    written past the last checkpoint is truncated on resume.
+    """
+
+    def __init__(self,
+                 repository,
+                 path,
+                 workers=4,
+                 processes=None,
+                 shard_size=500,
+                 progress=None):
+        """
+        Initializes an Exporter object
+
+        Args:
+            repository(Repository): Repository to export from
+            path(str): Directory for shards and the checkpoint
+            workers(int): Number of concurrent fetches, defaults to 4
+            processes(int): Number of serializer processes, defaults to the
+                            number of CPUs
+            shard_size(int): Maximum resources per shard, defaults to 500
+            progress(callable): Called with the crawl state after each
+                                shard, default is None
+        """
+        self.repository = repository
+        self.path = path
+        self.workers = workers
+        self.processes = processes
+        self.shard_size = shard_size
+        self.progress = progress
+        self.checkpoint_path = os.path.join(path, CHECKPOINT_NAME)
+        self.seen_path = os.path.join(path, SEEN_NAME)
+
+    def __fetch__(self, uri):
+        """Internal method retrieves the Turtle representation of a
+        resource"""
+        return self.repository.connect(uri).read()
+
+    def __load_checkpoint__(self, root_uri):
+        """Internal method returns saved crawl state for root_uri or a new
+        crawl starting at root_uri"""
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as checkpoint_file:
+                state = json.load(checkpoint_file)
+            if state['root'] == root_uri:
+                return state
+        return {'root': root_uri,
+                'pending': [root_uri],
+                'seen': [root_uri],
+                'seen_bytes': 0,
+                'next_shard': 0,
+                'exported': 0,
+                'errors': []}
+
+    def __load_seen__(self, state):
+        """Internal method returns the set of URIs logged as seen up to the
+        checkpoint, moving a seen list from the checkpoint into the log"""
+        seen = set()
+        with open(self.seen_path, 'a+b') as log:
+            log.truncate(state.get('seen_bytes', 0))
+            log.seek(0)
+            for line in log:
+                seen.add(line.decode().rstrip("\n"))
+        listed = state.pop('seen', None)
+        if listed:
+            self.__log_seen__(state, [uri for uri in listed
+                                      if uri not in seen])
+            seen.update(listed)
+        return seen
+
+    def __log_seen__(self, state, uris):
+        """Internal method appends newly seen URIs to the log and records
+        its length in state"""
+        with open(self.seen_path, 'ab') as log:
+            log.write("".join(uri + "\n" for uri in uris).encode())
+            log.flush()
+            os.fsync(log.fileno())
+            state['seen_bytes'] = log.tell()
+
+    def __save_checkpoint__(self, state):
+        """Internal method atomically replaces the checkpoint file"""
+        temp_path = "{}.tmp".format(self.checkpoint_path)
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump(state, checkpoint_file)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def __write_shard__(self, number, chunks):
+        """Internal method atomically writes one gzip N-Quads shard"""
+        shard_path = os.path.join(
+            self.path,
+            "export-{:05d}.nq.gz".format(number))
+        temp_path = "{}.tmp".format(shard_path)
+        with gzip.open(temp_path, 'wb') as shard:
+            for chunk in chunks:
+                shard.write(chunk)
+        os.replace(temp_path, shard_path)
+        return shard_path
+
+    def run(self, root_uri):
+        """Method exports root_uri and every resource it contains
+
+        Args:
+            root_uri(str): URI of the root of the subtree
+
+        Returns:
+            dict: Export statistics with exported count, shards and errors
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        state = self.__load_checkpoint__(root_uri)
+        seen = self.__load_seen__(state)
+        with ThreadPoolExecutor(max_workers=self.workers) as fetchers, \
+             ProcessPoolExecutor(max_workers=self.processes) as serializers:
+            while state['pending']:
+                batch = state['pending'][:self.shard_size]
+                pending = state['pending'][self.shard_size:]
+                fetches = {fetchers.submit(self.__fetch__, uri): uri
+                           for uri in batch}
+                serializing = {}
+                for future in as_completed(fetches):
+                    uri = fetches[future]
+                    try:
+                        data = future.result()
+                    except urllib.error.URLError as error:
+                        state['errors'].append([uri, str(error)])
+                        continue
+                    serializing[serializers.submit(
+                        resource_to_nquads,
+                        uri,
+                        data)] = uri
+                chunks, discovered = [], []
+                for future in as_completed(serializing):
+                    uri = serializing[future]
+                    try:
+                        nquads, children = future.result()
+                    except Exception as error:
+                        state['errors'].append([uri, str(error)])
+                        continue
+                    chunks.append(nquads)
+                    for child in children:
+                        if child not in seen:
+                            seen.add(child)
+                            discovered.append(child)
+                            pending.append(child)
+                if chunks:
+                    self.__write_shard__(state['next_shard'], chunks)
+                    state['next_shard'] += 1
+                state['exported'] += len(chunks)
+                state['pending'] = pending
+                self.__log_seen__(state, discovered)
+                self.__save_checkpoint__(state)
+                if self.progress is not None:
+                    self.progress(state)
+        return {'exported': state['exported'],
+                'shards': state['next_shard'],
+                'errors': state['errors']}
@@ -0,0 +1,138 @@
+"""
+ Streaming fixity for binary uploads. Digests are computed while the body is
+ read by urllib during the upload and compared against the message digests
+ Fedora Commons records, so verification never downloads the binary again.
+"""
+__author__ = "Jeremy Nelson"
+
+import hashlib
+import io
+import os
+
+ALGORITHMS = ('sha1', 'sha256', 'md5')
+PREMIS = 'http://www.loc.gov/premis/rdf/v1#'
+
+
+class FixityError(ValueError):
+    """Exception raised when Fedora's digest for a binary does not match the
+    digest computed during upload"""
+
+    def __init__(self, uri, algorithm, expected, actual):
+        self.uri = uri
+        self.algorithm = algorithm
+        self.expected = expected
+        self.actual = actual
+        super(FixityError, self).__init__(
+            "{} {} mismatch, uploaded {} but Fedora has {}".format(
+                uri,
+                algorithm,
+                expected,
+                actual))
+
+
+class DigestingReader(object):
+    """Class wraps bytes or a file-like object and updates each digest with
+    every chunk read from it.
+    """
+
+    def __init__(self, source, algorithms=ALGORITHMS):
+        """
+        Initializes a DigestingReader object
+
+        Args:
+            source(bytes or file): Binary content
+            algorithms(tuple): hashlib algorithm names, defaults to SHA-1,
+                               SHA-256 and MD5
+        """
+        self.length = None
+        if isinstance(source, (bytes, bytearray)):
+            self.length = len(source)
+            source = io.BytesIO(source)
+        elif hasattr(source, 'fileno'):
+            try:
+                self.length = os.fstat(source.fileno()).st_size - \
+                    source.tell()
+            except (OSError, io.UnsupportedOperation):
+                self.length = None
+        self.source = source
+        self.digests = dict((name, hashlib.new(name)) for name in algorithms)
+
+    def read(self, amt=-1):
+        """Method reads a chunk from the source, updating the digests
+
+        Args:
+            amt(int): Maximum bytes to read, defaults to the rest
+
+        Returns:
+            bytes
+        """
+        chunk = self.source.read(amt)
+        for digest in self.digests.values():
+            digest.update(chunk)
+        return chunk
+
+    def hexdigests(self):
+        """Method returns the hex digest of everything read so far for each
+        algorithm
+
+        Returns:
+            dict
+        """
+        return dict((name, digest.hexdigest())
+                    for name, digest in self.digests.items())
+
+
+def digest_header(digests):
+    """Function formats digests as a Digest request header value, with hex
+    encoded values as expected by Fedora 4
+
+    Args:
+        digests(dict): Hex digests keyed by algorithm name
+
+    Returns:
+        str
+    """
+    return ", ".join("{}={}".format(name, value)
+                     for name, value in sorted(digests.items()))
+
+
+def recorded_digests(graph):
+    """Function collects the premis:hasMessageDigest values from a binary's
+    fcr:metadata or fcr:fixity graph, which are urn:<algorithm>:<hex> URIs
+
+    Args:
+        graph(rdflib.Graph): Metadata or fixity graph
+
+    Returns:
+        dict: Hex digests keyed by algorithm name
+    """
+    import rdflib
+    digests = {}
+    for digest in graph.objects(
+            predicate=rdflib.URIRef(PREMIS + 'hasMessageDigest')):
+        parts = str(digest).split(':')
+        if len(parts) == 3 and parts[0] == 'urn':
+            algorithm = parts[1].lower().replace('-', '')
+            digests[algorithm] = parts[2].lower()
+    return digests
+
+
+def compare_digests(uri, computed, recorded):
+    """Function raises FixityError if any algorithm both sides know differs
+
+    Args:
+        uri(str): Binary URI
+        computed(dict): Digests computed during upload
+        recorded(dict): Digests recorded by Fedora
+
+    Returns:
+        list: Algorithms that were compared
+    """
+    compared = []
+    for algorithm, value in sorted(computed.items()):
+        if algorithm not in recorded:
+            continue
+        if recorded[algorithm] != value.lower():
+            raise FixityError(uri, algorithm, value, recorded[algorithm])
+        compared.append(algorithm)
+    return compared
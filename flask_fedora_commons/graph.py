@@ -0,0 +1,273 @@
+"""
+ Compact read-only graph for large Fedora Commons read results. Terms are
+ interned once and triples are held as three parallel integer arrays, with
+ subject and predicate indexes built only when a lookup first needs them.
+"""
+__author__ = "Jeremy Nelson"
+
+import rdflib
+
+from array import array
+from rdflib.store import Store
+
+
+class _TripleSink(Store):
+    """Class is a write-only rdflib store that hands each parsed triple to
+    a CompactGraph, so parsing skips rdflib's in-memory indexes"""
+
+    def __init__(self, graph):
+        super(_TripleSink, self).__init__()
+        self.graph = graph
+        self.bindings = {}
+        self.seen = set()
+
+    def add(self, triple, context, quoted=False):
+        # Graphs are sets, a statement repeated in the data is kept once
+        if triple not in self.seen:
+            self.seen.add(triple)
+            self.graph.__append__(triple)
+
+    def bind(self, prefix, namespace, override=True, replace=False):
+        self.bindings[prefix] = namespace
+
+    def namespace(self, prefix):
+        return self.bindings.get(prefix)
+
+    def prefix(self, namespace):
+        for prefix, uri in self.bindings.items():
+            if uri == namespace:
+                return prefix
+
+    def namespaces(self):
+        return iter(list(self.bindings.items()))
+
+
+class CompactGraph(object):
+    """Class provides a read-only subset of the rdflib.Graph API over an
+    interned, array-backed triple store.
+    """
+    __slots__ = ('_terms',
+                 '_ids',
+                 '_subjects',
+                 '_predicates',
+                 '_objects',
+                 '_by_subject',
+                 '_by_predicate',
+                 'namespaces',
+                 'etag')
+
+    def __init__(self, triples=(), namespaces=()):
+        """
+        Initializes a CompactGraph object
+
+        Args:
+            triples(iterable): Iterable of subject, predicate, object tuples
+            namespaces(iterable): Iterable of prefix, namespace uri tuples
+        """
+        self._terms = []
+        self._ids = {}
+        self._subjects = array('L')
+        self._predicates = array('L')
+        self._objects = array('L')
+        self._by_subject = None
+        self._by_predicate = None
+        self.namespaces = tuple(namespaces)
+        # ETag of the Fedora response the graph was read from, if any
+        self.etag = None
+        for triple in triples:
+            self.__append__(triple)
+
+    @classmethod
+    def from_graph(cls, graph):
+        """Method builds a CompactGraph from an existing rdflib.Graph
+
+        Args:
+            graph(rdflib.Graph): A rdflib.Graph
+
+        Returns:
+            CompactGraph
+        """
+        return cls(graph, [(prefix, str(uri))
+                           for prefix, uri in graph.namespaces()])
+
+    @classmethod
+    def parse(cls, data, format='turtle'):
+        """Method parses a serialized graph straight into a CompactGraph,
+        without building a rdflib.Graph first
+
+        Args:
+            data(str or bytes): Serialized graph
+            format(str): rdflib parser name, defaults to turtle
+
+        Returns:
+            CompactGraph
+        """
+        compact = cls()
+        sink = _TripleSink(compact)
+        rdflib.Graph(store=sink).parse(data=data, format=format)
+        compact.namespaces = tuple((prefix, str(uri))
+                                   for prefix, uri in sink.namespaces())
+        return compact
+
+    def __append__(self, triple):
+        """Internal method adds a subject, predicate, object tuple"""
+        subject, predicate, object_ = triple
+        self._subjects.append(self.__intern__(subject))
+        self._predicates.append(self.__intern__(predicate))
+        self._objects.append(self.__intern__(object_))
+
+    def __intern__(self, term):
+        """Internal method returns the integer id of term, adding it to the
+        term table if needed."""
+        term_id = self._ids.get(term)
+        if term_id is None:
+            term_id = len(self._terms)
+            self._terms.append(term)
+            self._ids[term] = term_id
+        return term_id
+
+    def __build_index__(self, column):
+        """Internal method lazily builds a mapping of term id to row
+        positions for the subject or predicate column."""
+        index = {}
+        for row, term_id in enumerate(column):
+            index.setdefault(term_id, array('L')).append(row)
+        return index
+
+    def __rows__(self, subject, predicate):
+        """Internal method returns candidate row positions for a pattern,
+        using the narrowest lazily built index available."""
+        if subject is not None:
+            subject_id = self._ids.get(subject)
+            if subject_id is None:
+                return ()
+            if self._by_subject is None:
+                self._by_subject = self.__build_index__(self._subjects)
+            return self._by_subject.get(subject_id, ())
+        if predicate is not None:
+            predicate_id = self._ids.get(predicate)
+            if predicate_id is None:
+                return ()
+            if self._by_predicate is None:
+                self._by_predicate = self.__build_index__(self._predicates)
+            return self._by_predicate.get(predicate_id, ())
+        return range(len(self._subjects))
+
+    def __len__(self):
+        return len(self._subjects)
+
+    def __iter__(self):
+        return self.triples((None, None, None))
+
+    def __contains__(self, triple):
+        for _ in self.triples(triple):
+            return True
+        return False
+
+    def triples(self, pattern):
+        """Method yields triples matching a subject, predicate, object
+        pattern where None matches any term
+
+        Args:
+            pattern(tuple): Subject, predicate, object tuple
+
+        Returns:
+            generator of triples
+        """
+        subject, predicate, object_ = pattern
+        predicate_id = object_id = None
+        if predicate is not None:
+            predicate_id = self._ids.get(predicate)
+            if predicate_id is None:
+                return
+        if object_ is not None:
+            object_id = self._ids.get(object_)
+            if object_id is None:
+                return
+        terms = self._terms
+        for row in self.__rows__(subject, predicate):
+            if predicate_id is not None and \
+               self._predicates[row] != predicate_id:
+                continue
+            if object_id is not None and self._objects[row] != object_id:
+                continue
+            yield (terms[self._subjects[row]],
+                   terms[self._predicates[row]],
+                   terms[self._objects[row]])
+
+    def objects(self, subject=None, predicate=None):
+        """Method yields objects for a subject and predicate
+
+        Args:
+            subject(rdflib.URIRef): Subject, default is None
+            predicate(rdflib.URIRef): Predicate, default is None
+
+        Returns:
+            generator of rdflib terms
+        """
+        for triple in self.triples((subject, predicate, None)):
+            yield triple[2]
+
+    def subjects(self, predicate=None, object=None):
+        """Method yields subjects for a predicate and object
+
+        Args:
+            predicate(rdflib.URIRef): Predicate, default is None
+            object(rdflib.term.Node): Object, default is None
+
+        Returns:
+            generator of rdflib terms
+        """
+        for triple in self.triples((None, predicate, object)):
+            yield triple[0]
+
+    def predicate_objects(self, subject=None):
+        """Method yields predicate, object tuples for a subject
+
+        Args:
+            subject(rdflib.URIRef): Subject, default is None
+
+        Returns:
+            generator of tuples
+        """
+        for triple in self.triples((subject, None, None)):
+            yield triple[1], triple[2]
+
+    def value(self, subject=None, predicate=None, object=None, default=None):
+        """Method returns the first missing term of a triple pattern, mirrors
+        rdflib.Graph.value
+
+        Args:
+            subject(rdflib.URIRef): Subject, default is None
+            predicate(rdflib.URIRef): Predicate, default is None
+            object(rdflib.term.Node): Object, default is None
+            default: Value returned when nothing matches
+
+        Returns:
+            rdflib term or default
+        """
+        for triple in self.triples((subject, predicate, object)):
+            if subject is None:
+                return triple[0]
+            if predicate is None:
+                return triple[1]
+            return triple[2]
+        return default
+
+    def to_graph(self):
+        """Method returns a mutable rdflib.Graph copy of this graph
+
+        Returns:
+            rdflib.Graph
+        """
+        graph = rdflib.Graph()
+        for prefix, uri in self.namespaces:
+            graph.bind(prefix, uri)
+        for triple in self:
+            graph.add(triple)
+        return graph
+
+    def serialize(self, *args, **kwargs):
+        """Method serializes the graph by way of rdflib.Graph.serialize,
+        taking the same arguments."""
+        return self.to_graph().serialize(*args, **kwargs)
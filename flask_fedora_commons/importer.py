@@ -0,0 +1,204 @@
+"""
+ Bulk import of N-Triples and N-Quads dumps into Fedora Commons. The dump is
+ read through a memory map one line at a time and consecutive lines sharing
+ a subject (or graph for N-Quads) are handed to Repository.create on a
+ thread pool with a bounded number of creates in flight. A subject that
+ reappears later in the dump is merged into the object already created, and
+ blank nodes are skolemized into IRIs so their statements become objects
+ too. Graph groups keep each statement's own subject, the graph resource is
+ created empty and the statements are merged into it as they are.
+"""
+__author__ = "Jeremy Nelson"
+
+import mmap
+import re
+import uuid
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+_TERM_RE = re.compile(
+    rb'<[^>]*>'
+    rb'|_:\S+'
+    rb'|"(?:[^"\\]|\\.)*"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?')
+
+
+def split_statement(line):
+    """Function splits one N-Triples or N-Quads line into its terms without
+    parsing them.
+
+    Args:
+        line(bytes): Line from the dump
+
+    Returns:
+        list: Three or four term byte strings, empty for blank and comment
+              lines
+    """
+    line = line.strip()
+    if not line or line.startswith(b'#'):
+        return []
+    return _TERM_RE.findall(line)
+
+
+def __key__(term):
+    """Internal function returns an IRI term without its angle brackets,
+    blank node labels are returned unchanged."""
+    term = term.decode()
+    if term.startswith('<'):
+        return term[1:-1]
+    return term
+
+
+def iter_groups(path, group_by='subject', skolem=None):
+    """Function streams a dump and yields each run of consecutive statements
+    that share a subject or graph name. A key that reappears later in the
+    file is yielded again as a separate group, so dumps not clustered by
+    key yield it several times.
+
+    Args:
+        path(str): Path to the N-Triples or N-Quads file
+        group_by(str): subject or graph, defaults to subject
+        skolem(str): IRI prefix blank node labels are appended to, default
+                     is None which keeps blank nodes
+
+    Returns:
+        generator of (key, N-Triples bytes) tuples
+    """
+    if skolem is not None:
+        skolem = b'<' + skolem.encode()
+    with open(path, 'rb') as dump:
+        try:
+            source = mmap.mmap(dump.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be memory mapped
+            return
+        try:
+            current_key, lines = None, []
+            for line in iter(source.readline, b''):
+                terms = split_statement(line)
+                if len(terms) < 3:
+                    continue
+                if skolem is not None:
+                    terms = [skolem + term[2:] + b'>'
+                             if term.startswith(b'_:') else term
+                             for term in terms]
+                if group_by == 'graph':
+                    key = terms[3] if len(terms) > 3 else terms[0]
+                else:
+                    key = terms[0]
+                if key != current_key and lines:
+                    yield __key__(current_key), b''.join(lines)
+                    lines = []
+                current_key = key
+                lines.append(b' '.join(terms[:3]) + b' .\n')
+            if lines:
+                yield __key__(current_key), b''.join(lines)
+        finally:
+            source.close()
+
+
+def import_dump(repository,
+                path,
+                group_by='subject',
+                workers=4,
+                window=None,
+                progress=None,
+                skolem=None):
+    """Function creates one Fedora object per group of statements in a dump,
+    keeping at most window creates in flight. Later groups for a key already
+    created are merged into its object once the create has finished, so
+    the keys seen are kept in memory for the whole import.
+
+    Args:
+        repository(Repository): Repository to create objects in
+        path(str): Path to the N-Triples or N-Quads file
+        group_by(str): subject or graph, defaults to subject
+        workers(int): Number of concurrent creates, defaults to 4
+        window(int): Maximum queued creates, defaults to twice workers
+        progress(callable): Called with the statistics as creates finish,
+                            default is None
+        skolem(str): IRI prefix for blank nodes, defaults to a new container
+                     below rest/genid for this import
+
+    Returns:
+        dict: Count of created, merged, skipped and failed groups with
+              errors
+    """
+    import rdflib
+    window = window or workers * 2
+    if skolem is None:
+        skolem = "/".join([repository.base_url,
+                           "rest",
+                           "genid",
+                           uuid.uuid4().hex,
+                           ""])
+    stats = {'created': 0,
+             'merged': 0,
+             'skipped': 0,
+             'failed': 0,
+             'errors': []}
+
+    def __create__(uri, data):
+        graph = rdflib.Graph().parse(data=data, format='nt')
+        if group_by != 'graph':
+            return repository.create(uri=uri, graph=graph)
+        # create copies a graph onto its uri, which would move every
+        # subject of the named graph onto the graph's name
+        if repository.create(uri=uri, if_absent=True) is None:
+            return None
+        __merge__(uri, data, graph)
+        return uri
+
+    def __merge__(uri, data, graph=None):
+        if graph is None:
+            graph = rdflib.Graph().parse(data=data, format='nt')
+        if not repository.merge(uri, graph):
+            raise ValueError("Fedora rejected the merge")
+
+    def __collect__(done):
+        for future in done:
+            uri, merge = in_flight.pop(future)
+            try:
+                outcome = future.result()
+            except Exception as error:
+                outcome = 'failed'
+                stats['errors'].append([uri, str(error)])
+            else:
+                if merge:
+                    outcome = 'merged'
+                elif outcome is None:
+                    outcome = 'skipped'
+                else:
+                    outcome = 'created'
+            stats[outcome] += 1
+            if not merge:
+                outcomes[uri] = outcome
+        if progress is not None:
+            progress(stats)
+
+    # Key to the future of its create, then to the create's outcome
+    outcomes = {}
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for uri, data in iter_groups(path, group_by, skolem):
+            if len(in_flight) >= window:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                __collect__(done)
+            previous = outcomes.get(uri)
+            if previous is None:
+                future = executor.submit(__create__, uri, data)
+                in_flight[future] = (uri, False)
+                outcomes[uri] = future
+                continue
+            if previous in in_flight:
+                # The merge has to follow the create of the first group
+                __collect__(wait([previous])[0])
+                previous = outcomes[uri]
+            if previous == 'created':
+                in_flight[executor.submit(__merge__, uri, data)] = (uri, True)
+            else:
+                stats[previous] += 1
+                if previous == 'failed':
+                    stats['errors'].append(
+                        [uri, "Not merged, creating its first group failed"])
+        __collect__(wait(in_flight)[0])
+    return stats
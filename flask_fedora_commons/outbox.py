@@ -0,0 +1,263 @@
+"""
+ In-process outbox of change events for downstream indexers. Each
+ successful Repository write emits an event with the resource URI, the
+ triple delta and the new ETag, and every sink receives the events in
+ batches from its own background thread, retrying until delivery succeeds.
+"""
+__author__ = "Jeremy Nelson"
+
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+
+def change_event(event_type,
+                 uri,
+                 added=None,
+                 removed=None,
+                 etag=None,
+                 destination=None):
+    """Function builds a JSON serializable change event
+
+    Args:
+        event_type(str): create, insert, remove, replace, update, delete,
+                         copy or move
+        uri(str): URI of the changed resource
+        added(list): Added subject, predicate, object triples in N3
+        removed(list): Removed subject, predicate, object triples in N3
+        etag(str): The resource's ETag after the write, default is None
+        destination(str): New URI for copy and move, default is None
+
+    Returns:
+        dict
+    """
+    event = {'id': uuid.uuid4().hex,
+             'type': event_type,
+             'uri': str(uri),
+             'added': [list(triple) for triple in added or []],
+             'removed': [list(triple) for triple in removed or []],
+             'etag': etag,
+             'timestamp': time.time()}
+    if destination is not None:
+        event['destination'] = str(destination)
+    return event
+
+
+class CallbackSink(object):
+    """Class delivers each batch of events to a function"""
+
+    def __init__(self, function):
+        """
+        Initializes a CallbackSink object
+
+        Args:
+            function(callable): Called with a list of events, raising
+                                makes the batch be retried
+        """
+        self.function = function
+
+    def deliver(self, events):
+        """Method delivers a batch of events
+
+        Args:
+            events(list): Change events
+        """
+        self.function(events)
+
+
+class FileSink(object):
+    """Class appends each event as a line of JSON to a local file, synced to
+    disk before the batch counts as delivered"""
+
+    def __init__(self, path):
+        """
+        Initializes a FileSink object
+
+        Args:
+            path(str): JSON lines file, created if missing
+        """
+        self.path = path
+
+    def deliver(self, events):
+        """Method delivers a batch of events
+
+        Args:
+            events(list): Change events
+        """
+        with open(self.path, 'a') as events_file:
+            for event in events:
+                events_file.write(json.dumps(event, sort_keys=True) + "\n")
+            events_file.flush()
+            os.fsync(events_file.fileno())
+
+
+class QueueSink(object):
+    """Class puts each event on a queue, such as a queue.Queue or a
+    multiprocessing.Queue read by an indexer"""
+
+    def __init__(self, target, timeout=None):
+        """
+        Initializes a QueueSink object
+
+        Args:
+            target: Object with a put method
+            timeout(float): Seconds to wait on a full queue before the batch
+                            is retried, default is None which waits forever
+        """
+        self.target = target
+        self.timeout = timeout
+
+    def deliver(self, events):
+        """Method delivers a batch of events
+
+        Args:
+            events(list): Change events
+        """
+        for event in events:
+            self.target.put(event, timeout=self.timeout)
+
+
+class Outbox(object):
+    """Class fans events out to sinks, each with a background thread that
+    delivers batches of up to batch_size events at least every
+    flush_interval seconds. A failed batch is retried with exponential
+    backoff until the sink accepts it, so events are delivered at least
+    once and in order to every sink, and one failing sink does not hold
+    up the others.
+    """
+
+    def __init__(self,
+                 sinks=(),
+                 batch_size=100,
+                 flush_interval=1.0,
+                 retry_delay=0.5,
+                 max_retry_delay=30.0,
+                 maxsize=10000):
+        """
+        Initializes an Outbox object
+
+        Args:
+            sinks(iterable): Objects with a deliver(events) method
+            batch_size(int): Maximum events per delivery, defaults to 100
+            flush_interval(float): Maximum seconds an event waits for its
+                                   batch to fill, defaults to 1.0
+            retry_delay(float): Seconds before the first retry, doubled on
+                                each failure, defaults to 0.5
+            max_retry_delay(float): Longest wait between retries, defaults
+                                    to 30
+            maxsize(int): Maximum undelivered events per sink, emit blocks
+                          when a sink is this far behind, defaults to 10000
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.maxsize = maxsize
+        self.delivered = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._sinks = []
+        for sink in sinks:
+            self.add_sink(sink)
+
+    def add_sink(self, sink):
+        """Method starts delivering events emitted from now on to sink
+
+        Args:
+            sink: Object with a deliver(events) method
+        """
+        events = queue.Queue(self.maxsize)
+        thread = threading.Thread(target=self.__deliver__,
+                                  args=(sink, events))
+        thread.daemon = True
+        with self._lock:
+            self._sinks.append((sink, events, thread))
+        thread.start()
+
+    def emit(self, event):
+        """Method queues an event for every sink
+
+        Args:
+            event(dict): Change event, see change_event
+        """
+        with self._lock:
+            sinks = list(self._sinks)
+        for sink, events, thread in sinks:
+            events.put(event)
+
+    def __batch__(self, events):
+        """Internal method blocks for the next event then collects more
+        until the batch is full or flush_interval has passed"""
+        batch = [events.get()]
+        deadline = time.time() + self.flush_interval
+        while batch[-1] is not None and len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(events.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def __deliver__(self, sink, events):
+        """Internal method run by each sink's thread"""
+        while True:
+            batch = self.__batch__(events)
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            delay = self.retry_delay
+            while batch:
+                try:
+                    sink.deliver(batch)
+                except Exception as error:
+                    with self._lock:
+                        self.failures += 1
+                    print("Error delivering {} events to {}: {}".format(
+                        len(batch),
+                        sink,
+                        error))
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.max_retry_delay)
+                    continue
+                with self._lock:
+                    self.delivered += len(batch)
+                break
+            for _ in range(len(batch) + (1 if stop else 0)):
+                events.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """Method blocks until every emitted event has been delivered to
+        every sink"""
+        with self._lock:
+            sinks = list(self._sinks)
+        for sink, events, thread in sinks:
+            events.join()
+
+    def close(self):
+        """Method delivers the remaining events and stops the sink threads"""
+        with self._lock:
+            sinks, self._sinks = self._sinks, []
+        for sink, events, thread in sinks:
+            events.put(None)
+        for sink, events, thread in sinks:
+            thread.join()
+
+    def stats(self):
+        """Method returns delivery counters and the events waiting for each
+        sink
+
+        Returns:
+            dict
+        """
+        with self._lock:
+            return {'delivered': self.delivered,
+                    'failures': self.failures,
+                    'pending': [events.qsize()
+                                for sink, events, thread in self._sinks]}
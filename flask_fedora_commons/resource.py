@@ -0,0 +1,229 @@
+"""
+ Lazy-loading object model over a Fedora Commons Repository. A resource's
+ graph is fetched on first property access, local changes are tracked and
+ save() sends them as one conditional SPARQL update.
+"""
+__author__ = "Jeremy Nelson"
+
+
+class FedoraResource(object):
+    """Class wraps a single Fedora resource with lazily loaded properties
+    addressed by prefixed name (schema:name) or full URI.
+    """
+    __slots__ = ('repository',
+                 'uri',
+                 'etag',
+                 '_graph',
+                 '_added',
+                 '_removed')
+
+    def __init__(self, repository, uri):
+        """
+        Initializes a FedoraResource object, nothing is fetched until a
+        property is read
+
+        Args:
+            repository(Repository): Repository holding the resource
+            uri(str): URI of the resource
+        """
+        self.repository = repository
+        self.uri = str(uri)
+        self.etag = None
+        self._graph = None
+        self._added = set()
+        self._removed = set()
+
+    def __repr__(self):
+        return "<FedoraResource {}>".format(self.uri)
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def __setitem__(self, name, value):
+        self.set(name, value)
+
+    @classmethod
+    def prefetch(cls, resources):
+        """Method loads every unloaded resource concurrently on each
+        repository's shared executor
+
+        Args:
+            resources(iterable): FedoraResource objects
+
+        Returns:
+            list: The resources
+        """
+        resources = list(resources)
+        futures = [resource.repository.executor.submit(resource.load)
+                   for resource in resources if not resource.loaded]
+        for future in futures:
+            future.result()
+        return resources
+
+    @property
+    def loaded(self):
+        """True once the resource's graph has been fetched"""
+        return self._graph is not None
+
+    @property
+    def dirty(self):
+        """True when there are unsaved changes"""
+        return bool(self._added or self._removed)
+
+    def load(self):
+        """Method reads the resource's graph as a compact read-only graph
+        through the repository's caches, along with its ETag
+
+        Returns:
+            FedoraResource
+        """
+        self._graph = self.repository.read(self.uri, compact=True)
+        self.etag = self._graph.etag
+        return self
+
+    def __predicate__(self, name):
+        """Internal method returns a prefixed name or URI as a URIRef"""
+        import rdflib
+        return rdflib.URIRef(self.repository.__expand__(name))
+
+    def __term__(self, value):
+        """Internal method converts a value to a rdflib term, strings that
+        start with http become URIs and all others literals, matching
+        Repository.insert"""
+        import rdflib
+        if isinstance(value, rdflib.term.Identifier):
+            return value
+        if isinstance(value, str) and value.startswith("http"):
+            return rdflib.URIRef(value)
+        return rdflib.Literal(value)
+
+    def get(self, name):
+        """Method returns the current values of a property, including
+        unsaved changes
+
+        Args:
+            name(str): Prefixed name or URI of the property
+
+        Returns:
+            list of rdflib terms
+        """
+        import rdflib
+        if self._graph is None:
+            self.load()
+        predicate = self.__predicate__(name)
+        values = [value for value in self._graph.objects(
+            rdflib.URIRef(self.uri),
+            predicate) if (predicate, value) not in self._removed]
+        values.extend(value for (added_predicate, value) in self._added
+                      if added_predicate == predicate and value not in values)
+        return values
+
+    def value(self, name, default=None):
+        """Method returns one value of a property
+
+        Args:
+            name(str): Prefixed name or URI of the property
+            default: Returned when the property has no value
+
+        Returns:
+            rdflib term or default
+        """
+        values = self.get(name)
+        if values:
+            return values[0]
+        return default
+
+    def add(self, name, value):
+        """Method adds a value to a property
+
+        Args:
+            name(str): Prefixed name or URI of the property
+            value: rdflib term, URI string or literal value
+        """
+        change = (self.__predicate__(name), self.__term__(value))
+        if change in self._removed:
+            self._removed.discard(change)
+        else:
+            self._added.add(change)
+
+    def remove(self, name, value):
+        """Method removes a value from a property
+
+        Args:
+            name(str): Prefixed name or URI of the property
+            value: rdflib term, URI string or literal value
+        """
+        change = (self.__predicate__(name), self.__term__(value))
+        if change in self._added:
+            self._added.discard(change)
+        else:
+            self._removed.add(change)
+
+    def set(self, name, value):
+        """Method replaces every value of a property with value
+
+        Args:
+            name(str): Prefixed name or URI of the property
+            value: rdflib term, URI string or literal value
+        """
+        for current in self.get(name):
+            self.remove(name, current)
+        self.add(name, value)
+
+    def sparql(self):
+        """Method returns the SPARQL update for the unsaved changes
+
+        Returns:
+            str
+        """
+        subject = "<{}>".format(self.uri)
+        statements = []
+        if self._removed:
+            statements.append("DELETE DATA {{\n{}}}".format("".join(
+                "{} {} {} .\n".format(subject, predicate.n3(), value.n3())
+                for predicate, value in sorted(self._removed))))
+        if self._added:
+            statements.append("INSERT DATA {{\n{}}}".format("".join(
+                "{} {} {} .\n".format(subject, predicate.n3(), value.n3())
+                for predicate, value in sorted(self._added))))
+        return " ;\n".join(statements)
+
+    def save(self):
+        """Method sends the unsaved changes as one SPARQL PATCH, conditional
+        on the ETag the resource was loaded with
+
+        Returns:
+            boolean: True if changes were saved, False if there were none
+        """
+        import rdflib
+        from .graph import CompactGraph
+        if not self.dirty:
+            return False
+        response = self.repository.__patch__(self.uri,
+                                             self.sparql(),
+                                             self.etag)
+        self.etag = response.headers.get('ETag')
+        subject = "<{}>".format(self.uri)
+        self.repository.__emit__(
+            'update',
+            self.uri,
+            added=[(subject, predicate.n3(), value.n3())
+                   for predicate, value in sorted(self._added)],
+            removed=[(subject, predicate.n3(), value.n3())
+                     for predicate, value in sorted(self._removed)],
+            etag=self.etag)
+        if self._graph is not None:
+            subject = rdflib.URIRef(self.uri)
+            removed = set((subject, predicate, value)
+                          for predicate, value in self._removed)
+            triples = [triple for triple in self._graph
+                       if triple not in removed]
+            triples.extend((subject, predicate, value)
+                           for predicate, value in self._added)
+            self._graph = CompactGraph(triples, self._graph.namespaces)
+        self.repository.__forget__(self.uri)
+        for predicate in set(row[0] for row in self._added | self._removed):
+            self.repository.__invalidate__(predicate)
+        self._added.clear()
+        self._removed.clear()
+        return True
@@ -0,0 +1,284 @@
+"""
+ Routing of Repository requests across several Fedora Commons nodes. Reads
+ are balanced over healthy replicas, writes go to a pinned primary, or with
+ sharding each resource path is owned by one node on a consistent hash ring.
+
+ Replicas are eventually consistent, a read balanced onto one may not see
+ a write the primary has just taken. For read_your_writes seconds after
+ this process writes a resource, reads of it and of its parent container go
+ to the primary, other processes and older writes may still read stale
+ replicas. A read that fails to connect or gets a 5xx answer is retried on
+ the next healthy node. With sharding there is only one copy of each path,
+ so reads are not retried, and COPY and MOVE must stay on one node.
+ Containment is not sharded, a container only lists the children stored on
+ its own node, so crawls from a container such as Repository.warm, export
+ and flush only reach resources on the container's node. Repository.create
+ mints identifiers client side so a new object lands on the node that owns
+ its path.
+"""
+__author__ = "Jeremy Nelson"
+
+import bisect
+import hashlib
+import itertools
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from collections import OrderedDict
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class Router(object):
+    """Class rewrites request URLs from the canonical base URL to the node
+    that should serve them.
+    """
+
+    def __init__(self,
+                 endpoints,
+                 primary=None,
+                 shard=False,
+                 virtual_nodes=64,
+                 health_interval=30,
+                 health_timeout=2,
+                 read_your_writes=5,
+                 max_written=10000):
+        """
+        Initializes a Router object
+
+        Args:
+            endpoints(list): Base URLs of the Fedora nodes
+            primary(str): Base URL used for writes and as the canonical base
+                          URL, defaults to the first endpoint
+            shard(bool): Partition resource paths across the nodes with a
+                         consistent hash ring, default is False
+            virtual_nodes(int): Ring points per node, defaults to 64
+            health_interval(int): Seconds a node's health is trusted before
+                                  it is checked again, defaults to 30
+            health_timeout(int): Seconds to wait on a health check
+            read_your_writes(float): Seconds reads of a resource this
+                                     process wrote go to the primary,
+                                     defaults to 5, 0 disables
+            max_written(int): Maximum recently written paths remembered
+        """
+        self.endpoints = [endpoint.rstrip("/") for endpoint in endpoints]
+        self.primary = (primary or self.endpoints[0]).rstrip("/")
+        if self.primary not in self.endpoints:
+            self.endpoints.insert(0, self.primary)
+        self.shard = shard
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.read_your_writes = read_your_writes
+        self.max_written = max_written
+        self._health = {}
+        self._written = OrderedDict()
+        self._lock = threading.Lock()
+        self._replicas = itertools.cycle(self.endpoints)
+        self._ring = []
+        for endpoint in self.endpoints:
+            for point in range(virtual_nodes):
+                self._ring.append((self.__ring_hash__(
+                    "{}#{}".format(endpoint, point)), endpoint))
+        self._ring.sort()
+        self._ring_keys = [row[0] for row in self._ring]
+
+    def __ring_hash__(self, value):
+        """Internal method returns a stable integer hash of a string"""
+        return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+    def __split__(self, url):
+        """Internal method splits url into the endpoint it starts with and
+        the remaining path, or None when url is not on any endpoint"""
+        for endpoint in self.endpoints:
+            if url == endpoint or url.startswith(endpoint + "/"):
+                return endpoint, url[len(endpoint):]
+        return None, url
+
+    def check(self, endpoint):
+        """Method returns True if endpoint answered its last health check,
+        re-checking with a HEAD request once the result is stale
+
+        Args:
+            endpoint(str): Base URL of a node
+
+        Returns:
+            bool
+        """
+        with self._lock:
+            healthy, checked = self._health.get(endpoint, (True, 0))
+        if time.time() - checked < self.health_interval:
+            return healthy
+        try:
+            urllib.request.urlopen(
+                urllib.request.Request("{}/rest".format(endpoint),
+                                       method='HEAD'),
+                timeout=self.health_timeout)
+            healthy = True
+        except urllib.error.HTTPError as error:
+            healthy = error.code < 500
+        except (urllib.error.URLError, OSError):
+            healthy = False
+        with self._lock:
+            self._health[endpoint] = (healthy, time.time())
+        return healthy
+
+    def mark_down(self, endpoint):
+        """Method records a failed request so endpoint is skipped until its
+        next health check
+
+        Args:
+            endpoint(str): Base URL of a node
+        """
+        with self._lock:
+            self._health[endpoint] = (False, time.time())
+
+    def __resource_path__(self, path):
+        """Internal method strips query strings and fcr: endpoints from a
+        path"""
+        return path.split("?")[0].split("/fcr:")[0].rstrip("/") or "/"
+
+    def written(self, url):
+        """Method records a write to url so reads of it and its parent
+        container go to the primary for read_your_writes seconds
+
+        Args:
+            url(str): Request URL on any of the endpoints
+        """
+        endpoint, path = self.__split__(url)
+        if endpoint is None or not self.read_your_writes:
+            return
+        path = self.__resource_path__(path)
+        now = time.time()
+        with self._lock:
+            for written in (path, path.rsplit("/", 1)[0] or "/"):
+                self._written.pop(written, None)
+                self._written[written] = now
+            while self._written:
+                oldest, at = next(iter(self._written.items()))
+                if len(self._written) <= self.max_written and \
+                   now - at < self.read_your_writes:
+                    break
+                del self._written[oldest]
+
+    def __recently_written__(self, path):
+        """Internal method returns True if this process wrote path within
+        read_your_writes seconds"""
+        if not self.read_your_writes:
+            return False
+        with self._lock:
+            at = self._written.get(self.__resource_path__(path))
+        return at is not None and time.time() - at < self.read_your_writes
+
+    def node_for(self, path):
+        """Method returns the node owning path on the hash ring
+
+        Args:
+            path(str): Resource path relative to the base URL
+
+        Returns:
+            str: Base URL of the node
+        """
+        position = bisect.bisect(self._ring_keys, self.__ring_hash__(path))
+        return self._ring[position % len(self._ring)][1]
+
+    def route(self, url, method='GET', exclude=()):
+        """Method returns the node and rewritten URL for a request
+
+        Args:
+            url(str): Request URL on any of the endpoints
+            method(str): HTTP method, defaults to GET
+            exclude(iterable): Nodes a read should not be balanced onto,
+                               such as ones that just failed it
+
+        Returns:
+            tuple: Base URL of the chosen node and the rewritten URL, the
+                   node is None for URLs outside the endpoints
+        """
+        endpoint, path = self.__split__(url)
+        if endpoint is None:
+            return None, url
+        if self.shard:
+            node = self.node_for(path.split("/fcr:")[0] or "/")
+        elif method.upper() in READ_METHODS:
+            node = self.primary
+            if self.primary in exclude or \
+               not self.__recently_written__(path):
+                for _ in range(len(self.endpoints)):
+                    with self._lock:
+                        candidate = next(self._replicas)
+                    if candidate not in exclude and self.check(candidate):
+                        node = candidate
+                        break
+        else:
+            node = self.primary
+        return node, node + path
+
+    def __destination__(self, request, node):
+        """Internal method rewrites a COPY or MOVE Destination on any
+        endpoint to the canonical base URL the node answers for, raising
+        ValueError when sharding puts it on another node"""
+        destination = request.get_header('Destination')
+        if destination is None:
+            return
+        endpoint, path = self.__split__(destination)
+        if endpoint is None:
+            return
+        if self.shard and self.node_for(path.split("/fcr:")[0] or "/") != \
+           node:
+            raise ValueError(
+                "{} to {} crosses shards, COPY and MOVE must stay on one "
+                "node".format(request.full_url, destination))
+        request.add_header('Destination', self.primary + path)
+
+    def open(self, request):
+        """Method routes and opens a urllib request, marking the node down
+        when it cannot be reached. Fedora builds resource URIs from the Host
+        header, so it is set to the canonical host to keep graphs from every
+        node using the same URIs. Unsharded reads that fail to connect or
+        get a 5xx answer are retried on the other healthy nodes.
+
+        Args:
+            request(urllib.request.Request): Request on the canonical URL
+
+        Returns:
+            http.client.HTTPResponse
+        """
+        method = request.get_method()
+        canonical = request.full_url
+        retry = not self.shard and method.upper() in READ_METHODS
+        tried = []
+        while True:
+            node, url = self.route(canonical, method, exclude=tried)
+            if url != request.full_url:
+                request.full_url = url
+            request.remove_header('Host')
+            if node is not None and node != self.primary:
+                request.add_header(
+                    'Host',
+                    urllib.parse.urlsplit(self.primary).netloc)
+            if node is not None:
+                self.__destination__(request, node)
+            try:
+                return urllib.request.urlopen(request)
+            except urllib.error.HTTPError as error:
+                if not retry or error.code < 500:
+                    raise
+                failure = error
+            except urllib.error.URLError as error:
+                if node is not None:
+                    self.mark_down(node)
+                if not retry:
+                    raise
+                failure = error
+            finally:
+                if method.upper() not in READ_METHODS:
+                    self.written(canonical)
+                    destination = request.get_header('Destination')
+                    if destination is not None:
+                        self.written(destination)
+            tried.append(node)
+            if node is None or len(set(tried)) >= len(self.endpoints):
+                raise failure
@@ -0,0 +1,284 @@
+"""
+ Compiled SPARQL statement builder for Repository writes. Statement
+ templates are compiled once at import, PREFIX prologues are built once per
+ namespace set, and terms are escaped following the SPARQL 1.1 grammar so
+ quotes, backslashes and line breaks in a value cannot break a statement.
+
+>> insert_data(namespaces, [(uri, 'schema:name', 'A "quoted" title')])
+"""
+__author__ = "Jeremy Nelson"
+
+import functools
+import re
+
+# ECHAR escapes for string literals in the SPARQL 1.1 grammar
+LITERAL_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '"': '\\"',
+    '\n': '\\n',
+    '\r': '\\r',
+    '\t': '\\t',
+    '\b': '\\b',
+    '\f': '\\f'})
+LITERAL_SPECIAL = re.compile('[\\\\"\n\r\t\b\f]')
+# Characters not allowed in an IRIREF, percent-encoded
+IRI_UNSAFE = re.compile('[\x00-\x20<>"{}|^`\\\\]')
+PLACEHOLDER = re.compile(r'\$([A-Za-z_][A-Za-z0-9_]*)')
+
+
+class Statement(object):
+    """Class compiles a template with $name placeholders once into a format
+    string, so rendering is a single C level str.format call.
+    """
+    __slots__ = ('template', 'fields', '_format')
+
+    def __init__(self, template):
+        """
+        Initializes a Statement object
+
+        Args:
+            template(str): SPARQL with $name placeholders
+        """
+        self.template = template
+        self.fields = tuple(sorted(set(PLACEHOLDER.findall(template))))
+        compiled = template.replace("{", "{{").replace("}", "}}")
+        self._format = PLACEHOLDER.sub(r'{\1}', compiled).format
+
+    def render(self, **values):
+        """Method returns the statement with every placeholder replaced
+
+        Returns:
+            str
+        """
+        return self._format(**values)
+
+    def render_many(self, rows, separator="\n"):
+        """Method renders the statement once for each row of values and
+        joins the results
+
+        Args:
+            rows(iterable): Dicts of placeholder values
+            separator(str): Text between rendered rows
+
+        Returns:
+            str
+        """
+        render = self._format
+        return separator.join([render(**row) for row in rows])
+
+
+TRIPLE = Statement("$subject $predicate $object .")
+INSERT_DATA = Statement("""$prologue
+INSERT DATA {
+$triples
+}""")
+DELETE_WHERE = Statement("""$prologue
+DELETE {
+$triples
+} WHERE {
+$triples
+}""")
+DELETE_INSERT = Statement("""$prologue
+DELETE {
+$deleted
+} INSERT {
+$inserted
+} WHERE {
+}""")
+SELECT_SUBJECTS = Statement("""SELECT ?x
+WHERE { ?x $predicate $object }""")
+
+
+@functools.lru_cache(maxsize=64)
+def __prologue__(namespaces):
+    """Internal function builds the PREFIX lines for a tuple of namespaces"""
+    lines = ["PREFIX {}: <{}>\n".format(prefix, uri)
+             for prefix, uri in namespaces[:1]]
+    lines.extend("PREFIX  {}: <{}>\n".format(prefix, uri)
+                 for prefix, uri in namespaces[1:])
+    return "".join(lines)
+
+
+def prologue(namespaces):
+    """Function returns the SPARQL PREFIX prologue for a list of prefix,
+    namespace uri tuples, built once per distinct namespace set
+
+    Args:
+        namespaces(list): List of prefix, namespace uri tuples
+
+    Returns:
+        str
+    """
+    try:
+        return __prologue__(tuple(namespaces))
+    except TypeError:
+        return __prologue__(tuple(tuple(row) for row in namespaces))
+
+
+def escape_literal(value):
+    """Function escapes the quotes, backslashes and control characters of a
+    string literal's lexical form
+
+    Args:
+        value(str): Literal text
+
+    Returns:
+        str
+    """
+    if LITERAL_SPECIAL.search(value) is None:
+        return value
+    return value.translate(LITERAL_ESCAPES)
+
+
+def iri(value):
+    """Function formats a URI as a SPARQL IRI, percent-encoding characters
+    an IRI may not contain
+
+    Args:
+        value(str): URI
+
+    Returns:
+        str
+    """
+    value = str(value)
+    if IRI_UNSAFE.search(value) is not None:
+        value = IRI_UNSAFE.sub(
+            lambda match: "%{:02X}".format(ord(match.group(0))),
+            value)
+    return "<" + value + ">"
+
+
+def term(value):
+    """Function formats a value as a SPARQL term, rdflib terms as their N3,
+    strings starting with http as IRIs and anything else as a plain literal
+
+    Args:
+        value: rdflib term, URI or literal text
+
+    Returns:
+        str
+    """
+    n3 = getattr(value, 'n3', None)
+    if n3 is not None:
+        return n3()
+    value = str(value)
+    if value.startswith("http"):
+        return iri(value)
+    return '"' + escape_literal(value) + '"'
+
+
+def node(value):
+    """Function formats a subject as a SPARQL term, rdflib terms as their N3
+    and strings as IRIs
+
+    Args:
+        value: rdflib term or URI
+
+    Returns:
+        str
+    """
+    n3 = getattr(value, 'n3', None)
+    if n3 is not None:
+        return n3()
+    return iri(value)
+
+
+def predicate(property_name):
+    """Function formats a property as a SPARQL predicate, rdflib terms as
+    their N3, full URIs as IRIs and prefixed names like schema:name are kept
+    as they are
+
+    Args:
+        property_name: rdflib.URIRef, prefixed name or URI
+
+    Returns:
+        str
+    """
+    n3 = getattr(property_name, 'n3', None)
+    if n3 is not None:
+        return n3()
+    property_name = str(property_name)
+    if property_name.startswith("http"):
+        return iri(property_name)
+    return property_name
+
+
+def triples(statements):
+    """Function renders subject, property name, value tuples as the lines
+    of a SPARQL data block
+
+    Args:
+        statements(iterable): Subject URI, property name, value tuples or
+                              an rdflib.Graph
+
+    Returns:
+        str
+    """
+    render = TRIPLE._format
+    return "\n".join([render(subject=node(subject),
+                             predicate=predicate(property_name),
+                             object=term(value))
+                      for subject, property_name, value in statements])
+
+
+def insert_data(namespaces, statements):
+    """Function returns an INSERT DATA update adding every statement under
+    one prologue
+
+    Args:
+        namespaces(list): List of prefix, namespace uri tuples
+        statements(iterable): Subject URI, property name, value tuples
+
+    Returns:
+        str
+    """
+    return INSERT_DATA.render(prologue=prologue(namespaces),
+                              triples=triples(statements))
+
+
+def delete_where(namespaces, statements):
+    """Function returns an update deleting the statements when all of them
+    are present
+
+    Args:
+        namespaces(list): List of prefix, namespace uri tuples
+        statements(iterable): Subject URI, property name, value tuples
+
+    Returns:
+        str
+    """
+    return DELETE_WHERE.render(prologue=prologue(namespaces),
+                               triples=triples(statements))
+
+
+def delete_insert(namespaces, deleted, inserted):
+    """Function returns an update deleting and inserting statements in one
+    request
+
+    Args:
+        namespaces(list): List of prefix, namespace uri tuples
+        deleted(iterable): Subject URI, property name, value tuples
+        inserted(iterable): Subject URI, property name, value tuples
+
+    Returns:
+        str
+    """
+    return DELETE_INSERT.render(prologue=prologue(namespaces),
+                                deleted=triples(deleted),
+                                inserted=triples(inserted))
+
+
+def select_subjects(property_uri, value):
+    """Function returns a query for the subjects with a literal value for a
+    property
+
+    Args:
+        property_uri(str): Property URI
+        value(str): Literal text
+
+    Returns:
+        str
+    """
+    return SELECT_SUBJECTS.render(
+        predicate=iri(property_uri),
+        object='"' + escape_literal(str(value)) + '"')
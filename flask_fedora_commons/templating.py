@@ -0,0 +1,240 @@
+"""
+ Jinja helpers for showing Fedora Commons labels and property values in
+ templates without a request per linked resource. While a template renders
+ the fedora_label and fedora_value helpers only return placeholders, then
+ every referenced resource is fetched in one concurrent batch and the
+ placeholders are replaced in the response. Rendered fragments are cached
+ per resource ETag, so an unchanged resource costs a 304 and no parse.
+
+>> <a href="{{ uri }}">{{ uri|fedora_label }}</a>
+>> {{ fedora_value(uri, 'schema:datePublished') }}
+
+ A placeholder only becomes the text once the response is complete, so a
+ deferred result must be output as it is. Chained filters and tests such
+ as |upper, |truncate or == see the placeholder instead, so pass
+ defer=False to fetch the value straight away when it is used that way.
+
+>> {{ uri|fedora_label(defer=False)|truncate(20) }}
+
+ The helpers are enabled with FEDORA_TEMPLATE_HELPERS = True.
+"""
+__author__ = "Jeremy Nelson"
+
+import re
+import time
+import urllib.error
+import uuid
+
+from flask import g, has_request_context
+from markupsafe import escape, Markup
+
+from .cache import QueryCache
+
+# Predicates tried in order for a resource's label
+LABEL_PREDICATES = [
+    'http://www.w3.org/2000/01/rdf-schema#label',
+    'http://schema.org/name',
+    'http://www.w3.org/2004/02/skos/core#prefLabel',
+    'http://bibframe.org/vocab/authorizedAccessPoint',
+    'http://bibframe.org/vocab/titleValue']
+
+
+class TemplateHelpers(object):
+    """Class provides the deferred fedora_label and fedora_value Jinja
+    helpers and resolves their placeholders after each request.
+    """
+
+    def __init__(self, repository, fragment_ttl=0, max_entries=10000):
+        """
+        Initializes a TemplateHelpers object
+
+        Args:
+            repository(Repository): Repository to fetch resources from
+            fragment_ttl(int): Seconds cached fragments are used without
+                               revalidating their ETag, defaults to 0 which
+                               revalidates on every request
+            max_entries(int): Maximum resources with cached fragments
+        """
+        self.repository = repository
+        self.fragment_ttl = fragment_ttl
+        self.fragments = QueryCache(ttl=float('inf'), max_entries=max_entries)
+
+    def init_app(self, app):
+        """Method registers the helpers as Jinja filters and globals and the
+        after_request hook that resolves them
+
+        Args:
+            app(Flask): Flask app
+        """
+        for name, helper in (('fedora_label', self.label),
+                             ('fedora_value', self.value)):
+            app.add_template_filter(helper, name)
+            app.add_template_global(helper, name)
+        app.after_request(self.after_request)
+
+    def __defer__(self, uri, kind, argument, default, defer=True):
+        """Internal method records a fragment for the current request and
+        returns its placeholder, outside a request or without defer it is
+        resolved at once"""
+        request = (str(uri), kind, argument, default)
+        if not defer or not has_request_context():
+            # Plain text, escaped by Jinja once filters have run on it
+            return self.__render__(self.__fetch__([request[0]]), request)
+        deferred = getattr(g, '_fedora_deferred', None)
+        if deferred is None:
+            deferred = g._fedora_deferred = {
+                'token': uuid.uuid4().hex,
+                'requests': []}
+        deferred['requests'].append(request)
+        return Markup("<!--fedora:{}:{}-->".format(
+            deferred['token'],
+            len(deferred['requests']) - 1))
+
+    def label(self, uri, default=None, defer=True):
+        """Method returns a placeholder for a resource's label, the first
+        value of LABEL_PREDICATES, otherwise default or the URI
+
+        Args:
+            uri(str): Resource URI
+            default(str): Text when the resource has no label or cannot be
+                          read, defaults to the URI
+            defer(bool): Return a placeholder resolved with the request's
+                         batch, False fetches the label now for use in
+                         filters and comparisons, default is True
+
+        Returns:
+            markupsafe.Markup placeholder, or str without defer
+        """
+        return self.__defer__(uri, 'label', None, default, defer)
+
+    def value(self, uri, property_name, default='', defer=True):
+        """Method returns a placeholder for the values of a resource's
+        property, joined with commas
+
+        Args:
+            uri(str): Resource URI
+            property_name(str): Prefixed name or URI of the property
+            default(str): Text when there is no value, default is empty
+            defer(bool): Return a placeholder resolved with the request's
+                         batch, False fetches the values now for use in
+                         filters and comparisons, default is True
+
+        Returns:
+            markupsafe.Markup placeholder, or str without defer
+        """
+        return self.__defer__(uri,
+                              'value',
+                              self.repository.__expand__(property_name),
+                              default,
+                              defer)
+
+    def __render__(self, entries, request):
+        """Internal method returns the text for one placeholder"""
+        uri, kind, argument, default = request
+        entry = entries.get(uri)
+        text = None
+        if entry is not None:
+            text = entry['fragments'].get((kind, argument))
+        if not text:
+            text = uri if kind == 'label' and default is None else default
+        return str(text)
+
+    def __fragments__(self, uri, graph):
+        """Internal method renders a resource's label and the values of each
+        of its properties"""
+        import rdflib
+        subject = rdflib.URIRef(uri)
+        fragments = {('label', None): None}
+        for predicate in LABEL_PREDICATES:
+            label = graph.value(subject, rdflib.URIRef(predicate))
+            if label is not None:
+                fragments[('label', None)] = str(label)
+                break
+        for predicate, object_ in graph.predicate_objects(subject):
+            fragments.setdefault(('value', str(predicate)), [])
+            fragments[('value', str(predicate))].append(str(object_))
+        for key, values in fragments.items():
+            if isinstance(values, list):
+                fragments[key] = ", ".join(sorted(values))
+        return fragments
+
+    def __load__(self, uri):
+        """Internal method returns the fragment cache entry for uri, reusing
+        it while Fedora answers its ETag with 304 Not Modified"""
+        import rdflib
+        cached = self.fragments.get(uri)
+        if cached is not None and \
+           time.time() - cached['checked'] < self.fragment_ttl:
+            return cached
+        headers = {}
+        if cached is not None and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        try:
+            response = self.repository.connect(uri, headers=headers)
+        except urllib.error.HTTPError as error:
+            if error.code != 304 or cached is None:
+                return None
+            cached['checked'] = time.time()
+            return cached
+        except OSError:
+            return cached
+        try:
+            fragments = self.__fragments__(
+                uri,
+                rdflib.Graph().parse(data=response.read(), format='turtle'))
+        except Exception as error:
+            # Binary or malformed resources render their defaults, cached
+            # under the ETag so they are not refetched
+            print("Error parsing {} for template helpers: {}".format(uri,
+                                                                     error))
+            fragments = {}
+        entry = {'etag': response.headers.get('ETag'),
+                 'checked': time.time(),
+                 'fragments': fragments}
+        self.fragments.set(uri, entry)
+        return entry
+
+    def __fetch__(self, uris):
+        """Internal method loads fragment entries for every distinct uri
+        concurrently on the repository's shared executor"""
+        uris = sorted(set(uris))
+        return dict(zip(uris, self.repository.executor.map(self.__load__,
+                                                           uris)))
+
+    def resolve(self, text, deferred):
+        """Method replaces the placeholders recorded in deferred
+
+        Args:
+            text(str): Rendered output containing placeholders
+            deferred(dict): The request's deferred fragments
+
+        Returns:
+            str
+        """
+        requests = deferred['requests']
+        entries = self.__fetch__(request[0] for request in requests)
+        return re.sub(
+            "<!--fedora:{}:([0-9]+)-->".format(deferred['token']),
+            lambda match: escape(self.__render__(
+                entries,
+                requests[int(match.group(1))])),
+            text)
+
+    def after_request(self, response):
+        """Method resolves every placeholder in a rendered response with
+        one batch of fetches
+
+        Args:
+            response(flask.Response): Response to the current request
+
+        Returns:
+            flask.Response
+        """
+        deferred = getattr(g, '_fedora_deferred', None)
+        if deferred is None or response.direct_passthrough or \
+           response.is_streamed:
+            return response
+        g._fedora_deferred = None
+        response.set_data(self.resolve(response.get_data(as_text=True),
+                                       deferred))
+        return response
@@ -0,0 +1,147 @@
+"""
+ Write-behind queue for Repository insert, remove and replace calls. Each
+ mutation is queued and returns a concurrent.futures.Future, background
+ worker threads apply the mutations to Fedora. Synchronous writes such as
+ create and delete wait for an entity's queued mutations first, so they
+ cannot overtake them.
+"""
+__author__ = "Jeremy Nelson"
+
+import queue
+import threading
+import zlib
+
+from concurrent.futures import Future
+
+
+class WriteBehindQueue(object):
+    """Class queues mutations in bounded per-worker queues. All mutations for
+    an entity hash to the same worker so they are applied in submission
+    order, and a mutation identical to the entity's last still queued
+    mutation shares that mutation's future instead of being queued again.
+    """
+
+    def __init__(self, workers=2, maxsize=1000):
+        """
+        Initializes a WriteBehindQueue object
+
+        Args:
+            workers(int): Number of background worker threads, defaults to 2
+            maxsize(int): Maximum queued mutations per worker, submit blocks
+                          when a worker's queue is full, defaults to 1000
+        """
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._last = {}
+        self._pending = {}
+        self._settled = threading.Condition(self._lock)
+        self._queues = [queue.Queue(maxsize) for _ in range(workers)]
+        self._threads = []
+        for work_queue in self._queues:
+            thread = threading.Thread(target=self.__work__,
+                                      args=(work_queue,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __work__(self, work_queue):
+        """Internal method run by each worker thread"""
+        self._local.active = True
+        while True:
+            item = work_queue.get()
+            try:
+                if item is None:
+                    return
+                entity, future, function, args = item
+                with self._lock:
+                    if self._last.get(entity, (None, None))[1] is future:
+                        del self._last[entity]
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                try:
+                    future.set_result(function(*args))
+                except Exception as error:
+                    future.set_exception(error)
+            finally:
+                if item is not None:
+                    self.__settle__(item[0])
+                work_queue.task_done()
+
+    def __settle__(self, entity):
+        """Internal method counts one of entity's mutations as applied and
+        wakes threads waiting for the entity"""
+        with self._lock:
+            remaining = self._pending[entity] - 1
+            if remaining:
+                self._pending[entity] = remaining
+            else:
+                del self._pending[entity]
+                self._settled.notify_all()
+
+    def in_worker(self):
+        """Method returns True when called from one of the queue's workers
+
+        Returns:
+            bool
+        """
+        return getattr(self._local, 'active', False)
+
+    def submit(self, entity, function, *args):
+        """Method queues function(*args) as a mutation of entity
+
+        Args:
+            entity(str): Entity URI or ID the mutation applies to
+            function(callable): Synchronous mutation to run
+            args: Arguments for function
+
+        Returns:
+            concurrent.futures.Future
+        """
+        entity = str(entity)
+        key = (function.__name__, tuple(str(arg) for arg in args))
+        with self._lock:
+            last_key, last_future = self._last.get(entity, (None, None))
+            if last_key == key and not last_future.running() and \
+               not last_future.done():
+                return last_future
+            future = Future()
+            self._last[entity] = (key, future)
+            self._pending[entity] = self._pending.get(entity, 0) + 1
+        worker = zlib.crc32(entity.encode()) % len(self._queues)
+        self._queues[worker].put((entity, future, function, args))
+        return future
+
+    def wait(self, entity, tree=False):
+        """Method blocks until every queued mutation of entity has been
+        applied, call before a synchronous write to the entity
+
+        Args:
+            entity(str): Entity URI or ID as passed to submit
+            tree(bool): Also wait for entities below entity, for writes
+                        that affect a whole container, default is False
+        """
+        entity = str(entity)
+        prefix = entity + "/"
+
+        def pending():
+            if entity in self._pending:
+                return True
+            return tree and any(key.startswith(prefix)
+                                for key in self._pending)
+
+        with self._lock:
+            while pending():
+                self._settled.wait()
+
+    def drain(self):
+        """Method blocks until every queued mutation has been applied"""
+        for work_queue in self._queues:
+            work_queue.join()
+
+    def shutdown(self):
+        """Method drains the queues and stops the worker threads"""
+        self.drain()
+        for work_queue in self._queues:
+            work_queue.put(None)
+        for thread in self._threads:
+            thread.join()
@@ -5,7 +5,7 @@ Flask-FedoraCommons
 This Flask extension provides CRUD operations for
 `Fedora Commons <http://fedora-commons.org/>`_ digital repositories. Latest
 version focuses on `Fedora 4 <https://wiki.duraspace.org/display/FF/Fedora+Repository+Home>`_
-using Python 3.
+using Python 3.7 or later.
 
 Legacy support for Fedora 3.x and Python 2.7x are available by cloning the project's
 git repository at <https://github.com/jermnelson/flask-fedora-commons.git> and
@@ -27,9 +27,11 @@ setup(
     description='Library for manipulating Fedora Commons digitial repositories',
     long_description=__doc__,
     packages=find_packages(),
+    package_data={'flask_fedora_commons': ['templates/fedora/*.html']},
     zip_safe=False,
     include_package_data=True,
     platforms='any',
+    python_requires='>=3.7',
     install_requires=[
         'python-dateutil',
         'Flask',
@@ -42,7 +44,13 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Topic :: Internet :: WWW/HTTP :: Dynamic Content',
         'Topic :: Software Development :: Libraries :: Python Modules'
 
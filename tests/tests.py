@@ -15,8 +15,11 @@ __author__ = "Jeremy Nelson"
 import json
 import os
 import rdflib
+import rdflib.compare
+import subprocess
 import sys
 import unittest
+import urllib.error
 import urllib.parse
 import urllib.request
 import uuid
@@ -30,6 +33,156 @@ from flask_fedora_commons import Repository
 from flask_fedora_commons import BIBFRAME
 from flask_fedora_commons import FEDORA_BASE_URL
 from flask_fedora_commons import SCHEMA_ORG
+from flask_fedora_commons import PreconditionFailed
+from flask_fedora_commons.cache import QueryCache
+from flask_fedora_commons.compression import compress_request
+from flask_fedora_commons.compression import decode_response
+from flask_fedora_commons.concurrency import AdaptiveLimiter
+from flask_fedora_commons.diskcache import DiskGraphCache
+from flask_fedora_commons.export import Exporter
+from flask_fedora_commons.fixity import FixityError
+from flask_fedora_commons.graph import CompactGraph
+from flask_fedora_commons.importer import import_dump, iter_groups
+from flask_fedora_commons.outbox import CallbackSink, change_event
+from flask_fedora_commons.outbox import FileSink, Outbox, QueueSink
+from flask_fedora_commons.resource import FedoraResource
+from flask_fedora_commons.routing import Router
+from flask_fedora_commons.writebehind import WriteBehindQueue
+
+class StandInFedora(object):
+    """Minimal in-memory stand-in for a Fedora 4 REST endpoint, served on a
+    local port by a threading HTTP server for offline tests"""
+
+    def __init__(self):
+        import http.server
+        import threading
+        self.resources = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def __body__(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length)
+
+            def __reply__(self, code, body=b'', headers=None):
+                self.send_response(code)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def __dispatch__(self):
+                with stand_in.lock:
+                    stand_in.requests.append((self.command, self.path))
+                code, body, headers = stand_in.handle(
+                    self.command,
+                    self.path,
+                    self.headers,
+                    self.__body__())
+                self.__reply__(code, body, headers)
+
+            do_GET = do_HEAD = do_PUT = do_POST = __dispatch__
+            do_PATCH = do_DELETE = do_COPY = do_MOVE = __dispatch__
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      Handler)
+        self.server.daemon_threads = True
+        self.base_url = "http://127.0.0.1:{}".format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __etag__(self, body):
+        import hashlib
+        return '"{}"'.format(hashlib.md5(body).hexdigest())
+
+    def handle(self, method, path, headers, body):
+        "Applies a request to the in-memory resources"
+        import hashlib
+        uri, binary = self.base_url + path.split('?')[0], None
+        with self.lock:
+            if path.endswith('/fcr:metadata') or path.endswith('/fcr:fixity'):
+                uri, binary = uri.rsplit('/', 1)[0], None
+                if self.resources.get(uri, {}).get('type') != 'text/turtle':
+                    binary = self.resources.get(uri)
+            if binary is not None:
+                return 200, """<{}> <http://www.loc.gov/premis/rdf/v1#hasMessageDigest> <urn:sha1:{}> .""".format(
+                    uri,
+                    hashlib.sha1(binary['body']).hexdigest()).encode(), {}
+            if 'fcr:sparql' in path or 'fcr:search' in path:
+                return 200, b'', {'Content-Type': 'text/turtle'}
+            if method == 'POST':
+                import uuid
+                uri = "{}/{}".format(uri.rstrip('/'), uuid.uuid4())
+                method = 'PUT'
+            resource = self.resources.get(uri)
+            if method in ('GET', 'HEAD'):
+                if resource is None:
+                    return 404, b'', {}
+                etag = self.__etag__(resource['body'])
+                if headers.get('If-None-Match') == etag:
+                    return 304, b'', {'ETag': etag}
+                return 200, resource['body'], {
+                    'Content-Type': resource['type'],
+                    'ETag': etag}
+            if method == 'PUT':
+                if headers.get('If-None-Match') == '*' and resource:
+                    return 412, b'', {}
+                digest = headers.get('Digest', '')
+                if digest.startswith('sha1=') and \
+                   digest[5:] != hashlib.sha1(body).hexdigest():
+                    return 409, b'', {}
+                self.resources[uri] = {
+                    'body': body,
+                    'type': headers.get('Content-Type', 'text/turtle')}
+                return 201, uri.encode(), {
+                    'ETag': self.__etag__(body)}
+            if method == 'DELETE':
+                if self.resources.pop(uri, None) is None:
+                    return 404, b'', {}
+                return 204, b'', {}
+            if method in ('COPY', 'MOVE'):
+                destination = headers.get('Destination')
+                if resource is None:
+                    return 404, b'', {}
+                if destination in self.resources:
+                    return 412, b'', {}
+                for source in [key for key in self.resources
+                               if key == uri or key.startswith(uri + '/')]:
+                    copied = dict(self.resources[source])
+                    copied['body'] = copied['body'].replace(
+                        uri.encode(),
+                        destination.encode())
+                    self.resources[destination + source[len(uri):]] = copied
+                    if method == 'MOVE':
+                        del self.resources[source]
+                return 201, destination.encode(), {}
+            if method == 'PATCH':
+                if resource is None:
+                    return 404, b'', {}
+                if resource['type'] != 'text/turtle':
+                    return 415, b'', {}
+                if headers.get('If-Match') not in (
+                        None, self.__etag__(resource['body'])):
+                    return 412, b'', {}
+                graph = rdflib.Graph().parse(data=resource['body'],
+                                             format='turtle')
+                graph.update(body.decode())
+                resource['body'] = graph.serialize(format='turtle').encode()
+                return 204, b'', {'ETag': self.__etag__(resource['body'])}
+        return 405, b'', {}
+
+    def shutdown(self):
+        "Stops the server"
+        self.server.shutdown()
+        self.server.server_close()
 
 class TestBuildPrefixes(unittest.TestCase):
     "Unit tests for the flask_fedora_commons.build_prefixes function"
@@ -295,6 +448,1619 @@ class TestFedoraCommons(unittest.TestCase):
         objects stored under rest/tests"""
         self.repo.delete(urllib.parse.urljoin(FEDORA_BASE_URL, "/rest/test/"))
 
+class TestLazyImport(unittest.TestCase):
+    "Unit tests for the lazy loading of rdflib by flask_fedora_commons"
+
+    def test_import_skips_rdflib(self):
+        "Tests importing the extension does not import rdflib"
+        loaded = subprocess.check_output(
+            [sys.executable,
+             '-c',
+             'import sys, flask_fedora_commons; '
+             'print("rdflib" in sys.modules)'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(b"False", loaded.strip())
+
+    def test_lazy_namespaces(self):
+        "Tests namespace constants and CONTEXT are built on first access"
+        import flask_fedora_commons
+        self.assertEqual(
+            rdflib.URIRef("http://bibframe.org/vocab/Work"),
+            flask_fedora_commons.BIBFRAME.Work)
+        self.assertEqual(
+            "http://schema.org/",
+            flask_fedora_commons.CONTEXT['schema'])
+
+class TestQueryCache(unittest.TestCase):
+    "Unit tests for the sparql and search result cache"
+
+    def setUp(self):
+        "Setup's repository with a stubbed SPARQL endpoint"
+        self.repo = Repository(query_cache_ttl=60)
+        self.calls = []
+
+        def __sparql__(statement, end_point, accept_format):
+            self.calls.append(statement)
+            return "x\r\n{}\r\n".format(len(self.calls))
+        self.repo.__sparql__ = __sparql__
+
+    def test_cache_hit(self):
+        "Tests normalized identical statements are served from the cache"
+        first = self.repo.sparql("SELECT ?x WHERE { ?x bf:title ?y }")
+        second = self.repo.sparql("SELECT ?x\n WHERE {  ?x bf:title ?y }")
+        self.assertEqual(first, second)
+        self.assertEqual(1, len(self.calls))
+        stats = self.repo.query_cache_stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+
+    def test_invalidate_by_predicate(self):
+        "Tests writes only invalidate results depending on the predicate"
+        self.repo.sparql("SELECT ?x WHERE { ?x bf:title ?y }")
+        self.repo.sparql("SELECT ?x WHERE { ?x schema:name ?y }")
+        self.repo.__invalidate__(
+            "http://bibframe.org/vocab/title")
+        self.repo.sparql("SELECT ?x WHERE { ?x bf:title ?y }")
+        self.repo.sparql("SELECT ?x WHERE { ?x schema:name ?y }")
+        self.assertEqual(3, len(self.calls))
+
+    def test_ttl_and_lru(self):
+        "Tests expired and least recently used entries are dropped"
+        cache = QueryCache(ttl=-1, max_entries=2)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+        cache.ttl = 60
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual('c', cache.get('c'))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_invalidated_during_load(self):
+        "Tests a load overlapping an invalidation is not cached"
+        cache = QueryCache(ttl=60)
+
+        def stale_loader():
+            cache.invalidate()
+            return 'stale'
+        self.assertEqual('stale', cache.get_or_load('a', stale_loader))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual('fresh', cache.get_or_load('a', lambda: 'fresh'))
+        self.assertEqual('fresh', cache.get('a'))
+
+class TestCompactGraph(unittest.TestCase):
+    "Unit tests for the read-only flask_fedora_commons.graph.CompactGraph"
+
+    def setUp(self):
+        "Builds a small rdflib.Graph and its compact copy"
+        self.work_uri = rdflib.URIRef("http://example.org/work/1")
+        self.graph = rdflib.Graph()
+        self.graph.bind('bf', str(BIBFRAME))
+        self.graph.add((self.work_uri,
+                        rdflib.RDF.type,
+                        BIBFRAME.Monograph))
+        self.graph.add((self.work_uri,
+                        BIBFRAME.workTitle,
+                        rdflib.Literal("Compact Title")))
+        self.graph.add((rdflib.URIRef("http://example.org/work/2"),
+                        rdflib.RDF.type,
+                        BIBFRAME.Monograph))
+        self.compact = CompactGraph.from_graph(self.graph)
+
+    def test_lookups(self):
+        "Tests triples, objects, predicate_objects and value lookups"
+        self.assertEqual(3, len(self.compact))
+        self.assertEqual(
+            2,
+            len(list(self.compact.triples(
+                (None, rdflib.RDF.type, BIBFRAME.Monograph)))))
+        self.assertEqual(
+            [BIBFRAME.Monograph],
+            list(self.compact.objects(self.work_uri, rdflib.RDF.type)))
+        self.assertEqual(
+            sorted(self.graph.predicate_objects(self.work_uri)),
+            sorted(self.compact.predicate_objects(self.work_uri)))
+        self.assertEqual(
+            "Compact Title",
+            str(self.compact.value(subject=self.work_uri,
+                                   predicate=BIBFRAME.workTitle)))
+        self.assertIsNone(self.compact.value(
+            subject=rdflib.URIRef("http://example.org/missing"),
+            predicate=BIBFRAME.workTitle))
+
+    def test_to_graph(self):
+        "Tests conversion back to a mutable rdflib.Graph and serialization"
+        self.assertTrue(rdflib.compare.isomorphic(
+            self.graph,
+            self.compact.to_graph()))
+        self.assertIn("Compact Title", self.compact.serialize(format='turtle'))
+
+class TestExport(unittest.TestCase):
+    "Unit tests for flask_fedora_commons.export.Exporter"
+
+    RESOURCES = {
+        'http://localhost:8080/rest/test': """
+            <http://localhost:8080/rest/test>
+              <http://www.w3.org/ns/ldp#contains>
+                <http://localhost:8080/rest/test/a>,
+                <http://localhost:8080/rest/test/b> .""",
+        'http://localhost:8080/rest/test/a': """
+            <http://localhost:8080/rest/test/a>
+              <http://www.w3.org/2000/01/rdf-schema#label> "A" .""",
+        'http://localhost:8080/rest/test/b': """
+            <http://localhost:8080/rest/test/b>
+              <http://www.w3.org/2000/01/rdf-schema#label> "B" ."""}
+
+    def setUp(self):
+        "Creates a temporary output directory and a stub repository"
+        import tempfile
+        self.path = tempfile.mkdtemp()
+        resources = self.RESOURCES
+
+        class StubRepository(object):
+            def connect(self, uri):
+                import io
+                return io.BytesIO(resources[uri].encode())
+        self.repo = StubRepository()
+
+    def test_export(self):
+        "Tests a subtree is exported as one named graph per resource"
+        import gzip
+        stats = Exporter(self.repo, self.path, processes=1).run(
+            'http://localhost:8080/rest/test')
+        self.assertEqual(3, stats['exported'])
+        work_a = rdflib.URIRef('http://localhost:8080/rest/test/a')
+        dataset = rdflib.Dataset()
+        for shard in range(stats['shards']):
+            shard_path = os.path.join(self.path,
+                                      'export-{:05d}.nq.gz'.format(shard))
+            with gzip.open(shard_path) as dump:
+                dataset.parse(data=dump.read(), format='nquads')
+        self.assertEqual(
+            "A",
+            str(dataset.graph(work_a).value(subject=work_a,
+                                            predicate=rdflib.RDFS.label)))
+
+    def test_resume(self):
+        "Tests an export resumes from its checkpoint"
+        with open(os.path.join(self.path, 'checkpoint.json'), 'w') as state:
+            json.dump({'root': 'http://localhost:8080/rest/test',
+                       'pending': ['http://localhost:8080/rest/test/b'],
+                       'seen': list(self.RESOURCES.keys()),
+                       'next_shard': 1,
+                       'exported': 2,
+                       'errors': []}, state)
+        stats = Exporter(self.repo, self.path, processes=1).run(
+            'http://localhost:8080/rest/test')
+        self.assertEqual(3, stats['exported'])
+        self.assertEqual(2, stats['shards'])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.path, 'export-00001.nq.gz')))
+
+    def test_seen_log(self):
+        "Tests seen URIs are logged rather than rewritten in the checkpoint"
+        exporter = Exporter(self.repo, self.path, processes=1, shard_size=1)
+        exporter.run('http://localhost:8080/rest/test')
+        with open(exporter.checkpoint_path) as checkpoint_file:
+            state = json.load(checkpoint_file)
+        self.assertNotIn('seen', state)
+        with open(exporter.seen_path) as log:
+            self.assertEqual(sorted(self.RESOURCES),
+                             sorted(log.read().split()))
+        self.assertEqual(os.path.getsize(exporter.seen_path),
+                         state['seen_bytes'])
+        with open(exporter.seen_path, 'a') as log:
+            log.write('http://localhost:8080/rest/test/uncheckpointed\n')
+        state['pending'] = []
+        exporter.__save_checkpoint__(state)
+        exporter.run('http://localhost:8080/rest/test')
+        self.assertEqual(state['seen_bytes'],
+                         os.path.getsize(exporter.seen_path))
+
+    def tearDown(self):
+        "Removes the temporary output directory"
+        import shutil
+        shutil.rmtree(self.path)
+
+class TestImportDump(unittest.TestCase):
+    "Unit tests for flask_fedora_commons.importer"
+
+    DUMP = b"""# N-Quads dump
+<http://example.org/1> <http://www.w3.org/2000/01/rdf-schema#label> "One . \\"1\\"" <http://example.org/g1> .
+<http://example.org/1> <http://bibframe.org/vocab/title> "Title"@en <http://example.org/g1> .
+
+<http://example.org/2> <http://www.w3.org/2000/01/rdf-schema#label> "Two" <http://example.org/g2> .
+_:b1 <http://www.w3.org/2000/01/rdf-schema#label> "Blank" .
+"""
+
+    def setUp(self):
+        "Writes the dump to a temporary file"
+        import tempfile
+        handle, self.path = tempfile.mkstemp(suffix='.nq')
+        with os.fdopen(handle, 'wb') as dump:
+            dump.write(self.DUMP)
+
+    def test_iter_groups(self):
+        "Tests statements are grouped by subject and by graph"
+        subjects = [key for key, data in iter_groups(self.path)]
+        self.assertEqual(
+            ['http://example.org/1', 'http://example.org/2', '_:b1'],
+            subjects)
+        graphs = [key for key, data in iter_groups(self.path, 'graph')]
+        self.assertEqual(
+            ['http://example.org/g1', 'http://example.org/g2', '_:b1'],
+            graphs)
+
+    def test_import_dump(self):
+        "Tests each subject group is created with its triples"
+        created = {}
+
+        class StubRepository(object):
+            base_url = 'http://example.org'
+
+            def create(self, uri=None, graph=None):
+                created[uri] = graph
+                return uri
+        stats = import_dump(StubRepository(), self.path, workers=2, window=1)
+        self.assertEqual(3, stats['created'])
+        self.assertEqual(0, stats['skipped'])
+        self.assertEqual(
+            'One . "1"',
+            str(created['http://example.org/1'].value(
+                subject=rdflib.URIRef('http://example.org/1'),
+                predicate=rdflib.RDFS.label)))
+        skolemized = [uri for uri in created
+                      if uri.startswith('http://example.org/rest/genid/')]
+        self.assertEqual(1, len(skolemized))
+        self.assertTrue(skolemized[0].endswith('/b1'))
+
+    def test_import_unclustered(self):
+        "Tests a subject repeated later in the dump is merged, not lost"
+        fedora = StandInFedora()
+        repo = Repository(base_url=fedora.base_url)
+        work = "<{}/rest/work>".format(fedora.base_url)
+        with open(self.path, 'w') as dump:
+            dump.write(
+                '{0} <http://schema.org/name> "Work" .\n'
+                '<{1}/rest/other> <http://schema.org/name> "Other" .\n'
+                '{0} <http://schema.org/about> _:topic .\n'
+                '_:topic <http://www.w3.org/2000/01/rdf-schema#label> '
+                '"Topic" .\n'.format(work, fedora.base_url))
+        try:
+            stats = import_dump(repo, self.path, workers=2)
+            graph = repo.read(work[1:-1])
+        finally:
+            fedora.shutdown()
+        self.assertEqual(
+            (3, 1, 0, 0),
+            (stats['created'], stats['merged'], stats['skipped'],
+             stats['failed']),
+            stats['errors'])
+        self.assertEqual("Work", str(graph.value(
+            rdflib.URIRef(work[1:-1]),
+            SCHEMA_ORG.name)))
+        topic = graph.value(rdflib.URIRef(work[1:-1]), SCHEMA_ORG.about)
+        self.assertTrue(str(topic).startswith(
+            fedora.base_url + '/rest/genid/'))
+
+    def test_import_graph(self):
+        "Tests each subject of a named graph keeps its own statements"
+        fedora = StandInFedora()
+        repo = Repository(base_url=fedora.base_url)
+        graph_uri = fedora.base_url + '/rest/g1'
+        with open(self.path, 'w') as dump:
+            dump.write(
+                '<http://ex.org/a> <http://schema.org/name> "A" <{0}> .\n'
+                '<http://ex.org/b> <http://schema.org/name> "B" <{0}> .\n'
+                .format(graph_uri))
+        try:
+            stats = import_dump(repo, self.path, group_by='graph')
+            graph = repo.read(graph_uri)
+        finally:
+            fedora.shutdown()
+        self.assertEqual(1, stats['created'], stats['errors'])
+        for subject, name in (('a', 'A'), ('b', 'B')):
+            self.assertEqual(
+                [name],
+                [str(value) for value in graph.objects(
+                    rdflib.URIRef('http://ex.org/' + subject),
+                    SCHEMA_ORG.name)])
+        self.assertIsNone(graph.value(rdflib.URIRef(graph_uri),
+                                      SCHEMA_ORG.name))
+
+    def tearDown(self):
+        "Removes the temporary dump"
+        os.remove(self.path)
+
+class TestWriteBehind(unittest.TestCase):
+    "Unit tests for flask_fedora_commons.writebehind.WriteBehindQueue"
+
+    def setUp(self):
+        "Creates a write-behind queue and a recording mutation"
+        import threading
+        self.queue = WriteBehindQueue(workers=2, maxsize=10)
+        self.applied = []
+        self.blocked = threading.Event()
+
+        def insert(entity, value):
+            self.blocked.wait(5)
+            self.applied.append((entity, value))
+            return True
+        self.insert = insert
+
+    def test_ordering_and_coalescing(self):
+        "Tests per entity ordering and coalescing of identical mutations"
+        first = self.queue.submit('work/1', self.insert, 'work/1', 'a')
+        futures = [self.queue.submit('work/1', self.insert, 'work/1', value)
+                   for value in ('b', 'c', 'c')]
+        self.assertIs(futures[1], futures[2])
+        self.blocked.set()
+        self.queue.drain()
+        self.assertTrue(first.result())
+        self.assertEqual(
+            [('work/1', 'a'), ('work/1', 'b'), ('work/1', 'c')],
+            self.applied)
+
+    def test_exception_propagates(self):
+        "Tests a failing mutation sets the exception on its future"
+        def fail():
+            raise ValueError("Fedora unavailable")
+        future = self.queue.submit('work/2', fail)
+        self.queue.drain()
+        self.assertRaises(ValueError, future.result)
+
+    def test_wait(self):
+        "Tests waiting for an entity blocks until its mutations are applied"
+        import threading
+        self.queue.submit('work/3/part', self.insert, 'work/3/part', 'a')
+        waited = threading.Event()
+
+        def wait():
+            self.queue.wait('work/3', tree=True)
+            waited.set()
+        threading.Thread(target=wait).start()
+        self.queue.wait('work/4')
+        self.assertFalse(waited.wait(0.2))
+        self.blocked.set()
+        self.assertTrue(waited.wait(5))
+        self.assertEqual([('work/3/part', 'a')], self.applied)
+
+    def test_repository_delete_after_insert(self):
+        "Tests a delete waits for the entity's queued insert"
+        fedora = StandInFedora()
+        try:
+            repo = Repository(base_url=fedora.base_url)
+            repo.enable_write_behind(workers=2)
+            work_uri = fedora.base_url + '/rest/test/queued'
+            self.assertEqual(work_uri,
+                             repo.__entity_key__('rest/test/queued/'))
+            self.assertEqual(
+                work_uri,
+                repo.__entity_key__(work_uri + '/fcr:metadata'))
+            future = repo.insert('rest/test/queued', 'schema:name', 'Late')
+            self.assertTrue(repo.delete(work_uri))
+            self.assertTrue(future.done())
+            self.assertFalse(repo.exists(work_uri))
+            repo.write_behind.shutdown()
+        finally:
+            fedora.shutdown()
+
+    def tearDown(self):
+        "Stops the queue's worker threads"
+        self.blocked.set()
+        self.queue.shutdown()
+
+class TestBlueprint(unittest.TestCase):
+    "Unit tests for the resource serving flask_fedora_commons.blueprint"
+
+    def setUp(self):
+        "Setup's app with the blueprint and a stubbed Fedora connection"
+        import email.message
+        import io
+        application = Flask(__name__)
+        application.config['FEDORA_BLUEPRINT_URL_PREFIX'] = '/fedora'
+        self.repo = Repository(app=application)
+        self.fetches = []
+
+        def connect(fedora_url, method='GET', headers=None):
+            fedora_headers = email.message.Message()
+            fedora_headers['ETag'] = '"abc123"'
+            fedora_headers['Last-Modified'] = 'Mon, 06 Oct 2014 10:00:00 GMT'
+            if (headers or {}).get('If-None-Match') == '"abc123"':
+                raise urllib.error.HTTPError(
+                    fedora_url, 304, 'Not Modified', fedora_headers, None)
+            self.fetches.append(fedora_url)
+            response = io.BytesIO("""<{}>
+                <http://www.w3.org/2000/01/rdf-schema#label> "Blueprint Work" .
+                """.format(fedora_url).encode())
+            response.headers = fedora_headers
+            return response
+        self.repo.connect = connect
+        self.client = application.test_client()
+
+    def test_formats(self):
+        "Tests content negotiation and cache headers"
+        turtle = self.client.get('/fedora/test/1',
+                                 headers={'Accept': 'text/turtle'})
+        self.assertEqual('text/turtle', turtle.mimetype)
+        self.assertEqual('"abc123"', turtle.headers['ETag'])
+        self.assertIn('max-age', turtle.headers['Cache-Control'])
+        html = self.client.get('/fedora/test/1',
+                               headers={'Accept': 'text/html'})
+        self.assertIn(b'Blueprint Work', html.data)
+        json_ld = self.client.get('/fedora/test/1',
+                                  headers={'Accept': 'application/ld+json'})
+        self.assertIn('Blueprint Work', json_ld.get_data(as_text=True))
+
+    def test_not_modified(self):
+        "Tests a matching If-None-Match is answered with 304 without a body"
+        response = self.client.get('/fedora/test/1',
+                                   headers={'If-None-Match': '"abc123"'})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual('"abc123"', response.headers['ETag'])
+        self.assertEqual([], self.fetches)
+
+class TestRouter(unittest.TestCase):
+    "Unit tests for multi-node routing in flask_fedora_commons.routing"
+
+    def setUp(self):
+        "Creates a router over three nodes with health checks stubbed out"
+        self.nodes = ['http://fedora1:8080',
+                      'http://fedora2:8080',
+                      'http://fedora3:8080']
+        self.router = Router(self.nodes)
+        self.router.check = lambda endpoint: endpoint != self.nodes[1]
+
+    def test_reads_and_writes(self):
+        "Tests reads skip unhealthy replicas and writes use the primary"
+        uri = 'http://fedora1:8080/rest/test/1'
+        read_nodes = set(self.router.route(uri, 'GET')[0] for _ in range(6))
+        self.assertEqual(set([self.nodes[0], self.nodes[2]]), read_nodes)
+        self.assertEqual(
+            (self.nodes[0], uri),
+            self.router.route('http://fedora3:8080/rest/test/1', 'PATCH'))
+        self.assertEqual((None, 'http://example.org/1'),
+                         self.router.route('http://example.org/1', 'GET'))
+
+    def test_sharding(self):
+        "Tests sharded paths always route to the same owning node"
+        router = Router(self.nodes, shard=True)
+        owners = set()
+        for number in range(50):
+            uri = 'http://fedora1:8080/rest/test/{}'.format(number)
+            node, url = router.route(uri, 'GET')
+            self.assertEqual((node, url), router.route(uri, 'PUT'))
+            self.assertEqual(
+                node,
+                router.route(uri + '/fcr:metadata', 'PATCH')[0])
+            owners.add(node)
+        self.assertEqual(set(self.nodes), owners)
+
+    def test_read_your_writes(self):
+        "Tests reads of a recent write and its parent go to the primary"
+        uri = 'http://fedora3:8080/rest/test/1'
+        self.router.written(uri + '/fcr:metadata')
+        for read_uri in (uri, 'http://fedora1:8080/rest/test'):
+            read_nodes = set(self.router.route(read_uri, 'GET')[0]
+                             for _ in range(6))
+            self.assertEqual(set([self.nodes[0]]), read_nodes)
+        other = 'http://fedora1:8080/rest/other/1'
+        self.assertIn(
+            self.nodes[2],
+            [self.router.route(other, 'GET')[0] for _ in range(6)])
+        router = Router(self.nodes, read_your_writes=0)
+        router.check = self.router.check
+        router.written(uri)
+        self.assertIn(self.nodes[2],
+                      [router.route(uri, 'GET')[0] for _ in range(6)])
+
+    def test_read_failover(self):
+        "Tests a read failing on an unreachable replica retries elsewhere"
+        fedora = StandInFedora()
+        try:
+            repo = Repository(base_url=fedora.base_url)
+            work_uri = fedora.base_url + '/rest/test/work'
+            repo.insert(work_uri, 'schema:name', 'Failover')
+            router = Router([fedora.base_url, 'http://127.0.0.1:1'],
+                            read_your_writes=0)
+            router.check = lambda endpoint: True
+            for _ in range(4):
+                response = router.open(urllib.request.Request(work_uri))
+                self.assertEqual(200, response.status)
+        finally:
+            fedora.shutdown()
+
+    def test_destination(self):
+        "Tests COPY and MOVE destinations are rewritten and kept on a shard"
+        request = urllib.request.Request(
+            'http://fedora1:8080/rest/test/1',
+            method='MOVE',
+            headers={'Destination': 'http://fedora3:8080/rest/test/2'})
+        self.router.__destination__(request, self.nodes[0])
+        self.assertEqual('http://fedora1:8080/rest/test/2',
+                         request.get_header('Destination'))
+        router = Router(self.nodes, shard=True)
+        source = 'http://fedora1:8080/rest/test/1'
+        node = router.route(source, 'MOVE')[0]
+        for number in range(50):
+            destination = 'http://fedora1:8080/rest/test/{}/2'.format(
+                number)
+            request = urllib.request.Request(
+                source,
+                method='MOVE',
+                headers={'Destination': destination})
+            if router.route(destination, 'MOVE')[0] == node:
+                router.__destination__(request, node)
+            else:
+                self.assertRaises(ValueError,
+                                  router.__destination__,
+                                  request,
+                                  node)
+
+    def test_sharded_create(self):
+        "Tests objects created without a uri are read from the same node"
+        fedoras = [StandInFedora(), StandInFedora()]
+        try:
+            repo = Repository(base_url=[fedora.base_url
+                                        for fedora in fedoras],
+                              shard=True)
+            uris = []
+            for number in range(10):
+                graph = rdflib.Graph()
+                graph.add((rdflib.URIRef(''),
+                           rdflib.RDFS.label,
+                           rdflib.Literal("Work {}".format(number))))
+                uris.append(repo.create(graph=graph))
+            for number, uri in enumerate(uris):
+                self.assertTrue(uri.startswith(repo.base_url + '/rest/'))
+                self.assertEqual(
+                    "Work {}".format(number),
+                    str(repo.read(uri).value(rdflib.URIRef(uri),
+                                             rdflib.RDFS.label)))
+            self.assertEqual(
+                10,
+                sum(len(fedora.resources) for fedora in fedoras))
+        finally:
+            for fedora in fedoras:
+                fedora.shutdown()
+
+    def test_repository_primary(self):
+        "Tests a list of base urls uses the first as the canonical base url"
+        repo = Repository(base_url=self.nodes)
+        self.assertEqual(self.nodes[0], repo.base_url)
+        self.assertIsNotNone(repo.router)
+
+class TestCompression(unittest.TestCase):
+    "Unit tests for flask_fedora_commons.compression"
+
+    BODY = b"<http://example.org/1> <http://schema.org/name> \"One\" .\n" * 500
+
+    def __response__(self, data, encoding):
+        "Returns a file-like stand-in for a compressed HTTP response"
+        import email.message
+        import io
+        response = io.BytesIO(data)
+        response.headers = email.message.Message()
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def test_gzip_streaming(self):
+        "Tests gzip responses decode in small streamed reads"
+        import gzip
+        response = decode_response(
+            self.__response__(gzip.compress(self.BODY), 'gzip'))
+        chunks = []
+        chunk = response.read(100)
+        while chunk:
+            self.assertTrue(len(chunk) <= 100)
+            chunks.append(chunk)
+            chunk = response.read(100)
+        self.assertEqual(self.BODY, b''.join(chunks))
+
+    def test_deflate(self):
+        "Tests zlib wrapped and raw deflate responses"
+        import zlib
+        self.assertEqual(
+            self.BODY,
+            decode_response(self.__response__(
+                zlib.compress(self.BODY), 'deflate')).read())
+        raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        raw_body = raw.compress(self.BODY) + raw.flush()
+        response = decode_response(self.__response__(raw_body, 'deflate'))
+        self.assertEqual(self.BODY.splitlines(True)[0], response.readline())
+
+    def test_read_interface(self):
+        "Tests every read method and the headers return decoded data"
+        import gzip
+
+        def response():
+            raw = self.__response__(gzip.compress(self.BODY), 'gzip')
+            raw.headers['Content-Length'] = '100'
+            return decode_response(raw)
+        self.assertEqual(self.BODY.splitlines(True), response().readlines())
+        self.assertEqual(self.BODY.splitlines(True), list(response()))
+        decoded = response()
+        self.assertIsNone(decoded.headers.get('Content-Encoding'))
+        self.assertIsNone(decoded.getheader('Content-Length'))
+        self.assertTrue(self.BODY.startswith(decoded.peek()))
+        chunks = [decoded.read1()]
+        buffer = bytearray(100)
+        while True:
+            count = decoded.readinto(buffer)
+            if not count:
+                break
+            chunks.append(bytes(buffer[:count]))
+        self.assertEqual(self.BODY, b''.join(chunks))
+        with response() as decoded:
+            self.assertEqual(self.BODY[:10], decoded.readline(10))
+        self.assertTrue(decoded.closed)
+
+    def test_compress_request(self):
+        "Tests only large bodies of write requests are compressed"
+        import gzip
+        small = urllib.request.Request('http://localhost:8080/rest/1',
+                                       data=b'small',
+                                       method='PUT')
+        self.assertIsNone(compress_request(small, 1024))
+        large = urllib.request.Request('http://localhost:8080/rest/1',
+                                       data=self.BODY,
+                                       method='PUT')
+        self.assertEqual(self.BODY, compress_request(large, 1024))
+        self.assertEqual('gzip', large.get_header('Content-encoding'))
+        self.assertEqual(self.BODY, gzip.decompress(large.data))
+
+class TestFixity(unittest.TestCase):
+    "Unit tests for streaming fixity of binary uploads"
+
+    def setUp(self):
+        "Starts a stand-in Fedora"
+        self.fedora = StandInFedora()
+        self.repo = Repository(base_url=self.fedora.base_url)
+        self.content = os.urandom(200000)
+
+    def test_stream_upload(self):
+        "Tests digests are computed while streaming a file and verified"
+        import hashlib
+        import tempfile
+        with tempfile.TemporaryFile() as binary:
+            binary.write(self.content)
+            binary.seek(0)
+            result = self.repo.upload(
+                self.fedora.base_url + '/rest/test/binary',
+                binary)
+        self.assertTrue(result['verified'])
+        self.assertEqual(hashlib.sha256(self.content).hexdigest(),
+                         result['sha256'])
+        self.assertEqual(
+            [('PUT', '/rest/test/binary'),
+             ('GET', '/rest/test/binary/fcr:metadata')],
+            self.fedora.requests)
+
+    def test_digest_header(self):
+        "Tests a wrong known digest is rejected by Fedora on ingest"
+        self.assertRaises(
+            urllib.error.HTTPError,
+            self.repo.upload,
+            self.fedora.base_url + '/rest/test/binary',
+            self.content,
+            digests={'sha1': '0' * 40})
+
+    def test_mismatch(self):
+        "Tests a digest differing from Fedora's raises FixityError"
+        uri = self.repo.create(data=self.content)
+        self.assertRaises(FixityError,
+                          self.repo.verify_fixity,
+                          uri,
+                          {'sha1': '0' * 40})
+
+    def tearDown(self):
+        "Stops the stand-in Fedora"
+        self.fedora.shutdown()
+
+class TestThreadSafety(unittest.TestCase):
+    "Concurrency stress tests for a Repository shared between threads"
+
+    def setUp(self):
+        "Starts a stand-in Fedora"
+        self.fedora = StandInFedora()
+        self.repo = Repository(base_url=self.fedora.base_url,
+                               query_cache_ttl=60)
+
+    def test_session_per_thread(self):
+        "Tests each thread sees only its own transaction"
+        import threading
+        seen = {}
+
+        def worker(number):
+            self.repo.transaction = 'tx:{}'.format(number)
+            threading.Event().wait(0.01)
+            seen[number] = self.repo.transaction
+        threads = [threading.Thread(target=worker, args=(number,))
+                   for number in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            dict((number, 'tx:{}'.format(number)) for number in range(20)),
+            seen)
+        self.assertEqual([], self.repo.transaction)
+
+    def test_concurrent_crud(self):
+        "Tests concurrent create, replace, read and delete from many threads"
+        def worker(number):
+            uri = "{}/rest/test/{}".format(self.fedora.base_url, number)
+            graph = rdflib.Graph()
+            graph.add((rdflib.URIRef(uri),
+                       rdflib.RDFS.label,
+                       rdflib.Literal("Work {}".format(number))))
+            self.assertEqual(uri, self.repo.create(uri, graph))
+            self.assertTrue(self.repo.replace(uri,
+                                              'rdfs:label',
+                                              "Work {}".format(number),
+                                              "Stress {}".format(number)))
+            work = self.repo.read(uri)
+            self.assertEqual(
+                ["Stress {}".format(number)],
+                [str(label) for label in work.objects(
+                    subject=rdflib.URIRef(uri),
+                    predicate=rdflib.RDFS.label)])
+            self.assertTrue(self.repo.delete(uri))
+            return number
+        futures = [self.repo.executor.submit(worker, number)
+                   for number in range(64)]
+        self.assertEqual(list(range(64)),
+                         [future.result() for future in futures])
+        self.assertEqual({}, self.fedora.resources)
+
+    def tearDown(self):
+        "Stops the stand-in Fedora"
+        self.fedora.shutdown()
+
+class TestCopyMove(unittest.TestCase):
+    "Unit tests for server-side copy and move of resources"
+
+    def setUp(self):
+        "Starts a stand-in Fedora holding a small subtree"
+        self.fedora = StandInFedora()
+        self.repo = Repository(base_url=self.fedora.base_url)
+        self.base = self.fedora.base_url + '/rest/test'
+        for path in ('', '/child'):
+            graph = rdflib.Graph()
+            graph.add((rdflib.URIRef(self.base + path),
+                       rdflib.RDFS.label,
+                       rdflib.Literal("Resource{}".format(path))))
+            self.repo.create(self.base + path, graph)
+
+    def test_copy_and_move(self):
+        "Tests a subtree is copied then moved without reading it"
+        del self.fedora.requests[:]
+        self.assertTrue(self.repo.copy(self.base, self.base + '-copy'))
+        self.assertTrue(self.repo.move(self.base + '-copy',
+                                       self.base + '-moved'))
+        self.assertEqual(['COPY', 'MOVE'],
+                         [row[0] for row in self.fedora.requests])
+        self.assertTrue(self.repo.exists(self.base + '-moved/child'))
+        self.assertFalse(self.repo.exists(self.base + '-copy'))
+        self.assertFalse(self.repo.copy(self.base, self.base + '-moved'))
+
+    def test_copy_many(self):
+        "Tests bulk copies run concurrently and report each result"
+        pairs = [(self.base, "{}-{}".format(self.base, number))
+                 for number in range(8)]
+        self.assertEqual([True] * 8, self.repo.copy_many(pairs))
+        self.assertEqual(2 + 16, len(self.fedora.resources))
+
+    def tearDown(self):
+        "Stops the stand-in Fedora"
+        self.fedora.shutdown()
+
+class TestConditionalWrites(unittest.TestCase):
+    "Unit tests for create-if-absent and If-Match conditional writes"
+
+    def setUp(self):
+        "Starts a stand-in Fedora"
+        self.fedora = StandInFedora()
+        self.repo = Repository(base_url=self.fedora.base_url)
+        self.work_uri = self.fedora.base_url + '/rest/test/work'
+
+    def test_create_if_absent(self):
+        "Tests create-if-absent is one PUT and refuses an existing uri"
+        self.assertEqual(self.work_uri,
+                         self.repo.create(self.work_uri, if_absent=True))
+        self.assertIsNone(self.repo.create(self.work_uri, if_absent=True))
+        self.assertEqual([('PUT', '/rest/test/work')] * 2,
+                         self.fedora.requests)
+
+    def test_create_binary_if_absent(self):
+        "Tests create-if-absent of a binary keeps an existing body"
+        binary_uri = self.fedora.base_url + '/rest/test/binary'
+        self.assertEqual(binary_uri,
+                         self.repo.create(binary_uri, data=b'original'))
+        self.assertIsNone(self.repo.create(binary_uri,
+                                           data=b'REPLACED',
+                                           if_absent=True))
+        self.assertEqual(b'original',
+                         self.fedora.resources[binary_uri]['body'])
+
+    def test_insert_single_request(self):
+        "Tests insert into an existing entity is a single PATCH"
+        self.repo.create(self.work_uri, if_absent=True)
+        del self.fedora.requests[:]
+        self.assertTrue(self.repo.insert(self.work_uri,
+                                         'schema:name',
+                                         'One Request'))
+        self.assertEqual([('PATCH', '/rest/test/work')],
+                         self.fedora.requests)
+        self.assertEqual(
+            "One Request",
+            str(self.repo.read(self.work_uri).value(
+                subject=rdflib.URIRef(self.work_uri),
+                predicate=SCHEMA_ORG.name)))
+
+    def test_insert_binary_metadata(self):
+        "Tests insert into a binary falls back to its fcr:metadata"
+        binary_uri = self.fedora.base_url + '/rest/test/image'
+        self.repo.connect(binary_uri,
+                          data=b'binary',
+                          method='PUT',
+                          headers={'Content-Type': 'image/png'})
+        del self.fedora.requests[:]
+        self.assertTrue(self.repo.insert(binary_uri,
+                                         'schema:name',
+                                         'Image'))
+        self.assertEqual([('PATCH', '/rest/test/image'),
+                          ('PATCH', '/rest/test/image/fcr:metadata')],
+                         self.fedora.requests)
+
+    def test_insert_creates_missing(self):
+        "Tests insert creates a missing entity after a 404"
+        self.assertTrue(self.repo.insert(self.work_uri,
+                                         'schema:name',
+                                         'Created'))
+        self.assertEqual(['PATCH', 'PUT', 'PATCH'],
+                         [row[0] for row in self.fedora.requests])
+
+    def test_if_match(self):
+        "Tests a stale ETag raises PreconditionFailed"
+        self.repo.create(self.work_uri, if_absent=True)
+        etag = self.repo.etag(self.work_uri)
+        self.assertTrue(self.repo.insert(self.work_uri,
+                                         'schema:name',
+                                         'First',
+                                         etag=etag))
+        self.assertRaises(PreconditionFailed,
+                          self.repo.replace,
+                          self.work_uri,
+                          'schema:name',
+                          'First',
+                          'Second',
+                          etag=etag)
+
+    def tearDown(self):
+        "Stops the stand-in Fedora"
+        self.fedora.shutdown()
+
+class TestExists(unittest.TestCase):
+    "Unit tests for HEAD based existence checks and their cache"
+
+    def setUp(self):
+        "Starts a stand-in Fedora and a repository with an existence cache"
+        self.fedora = StandInFedora()
+        application = Flask(__name__)
+        application.config['FEDORA_BASE_URL'] = self.fedora.base_url
+        application.config['FEDORA_EXISTS_CACHE_TTL'] = 60
+        self.repo = Repository(app=application)
+        self.work_uri = self.fedora.base_url + '/rest/test/work'
+
+    def test_head_and_cache(self):
+        "Tests exists uses HEAD and is kept current by create and delete"
+        self.assertFalse(self.repo.exists(self.work_uri))
+        self.assertFalse(self.repo.exists(self.work_uri))
+        self.assertEqual([('HEAD', '/rest/test/work')], self.fedora.requests)
+        self.repo.create(self.work_uri, if_absent=True)
+        self.assertTrue(self.repo.exists(self.work_uri))
+        self.repo.delete(self.work_uri)
+        self.assertFalse(self.repo.exists(self.work_uri))
+        self.assertEqual(['HEAD', 'PUT', 'DELETE'],
+                         [row[0] for row in self.fedora.requests])
+
+    def test_exists_many(self):
+        "Tests a batch of existence checks"
+        self.repo.create(self.work_uri, if_absent=True)
+        missing = self.fedora.base_url + '/rest/test/missing'
+        self.assertEqual({self.work_uri: True, missing: False},
+                         self.repo.exists_many([self.work_uri, missing]))
+
+    def tearDown(self):
+        "Stops the stand-in Fedora"
+        self.fedora.shutdown()
+
+class TestFedoraResource(unittest.TestCase):
+    "Unit tests for the lazy-loading resource object model"
+
+    def setUp(self):
+        "Starts a stand-in Fedora with two works"
+        self.fedora = StandInFedora()
+        self.repo = Repository(base_url=self.fedora.base_url)
+        self.work_uri = self.fedora.base_url + '/rest/test/work'
+        self.other_uri = self.fedora.base_url + '/rest/test/other'
+        for uri in (self.work_uri, self.other_uri):
+            self.repo.create(uri, if_absent=True)
+            self.repo.insert(uri, 'schema:name', 'Old Name')
+        del self.fedora.requests[:]
+
+    def test_lazy_load(self):
+        "Tests properties are fetched on first access only"
+        work = self.repo.resource(self.work_uri)
+        self.assertIsInstance(work, FedoraResource)
+        self.assertFalse(work.loaded)
+        self.assertEqual([], self.fedora.requests)
+        self.assertEqual('Old Name', str(work['schema:name'][0]))
+        self.assertEqual('Old Name', str(work.value(str(SCHEMA_ORG.name))))
+        self.assertEqual([('GET', '/rest/test/work')], self.fedora.requests)
+
+    def test_load_read_cache(self):
+        "Tests loads share the repository's read cache and keep the ETag"
+        self.repo.read_cache = QueryCache(ttl=60)
+        first = self.repo.resource(self.work_uri).load()
+        second = self.repo.resource(self.work_uri).load()
+        self.assertEqual([('GET', '/rest/test/work')], self.fedora.requests)
+        self.assertIsNotNone(first.etag)
+        self.assertEqual(first.etag, second.etag)
+        second.set('schema:name', 'New Name')
+        self.assertTrue(second.save())
+
+    def test_prefetch(self):
+        "Tests a batch of resources is loaded up front"
+        works = self.repo.resources([self.work_uri, self.other_uri])
+        self.assertTrue(all(work.loaded for work in works))
+        self.assertEqual(['GET', 'GET'],
+                         [row[0] for row in self.fedora.requests])
+
+    def test_save(self):
+        "Tests dirty changes are saved in one conditional PATCH"
+        work = self.repo.resource(self.work_uri)
+        self.assertFalse(work.save())
+        work['schema:name'] = "New\nName's"
+        work.add('schema:about', 'http://example.org/topic')
+        work.add('schema:keywords', 'draft')
+        work.remove('schema:keywords', 'draft')
+        self.assertTrue(work.dirty)
+        self.assertTrue(work.save())
+        self.assertFalse(work.dirty)
+        self.assertEqual([('GET', '/rest/test/work'),
+                          ('PATCH', '/rest/test/work')],
+                         self.fedora.requests)
+        self.assertEqual(["New\nName's"],
+                         [str(name) for name in work['schema:name']])
+        graph = self.repo.read(self.work_uri)
+        subject = rdflib.URIRef(self.work_uri)
+        self.assertEqual("New\nName's",
+                         str(graph.value(subject, SCHEMA_ORG.name)))
+        self.assertEqual(rdflib.URIRef('http://example.org/topic'),
+                         graph.value(subject, SCHEMA_ORG.about))
+        self.assertIsNone(graph.value(subject, SCHEMA_ORG.keywords))
+
+    def test_stale_save(self):
+        "Tests saving over a concurrent change raises PreconditionFailed"
+        work = self.repo.resource(self.work_uri)
+        work['schema:name'] = 'Mine'
+        self.repo.insert(self.work_uri, 'schema:name', 'Theirs')
+        self.assertRaises(PreconditionFailed, work.save)
+
+    def tearDown(self):
+        "Stops the stand-in Fedora"
+        self.fedora.shutdown()
+
+class TestCli(unittest.TestCase):
+    "Unit tests for the flask fedora command group and read cache"
+
+    def setUp(self):
+        "Starts a stand-in Fedora with a container of two works"
+        self.fedora = StandInFedora()
+        self.app = Flask(__name__)
+        self.app.config['FEDORA_BASE_URL'] = self.fedora.base_url
+        self.app.config['FEDORA_EXISTS_CACHE_TTL'] = 60
+        self.app.config['FEDORA_READ_CACHE_TTL'] = 60
+        self.repo = Repository(app=self.app)
+        self.root_uri = self.fedora.base_url + '/rest/test'
+        root = rdflib.Graph()
+        for number in range(2):
+            work_uri = "{}/work{}".format(self.root_uri, number)
+            work = rdflib.Graph()
+            work.add((rdflib.URIRef(work_uri),
+                      rdflib.RDFS.label,
+                      rdflib.Literal("Work {}".format(number))))
+            self.repo.create(work_uri, work, if_absent=True)
+            root.add((rdflib.URIRef(self.root_uri),
+                      rdflib.URIRef('http://www.w3.org/ns/ldp#contains'),
+                      rdflib.URIRef(work_uri)))
+        self.repo.create(self.root_uri, root, if_absent=True)
+        self.repo = Repository(app=self.app)
+        self.runner = self.app.test_cli_runner()
+        del self.fedora.requests[:]
+
+    def test_warm(self):
+        "Tests warm crawls once and later reads and dedups are cached"
+        result = self.runner.invoke(args=['fedora', 'warm', self.root_uri])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn("3 resources warmed", result.output)
+        self.assertIn("2 identifiers indexed", result.output)
+        self.assertEqual(3, len(self.fedora.requests))
+        graph = self.repo.read(self.root_uri + '/work1')
+        self.assertTrue(self.repo.exists(self.root_uri + '/work0'))
+        duplicate = rdflib.Graph()
+        duplicate.add((rdflib.URIRef(self.root_uri + '/copy'),
+                       rdflib.RDFS.label,
+                       rdflib.Literal("Work 1")))
+        self.assertIsNone(self.repo.create(self.root_uri + '/copy',
+                                           duplicate))
+        self.assertEqual(3, len(self.fedora.requests))
+        self.assertEqual("Work 1", str(graph.value(
+            rdflib.URIRef(self.root_uri + '/work1'),
+            rdflib.RDFS.label)))
+
+    def test_identifier_index_after_replace(self):
+        "Tests a replaced label no longer dedups a new resource"
+        self.runner.invoke(args=['fedora', 'warm', self.root_uri])
+        work_uri = self.root_uri + '/work0'
+        self.assertTrue(self.repo.replace(work_uri,
+                                          'rdfs:label',
+                                          'Work 0',
+                                          'Renamed'))
+        new_uri = self.root_uri + '/new'
+        graph = rdflib.Graph()
+        graph.add((rdflib.URIRef(new_uri),
+                   rdflib.RDFS.label,
+                   rdflib.Literal("Work 0")))
+        self.assertEqual(new_uri, self.repo.create(new_uri, graph))
+        self.assertTrue(self.repo.exists(new_uri))
+
+    def test_identifier_index_confirmed(self):
+        "Tests a stale index entry is checked against the resource"
+        work_uri = self.root_uri + '/work1'
+        self.repo.id_index.add(rdflib.RDFS.label, "Elsewhere", work_uri)
+        new_uri = self.root_uri + '/elsewhere'
+        graph = rdflib.Graph()
+        graph.add((rdflib.URIRef(new_uri),
+                   rdflib.RDFS.label,
+                   rdflib.Literal("Elsewhere")))
+        self.assertEqual(new_uri, self.repo.create(new_uri, graph))
+
+    def test_read_cache_invalidation(self):
+        "Tests writes through the repository drop cached reads"
+        work_uri = self.root_uri + '/work0'
+        self.repo.read(work_uri)
+        self.repo.insert(work_uri, 'schema:name', 'Changed')
+        self.assertEqual("Changed", str(self.repo.read(work_uri).value(
+            rdflib.URIRef(work_uri),
+            SCHEMA_ORG.name)))
+        self.repo.delete(self.root_uri)
+        self.assertEqual(0, len(self.repo.read_cache))
+
+    def test_load(self):
+        "Tests bulk load reports created objects"
+        dump_path = os.path.join(os.path.dirname(__file__), 'cli-load.nt')
+        with open(dump_path, 'w') as dump:
+            for number in range(3):
+                dump.write('<{}/loaded{}> <http://schema.org/name> '
+                           '"Loaded" .\n'.format(self.root_uri, number))
+        try:
+            result = self.runner.invoke(args=['fedora', 'load', dump_path])
+        finally:
+            os.remove(dump_path)
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn("3 created", result.output)
+
+    def test_probe(self):
+        "Tests the latency probe"
+        result = self.runner.invoke(
+            args=['fedora', 'probe', '--count', '3', '--path', 'rest/test'])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn("3 requests", result.output)
+        self.assertEqual([('HEAD', '/rest/test')] * 3, self.fedora.requests)
+
+    def tearDown(self):
+        "Stops the stand-in Fedora"
+        self.fedora.shutdown()
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    "Unit tests for AIMD adaptive concurrency"
+
+    def test_additive_increase(self):
+        "Tests healthy responses add slots only while the limit is in use"
+        limiter = AdaptiveLimiter(initial=4, maximum=5)
+        for _ in range(2000):
+            limiter.release(limiter.acquire())
+        self.assertEqual(4, limiter.stats()['limit'])
+        for _ in range(3):
+            started = [limiter.acquire() for _ in range(4)]
+            for start in started:
+                limiter.release(start)
+        self.assertEqual(5, limiter.stats()['limit'])
+        for _ in range(5):
+            started = [limiter.acquire() for _ in range(5)]
+            for start in started:
+                limiter.release(start)
+        self.assertEqual(5, limiter.stats()['limit'])
+
+    def test_multiplicative_decrease(self):
+        "Tests a burst of overload errors halves the limit once"
+        limiter = AdaptiveLimiter(initial=8)
+        started = [limiter.acquire() for _ in range(4)]
+        for start in started:
+            limiter.release(start, overloaded=True)
+        stats = limiter.stats()
+        self.assertEqual(4, stats['limit'])
+        self.assertEqual(1, stats['decreases'])
+        self.assertEqual(4, stats['failures'])
+        self.assertEqual(0, stats['in_flight'])
+
+    def test_queue_depth(self):
+        "Tests callers wait for a slot and are counted as queued"
+        import threading
+        limiter = AdaptiveLimiter(initial=1)
+        started = limiter.acquire()
+        waiter = threading.Thread(
+            target=lambda: limiter.release(limiter.acquire()))
+        waiter.start()
+        while limiter.stats()['queued'] == 0:
+            threading.Event().wait(0.01)
+        self.assertEqual(1, limiter.stats()['in_flight'])
+        limiter.release(started)
+        waiter.join(5)
+        self.assertEqual(0, limiter.stats()['queued'])
+
+    def test_repository_overload(self):
+        "Tests repository requests go through the limiter"
+        fedora = StandInFedora()
+        try:
+            repo = Repository(base_url=fedora.base_url)
+            repo.enable_adaptive_concurrency(initial=4)
+            repo.exists_many([fedora.base_url + '/rest/test/missing'] * 8)
+            self.assertEqual(8, repo.concurrency_stats()['successes'])
+            repo.limiter.call(lambda: None)
+            self.assertRaises(
+                urllib.error.HTTPError,
+                repo.limiter.call,
+                urllib.request.urlopen,
+                urllib.request.Request(fedora.base_url + '/rest',
+                                       method='OPTIONS'))
+            self.assertEqual(0, repo.concurrency_stats()['failures'])
+        finally:
+            fedora.shutdown()
+
+class TestSingleFlight(unittest.TestCase):
+    "Unit tests for coalescing concurrent identical reads"
+
+    def setUp(self):
+        "Starts a stand-in Fedora that answers GET requests slowly"
+        import threading
+        self.fedora = StandInFedora()
+        self.repo = Repository(base_url=self.fedora.base_url)
+        self.work_uri = self.fedora.base_url + '/rest/test/work'
+        self.repo.insert(self.work_uri, 'schema:name', 'Popular')
+        handle = self.fedora.handle
+
+        def slow_handle(method, path, headers, body):
+            if method == 'GET':
+                threading.Event().wait(0.3)
+            return handle(method, path, headers, body)
+        self.fedora.handle = slow_handle
+        del self.fedora.requests[:]
+
+    def __concurrently__(self, function, *args):
+        "Calls function from eight threads at once, returning the outcomes"
+        import threading
+        outcomes = []
+
+        def worker():
+            try:
+                outcomes.append(function(*args))
+            except Exception as error:
+                outcomes.append(error)
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_read(self):
+        "Tests concurrent reads share one GET but not one graph"
+        graphs = self.__concurrently__(self.repo.read, self.work_uri)
+        self.assertEqual([('GET', '/rest/test/work')], self.fedora.requests)
+        self.assertEqual(8, len(set(id(graph) for graph in graphs)))
+        for graph in graphs:
+            self.assertTrue(rdflib.compare.isomorphic(graphs[0], graph))
+
+    def test_as_json(self):
+        "Tests concurrent as_json calls share one HEAD and GET"
+        outputs = self.__concurrently__(self.repo.as_json, self.work_uri)
+        self.assertEqual(['HEAD', 'GET'],
+                         [row[0] for row in self.fedora.requests])
+        self.assertEqual(1, len(set(outputs)))
+        self.assertIn("Popular", outputs[0])
+
+    def test_failure(self):
+        "Tests every waiter receives the shared failure"
+        outcomes = self.__concurrently__(
+            self.repo.read,
+            self.fedora.base_url + '/rest/test/missing')
+        self.assertEqual(1, len(self.fedora.requests))
+        for outcome in outcomes:
+            self.assertIsInstance(outcome, urllib.error.HTTPError)
+
+    def tearDown(self):
+        "Stops the stand-in Fedora"
+        self.fedora.shutdown()
+
+class TestDiskCache(unittest.TestCase):
+    "Unit tests for the persistent disk tier of read()"
+
+    def setUp(self):
+        "Starts a stand-in Fedora and makes a cache directory"
+        import tempfile
+        self.path = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.path, 'graphs.sqlite')
+        self.fedora = StandInFedora()
+        self.codes = []
+        handle = self.fedora.handle
+
+        def recording_handle(method, path, headers, body):
+            code, body, headers = handle(method, path, headers, body)
+            self.codes.append(code)
+            return code, body, headers
+        self.fedora.handle = recording_handle
+        self.work_uri = self.fedora.base_url + '/rest/test/work'
+
+    def __repository__(self):
+        "Returns a repository with the shared disk cache"
+        repo = Repository(base_url=self.fedora.base_url)
+        repo.enable_disk_cache(self.cache_path)
+        return repo
+
+    def test_revalidation(self):
+        "Tests a restarted repository revalidates cached graphs"
+        first = self.__repository__()
+        first.insert(self.work_uri, 'schema:name', 'Cached')
+        expected = first.read(self.work_uri)
+        del self.codes[:]
+        restarted = self.__repository__()
+        self.assertTrue(rdflib.compare.isomorphic(
+            expected,
+            restarted.read(self.work_uri)))
+        self.assertEqual([304], self.codes)
+        self.assertEqual(1, restarted.disk_cache.stats()['hits'])
+        first.replace(self.work_uri, 'schema:name', 'Cached', 'Changed')
+        self.assertEqual("Changed", str(restarted.read(self.work_uri).value(
+            rdflib.URIRef(self.work_uri),
+            SCHEMA_ORG.name)))
+
+    def test_lru_eviction(self):
+        "Tests least recently used graphs are evicted over the size cap"
+        import zlib
+        body = bytes(range(40))
+        size = len(zlib.compress(body))
+        cache = DiskGraphCache(self.cache_path,
+                               max_bytes=size * 2,
+                               touch_interval=0)
+        cache.set('http://example.org/1', '"1"', body)
+        cache.set('http://example.org/2', '"2"', body)
+        self.assertEqual(('"1"', body), cache.get('http://example.org/1'))
+        cache.set('http://example.org/3', '"3"', body)
+        self.assertIsNone(cache.get('http://example.org/2'))
+        self.assertIsNotNone(cache.get('http://example.org/1'))
+        self.assertEqual(size * 2, cache.stats()['bytes'])
+        cache.discard('http://example.org', tree=True)
+        self.assertEqual({'bytes': 0, 'entries': 0},
+                         dict((key, value) for key, value
+                              in cache.stats().items()
+                              if key in ('bytes', 'entries')))
+
+    def tearDown(self):
+        "Stops the stand-in Fedora and removes the cache"
+        import shutil
+        self.fedora.shutdown()
+        shutil.rmtree(self.path)
+
+class TestSearchPages(unittest.TestCase):
+    "Unit tests for paginated, lazily streamed search results"
+
+    def setUp(self):
+        "Starts a stand-in Fedora with 45 search hits in reverse order"
+        self.fedora = StandInFedora()
+        self.repo = Repository(base_url=self.fedora.base_url)
+        handle = self.fedora.handle
+
+        def search_handle(method, path, headers, body):
+            if 'fcr:search' not in path:
+                return handle(method, path, headers, body)
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)
+            offset = int(query['offset'][0])
+            limit = int(query['limit'][0])
+            lines = []
+            for number in range(offset, min(offset + limit, 45)):
+                lines.append(
+                    "<{0}{1}> <http://sindice.com/vocab/search#result> "
+                    "<{2}/rest/hit{3:02d}> .".format(
+                        self.fedora.base_url, path, self.fedora.base_url,
+                        44 - number))
+            return 200, "\n".join(lines).encode(), {
+                'Content-Type': 'text/turtle'}
+        self.fedora.handle = search_handle
+
+    def test_cached_page_copy(self):
+        "Tests cached search results are a separate copy for each caller"
+        repo = Repository(base_url=self.fedora.base_url, query_cache_ttl=60)
+        first = repo.search_page('work', 0, 5)
+        junk = (rdflib.URIRef('http://example.org/junk'),
+                SCHEMA_ORG.name,
+                rdflib.Literal('Junk'))
+        first.add(junk)
+        second = repo.search_page('work', 0, 5)
+        self.assertIsNot(first, second)
+        self.assertNotIn(junk, second)
+        self.assertEqual(5, len(repo.__search_hits__(second)))
+        self.assertEqual(1, len([row for row in self.fedora.requests
+                                 if 'fcr:search' in row[1]]))
+
+    def test_all_pages(self):
+        "Tests every hit is yielded in order across pages"
+        hits = [str(hit) for hit in self.repo.iter_search('work')]
+        self.assertEqual(45, len(hits))
+        self.assertEqual(self.fedora.base_url + '/rest/hit00', hits[-1])
+        self.assertEqual(hits, sorted(hits, reverse=True))
+        self.assertEqual(3, len(self.fedora.requests))
+
+    def test_early_termination(self):
+        "Tests taking the first hits never requests later pages"
+        import itertools
+        hits = list(itertools.islice(
+            self.repo.iter_search('work', page_size=10), 3))
+        self.assertEqual(self.fedora.base_url + '/rest/hit42', str(hits[2]))
+        self.repo.executor.shutdown(wait=True)
+        offsets = sorted(
+            urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)[
+                'offset'][0] for method, path in self.fedora.requests)
+        # The prefetched second page may have been cancelled before it ran
+        self.assertIn(offsets, (['0'], ['0', '10']))
+
+    def tearDown(self):
+        "Stops the stand-in Fedora"
+        self.fedora.shutdown()
+
+class TestOutbox(unittest.TestCase):
+    "Unit tests for the change-event outbox"
+
+    def test_repository_events(self):
+        "Tests each write emits an event with its triple delta and ETag"
+        fedora = StandInFedora()
+        try:
+            events = []
+            repo = Repository(base_url=fedora.base_url)
+            repo.enable_outbox([CallbackSink(events.extend)],
+                               flush_interval=0.05)
+            work_uri = fedora.base_url + '/rest/test/work'
+            graph = rdflib.Graph()
+            graph.add((rdflib.URIRef(work_uri),
+                       rdflib.RDFS.label,
+                       rdflib.Literal("Work")))
+            repo.create(work_uri, graph, if_absent=True)
+            repo.insert(work_uri, 'schema:name', 'First')
+            repo.replace(work_uri, 'schema:name', 'First', 'Second')
+            repo.remove(work_uri, 'schema:name', 'Second')
+            repo.copy(work_uri, work_uri + '-copy')
+            repo.move(work_uri + '-copy', work_uri + '-moved')
+            repo.delete(work_uri)
+            repo.drain()
+            self.assertEqual(['create', 'insert', 'replace', 'remove',
+                              'copy', 'move', 'delete'],
+                             [event['type'] for event in events])
+            self.assertEqual(
+                [['<{}>'.format(work_uri),
+                  '<http://www.w3.org/2000/01/rdf-schema#label>',
+                  '"Work"']],
+                events[0]['added'])
+            self.assertEqual(
+                [['<{}>'.format(work_uri),
+                  '<http://schema.org/name>',
+                  '"Second"']],
+                events[2]['added'])
+            self.assertEqual('"First"', events[2]['removed'][0][2])
+            self.assertTrue(events[1]['etag'])
+            self.assertEqual(work_uri + '-moved', events[5]['destination'])
+        finally:
+            fedora.shutdown()
+
+    def test_batches_and_retry(self):
+        "Tests batching, file and queue sinks and retry of a failing sink"
+        import queue
+        import tempfile
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        batches, attempts = [], []
+
+        def flaky(events):
+            attempts.append(len(events))
+            if len(attempts) < 3:
+                raise IOError("indexer unavailable")
+            batches.append(events)
+        received = queue.Queue()
+        outbox = Outbox([CallbackSink(flaky), FileSink(path),
+                         QueueSink(received)],
+                        batch_size=2,
+                        flush_interval=0.05,
+                        retry_delay=0.01)
+        try:
+            for number in range(3):
+                outbox.emit(change_event('delete',
+                                         'http://example.org/{}'.format(
+                                             number)))
+            outbox.flush()
+            self.assertEqual([2, 1], [len(batch) for batch in batches])
+            self.assertEqual(2, outbox.stats()['failures'])
+            self.assertEqual(3, received.qsize())
+            with open(path) as events_file:
+                self.assertEqual(
+                    ['http://example.org/0', 'http://example.org/1',
+                     'http://example.org/2'],
+                    [json.loads(line)['uri'] for line in events_file])
+        finally:
+            outbox.close()
+            os.remove(path)
+
+class TestTemplateHelpers(unittest.TestCase):
+    "Unit tests for the batched fedora_label and fedora_value helpers"
+
+    def setUp(self):
+        "Starts a stand-in Fedora with linked works and an app using it"
+        from flask import render_template_string
+        self.fedora = StandInFedora()
+        self.app = Flask(__name__)
+        self.app.config['FEDORA_BASE_URL'] = self.fedora.base_url
+        self.app.config['FEDORA_TEMPLATE_HELPERS'] = True
+        self.repo = Repository(app=self.app)
+        self.uris = []
+        for number in range(3):
+            uri = "{}/rest/test/work{}".format(self.fedora.base_url, number)
+            self.repo.insert(uri, 'rdfs:label', 'Work <{}>'.format(number))
+            self.uris.append(uri)
+        self.repo.insert(self.uris[0], 'schema:genre', 'Poetry')
+        template = """<ul>{% for uri in uris %}
+            <li>{{ uri|fedora_label }}</li>{% endfor %}
+            <li>{{ uris[0]|fedora_label }}</li>
+            <li>{{ fedora_value(uris[0], 'schema:genre') }}</li>
+            <li>{{ missing|fedora_label('Unknown') }}</li></ul>"""
+
+        @self.app.route('/works')
+        def works():
+            return render_template_string(
+                template,
+                uris=self.uris,
+                missing=self.fedora.base_url + '/rest/test/missing')
+        self.client = self.app.test_client()
+        del self.fedora.requests[:]
+
+    def test_batch(self):
+        "Tests each referenced resource is fetched once per render"
+        html = self.client.get('/works').get_data(as_text=True)
+        self.assertIn('<li>Work &lt;1&gt;</li>', html)
+        self.assertEqual(2, html.count('<li>Work &lt;0&gt;</li>'))
+        self.assertIn('<li>Poetry</li>', html)
+        self.assertIn('<li>Unknown</li>', html)
+        self.assertNotIn('fedora:', html)
+        self.assertEqual(4, len(self.fedora.requests))
+
+    def test_fragment_cache(self):
+        "Tests unchanged resources are revalidated rather than refetched"
+        self.client.get('/works')
+        codes = []
+        handle = self.fedora.handle
+
+        def recording_handle(method, path, headers, body):
+            code, body, headers = handle(method, path, headers, body)
+            codes.append(code)
+            return code, body, headers
+        self.fedora.handle = recording_handle
+        self.repo.replace(self.uris[1], 'rdfs:label', 'Work <1>', 'Renamed')
+        html = self.client.get('/works').get_data(as_text=True)
+        self.assertIn('Renamed', html)
+        self.assertEqual([200, 204, 304, 304, 404], sorted(codes))
+
+    def test_opt_in(self):
+        "Tests apps get no helpers unless FEDORA_TEMPLATE_HELPERS is set"
+        app = Flask(__name__)
+        app.config['FEDORA_BASE_URL'] = self.fedora.base_url
+        repo = Repository(app=app)
+        self.assertIsNone(repo.template_helpers)
+        self.assertNotIn('fedora_label', app.jinja_env.filters)
+
+    def test_binary_and_chained(self):
+        "Tests unparsable resources fall back and defer=False chains"
+        from flask import render_template_string
+        binary_uri = self.fedora.base_url + '/rest/test/image'
+        self.repo.connect(binary_uri,
+                          data=b'\x89PNG\x00binary',
+                          method='PUT',
+                          headers={'Content-Type': 'image/png'})
+        with self.app.test_request_context('/'):
+            html = render_template_string(
+                "{{ binary|fedora_label('Image') }} "
+                "{{ uri|fedora_label(defer=False)|upper }}",
+                binary=binary_uri,
+                uri=self.uris[2])
+            response = self.app.make_response(html)
+            self.app.process_response(response)
+        self.assertEqual('Image WORK &lt;2&gt;',
+                         response.get_data(as_text=True))
+
+    def tearDown(self):
+        "Stops the stand-in Fedora"
+        self.fedora.shutdown()
+
+class TestSparqlBuilder(unittest.TestCase):
+    "Unit tests for the compiled SPARQL statement builder"
+
+    def setUp(self):
+        "Starts a stand-in Fedora with a work"
+        self.fedora = StandInFedora()
+        self.repo = Repository(base_url=self.fedora.base_url)
+        self.work_uri = self.fedora.base_url + '/rest/test/work'
+        self.repo.create(self.work_uri, if_absent=True)
+
+    def test_escape_literal(self):
+        "Tests quotes, backslashes and line breaks are escaped"
+        from flask_fedora_commons.sparql import escape_literal, term
+        self.assertEqual('plain text', escape_literal('plain text'))
+        self.assertEqual('Old \\"Name\\"\\nLine \\\\ two',
+                         escape_literal('Old "Name"\nLine \\ two'))
+        self.assertEqual('<http://example.org/a%20b%3E>',
+                         term('http://example.org/a b>'))
+
+    def test_prologue_cached(self):
+        "Tests prologues match build_prefixes and are built once per set"
+        from flask_fedora_commons.sparql import prologue
+        namespaces = [('bf', 'http://bibframe.org/vocab/'),
+                      ('schema', 'http://schema.org/')]
+        self.assertEqual(build_prefixes(namespaces), prologue(namespaces))
+        self.assertIs(prologue(namespaces), prologue(list(namespaces)))
+
+    def test_batch_insert(self):
+        "Tests many statements render under one prologue"
+        from flask_fedora_commons.sparql import insert_data
+        sparql = insert_data(
+            [('schema', 'http://schema.org/')],
+            [(self.work_uri, 'schema:name', 'Work {}'.format(number))
+             for number in range(1000)])
+        self.assertEqual(1, sparql.count('PREFIX'))
+        self.assertEqual(1000, sparql.count('schema:name'))
+
+    def test_special_characters_round_trip(self):
+        "Tests values with quotes and newlines are written unchanged"
+        value = 'Old "Name"\nwith a \\ backslash'
+        self.assertTrue(self.repo.insert(self.work_uri, 'schema:name', value))
+        graph = self.repo.read(self.work_uri)
+        self.assertEqual(
+            [value],
+            [str(name) for name in graph.objects(predicate=SCHEMA_ORG.name)])
+        self.assertTrue(self.repo.replace(self.work_uri,
+                                          'schema:name',
+                                          value,
+                                          'New "Name"'))
+        self.assertTrue(self.repo.remove(self.work_uri,
+                                         'schema:name',
+                                         'New "Name"'))
+        self.assertEqual(
+            [],
+            list(self.repo.read(self.work_uri).objects(
+                predicate=SCHEMA_ORG.name)))
+
+    def tearDown(self):
+        "Stops the stand-in Fedora"
+        self.fedora.shutdown()
+
 class TestFlaskExtension(unittest.TestCase):
     "Unit tests for use of Repository as a Flask extension"
 